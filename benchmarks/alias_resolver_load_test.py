@@ -0,0 +1,140 @@
+"""
+alias_resolver_load_test.py
+
+Load test of the agent alias resolution of the invoke lambda: counts the
+ListAgentAliases calls made for concurrent requests, resolving the alias on
+every request as before, and with the TTL-cached AgentAliasResolver.
+
+The bedrock-agent client is stubbed: it returns the aliases in pages of
+--page-size, after --api-latency seconds, so the test needs no AWS access.
+Control-plane calls should drop from one lookup per request to one lookup per
+TTL window.
+
+Run from the repository root:
+
+    python benchmarks/alias_resolver_load_test.py --duration 10 --ttl 2
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+INVOKE_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "invoke-lambda"
+)
+sys.path.insert(0, INVOKE_LAMBDA_DIR)
+
+from alias_resolver import (  # noqa: E402
+    AgentAliasResolver,
+    get_highest_agent_version_alias_id,
+    list_agent_aliases,
+)
+
+
+class StubAgentClient:
+    """bedrock-agent client stub paginating a fixed list of aliases."""
+
+    def __init__(self, aliases, page_size, latency):
+        self.summaries = [
+            {
+                "agentAliasId": f"ALIAS{version:04d}",
+                "routingConfiguration": [{"agentVersion": str(version)}],
+            }
+            for version in range(1, aliases + 1)
+        ]
+        self.page_size = page_size
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def list_agent_aliases(self, agentId, maxResults=None, nextToken=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        start = int(nextToken or 0)
+        end = start + min(maxResults or self.page_size, self.page_size)
+        response = {"agentAliasSummaries": self.summaries[start:end]}
+        if end < len(self.summaries):
+            response["nextToken"] = str(end)
+        return response
+
+
+def run(resolve, threads, duration, think_time):
+    """Resolves the alias from concurrent workers, returns the latencies."""
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            alias_id = resolve()
+            elapsed = time.perf_counter() - start
+            assert alias_id is not None
+            with lock:
+                latencies.append(elapsed * 1000)
+            time.sleep(think_time)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--think-time", type=float, default=0.01)
+    parser.add_argument("--ttl", type=float, default=2)
+    parser.add_argument("--refresh-margin", type=float, default=0.5)
+    parser.add_argument("--aliases", type=int, default=25)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    pages = -(-args.aliases // args.page_size)
+    windows = args.duration / args.ttl
+    print(
+        f"{args.threads} threads for {args.duration:.0f}s, {args.aliases} aliases "
+        f"in {pages} pages, TTL {args.ttl}s (~{windows:.0f} windows)"
+    )
+    print(
+        f"{'resolution':<10} {'requests':>9} {'lookups':>8} {'API calls':>10} "
+        f"{'lookups/req':>12} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+
+    client = StubAgentClient(args.aliases, args.page_size, args.api_latency)
+
+    def per_request():
+        return get_highest_agent_version_alias_id(
+            list_agent_aliases(client, "AGENT", page_size=args.page_size)
+        )
+
+    resolver = AgentAliasResolver(
+        None, ttl=args.ttl, refresh_margin=args.refresh_margin
+    )
+    for name, resolve in [
+        ("per call", per_request),
+        ("cached", lambda: resolver.resolve("AGENT")),
+    ]:
+        client.calls = 0
+        resolver.agent_client = client
+        latencies = run(resolve, args.threads, args.duration, args.think_time)
+        lookups = client.calls / pages
+        print(
+            f"{name:<10} {len(latencies):>9} {lookups:>8.0f} {client.calls:>10} "
+            f"{lookups / len(latencies):>12.4f} "
+            f"{statistics.median(latencies):>8.2f} "
+            f"{statistics.quantiles(latencies, n=100)[98]:>8.2f}"
+        )
+    print(f"resolver stats: {resolver.stats()}")
+
+
+if __name__ == "__main__":
+    main()
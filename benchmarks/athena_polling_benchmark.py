@@ -0,0 +1,126 @@
+"""
+athena_polling_benchmark.py
+
+Measures the polling overhead of Athena query executions against a stubbed
+Athena API, with PyAthena's fixed interval and with the adaptive polling of
+the action lambda.
+
+The stub answers GetQueryExecution with RUNNING until the simulated query
+duration elapsed, on a simulated clock advanced by the sleeps and by the API
+latency of every call, so the benchmark runs instantly and needs no AWS
+access. The overhead is the time between the end of the query and the poll
+seeing it, plus the latency of the polls.
+
+Run from the repository root with the action lambda requirements installed:
+
+    python benchmarks/athena_polling_benchmark.py --api-latency 0.02
+"""
+
+import argparse
+import itertools
+import os
+import statistics
+import sys
+from types import SimpleNamespace
+
+ACTION_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "action-lambda"
+)
+sys.path.insert(0, ACTION_LAMBDA_DIR)
+
+from athena_execution import poll_delays, wait_for_query  # noqa: E402
+
+# Simulated query durations in seconds, e.g. reused results, small scans and
+# larger scans
+QUERY_DURATIONS = [0.15, 0.3, 0.6, 0.9, 1.2, 1.8, 2.5, 4.0, 7.0]
+
+
+class SimulatedClock:
+    """Clock advanced by the sleeps and API calls of the benchmark."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class StubAthenaClient:
+    """
+    Athena API stub whose queries succeed after a simulated duration.
+
+    Args:
+        clock (SimulatedClock): Simulated clock.
+        api_latency (float): Latency of every API call in seconds.
+    """
+
+    def __init__(self, clock, api_latency):
+        self.clock = clock
+        self.api_latency = api_latency
+        self.queries = {}
+        self.calls = 0
+
+    def start_query_execution(self, duration):
+        self.clock.sleep(self.api_latency)
+        query_id = f"query-{len(self.queries)}"
+        self.queries[query_id] = self.clock.now + duration
+        return query_id
+
+    def get_query_execution(self, query_id):
+        self.calls += 1
+        self.clock.sleep(self.api_latency)
+        done = self.clock.now >= self.queries[query_id]
+        return SimpleNamespace(state="SUCCEEDED" if done else "RUNNING")
+
+
+def run(delays_fn, api_latency):
+    """
+    Runs every simulated query with a polling strategy.
+
+    Returns:
+        tuple: (overheads in milliseconds, GetQueryExecution calls per query).
+    """
+    overheads, calls = [], []
+    for duration in QUERY_DURATIONS:
+        clock = SimulatedClock()
+        client = StubAthenaClient(clock, api_latency)
+        query_id = client.start_query_execution(duration)
+        started = clock.now
+        wait_for_query(
+            client.get_query_execution, query_id, delays_fn(), sleep=clock.sleep
+        )
+        overheads.append((clock.now - started - duration) * 1000)
+        calls.append(client.calls)
+    return overheads, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    parser.add_argument("--fixed-interval", type=float, default=1.0)
+    parser.add_argument("--initial-delay", type=float, default=0.1)
+    parser.add_argument("--max-delay", type=float, default=0.5)
+    parser.add_argument("--backoff", type=float, default=1.5)
+    args = parser.parse_args()
+
+    strategies = {
+        "fixed": lambda: itertools.repeat(args.fixed_interval),
+        "adaptive": lambda: poll_delays(
+            args.initial_delay, args.max_delay, args.backoff
+        ),
+    }
+    print(
+        f"{'strategy':<9} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9} "
+        f"{'polls/query':>12}"
+    )
+    for name, delays_fn in strategies.items():
+        overheads, calls = run(delays_fn, args.api_latency)
+        print(
+            f"{name:<9} {statistics.mean(overheads):>9.1f} "
+            f"{statistics.median(overheads):>9.1f} {max(overheads):>9.1f} "
+            f"{statistics.mean(calls):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+few_shot_store_benchmark.py
+
+Measures the recall and query latency of the IVF few-shot store against the
+exhaustive NumPy retriever, and the time to append examples, on synthetic
+clustered embeddings of the Titan dimension.
+
+Embeddings are drawn around random topic centers, as questions about the same
+tables and intents are, and the queries are drawn the same way. Recall@k is the
+share of the exact top k examples the store returns. The default spread puts
+examples of a topic at a cosine similarity of about 0.2, harder than real
+paraphrases; --spread 0.015 puts them at about 0.8.
+
+Runs offline, with the action lambda requirements installed:
+
+    python benchmarks/few_shot_store_benchmark.py --sizes 10000 50000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ACTION_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "action-lambda"
+)
+sys.path.insert(0, ACTION_LAMBDA_DIR)
+
+from llama_index.core.embeddings import MockEmbedding  # noqa: E402
+from llama_index.core.schema import TextNode  # noqa: E402
+
+from few_shot_store import FewShotStore  # noqa: E402
+from vector_retriever import NumpyVectorRetriever  # noqa: E402
+
+# Dimension of amazon.titan-embed-text-v1 embeddings
+EMBED_DIM = 1536
+
+
+def clustered_embeddings(rng, centers, size, spread):
+    """Embeddings drawn around random centers."""
+    picks = rng.integers(0, len(centers), size)
+    noise = rng.standard_normal((size, centers.shape[1]), dtype=np.float32)
+    return centers[picks] + spread * noise
+
+
+def example_rows(start, size):
+    return [
+        {"example_input_question": f"question {i}", "example_output_query": "SELECT 1"}
+        for i in range(start, start + size)
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=0.05)
+    parser.add_argument("--append-size", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.topics, EMBED_DIM), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    embed_model = MockEmbedding(embed_dim=EMBED_DIM)
+
+    print(
+        f"{'examples':>8} {'method':<12} {'recall@k':>9} {'p50 ms':>8} "
+        f"{'p99 ms':>8}"
+    )
+    for size in args.sizes:
+        embeddings = clustered_embeddings(rng, centers, size, args.spread)
+        queries = clustered_embeddings(rng, centers, args.queries, args.spread)
+
+        exact = NumpyVectorRetriever(
+            [TextNode(text=str(i), id_=str(i)) for i in range(size)],
+            embeddings,
+            embed_model,
+            similarity_top_k=args.top_k,
+        )
+        timings, truth = [], []
+        for query in queries:
+            result, seconds = timed(lambda: exact.batch_retrieve([query])[0])
+            timings.append(seconds * 1000)
+            truth.append({int(n.node.text) for n in result})
+        print(
+            f"{size:>8} {'exhaustive':<12} {1.0:>9.3f} "
+            f"{statistics.median(timings):>8.2f} "
+            f"{np.percentile(timings, 99):>8.2f}"
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = FewShotStore.create(tmp_dir, "benchmark", EMBED_DIM)
+            store, build_seconds = timed(
+                lambda: store.append(
+                    example_rows(0, size), embeddings, compact_ratio=None
+                ).compact(retrain=True)
+            )
+            for nprobe in args.nprobe:
+                timings, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    result, seconds = timed(
+                        lambda: store.search([query], args.top_k, nprobe=nprobe)[0]
+                    )
+                    timings.append(seconds * 1000)
+                    recalls.append(len({i for i, _ in result} & expected) / args.top_k)
+                print(
+                    f"{size:>8} {f'ivf nprobe={nprobe}':<12} "
+                    f"{statistics.mean(recalls):>9.3f} "
+                    f"{statistics.median(timings):>8.2f} "
+                    f"{np.percentile(timings, 99):>8.2f}"
+                )
+
+            appended = clustered_embeddings(rng, centers, args.append_size, args.spread)
+            store, append_seconds = timed(
+                lambda: store.append(
+                    example_rows(size, args.append_size), appended, compact_ratio=None
+                )
+            )
+            store.close()
+        print(
+            f"{size:>8} built in {build_seconds:.2f}s "
+            f"({store.manifest['nlist']} lists), appended {args.append_size} "
+            f"examples in {append_seconds * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+retriever_benchmark.py
+
+Compares the query latency of the NumPy top-k retriever with llama-index's
+VectorStoreIndex retriever on random embeddings, at 1k, 10k and 100k nodes.
+
+Runs offline, with the action lambda requirements installed:
+
+    python benchmarks/retriever_benchmark.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ACTION_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "action-lambda"
+)
+sys.path.insert(0, ACTION_LAMBDA_DIR)
+
+from llama_index.core import ServiceContext, VectorStoreIndex  # noqa: E402
+from llama_index.core.embeddings import MockEmbedding  # noqa: E402
+from llama_index.core.schema import QueryBundle, TextNode  # noqa: E402
+
+from vector_retriever import NumpyVectorRetriever  # noqa: E402
+
+# Dimension of amazon.titan-embed-text-v1 embeddings
+EMBED_DIM = 1536
+
+
+def median_ms(fn, repeats):
+    """Median wall time of a function in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument(
+        "--baseline-max-size",
+        type=int,
+        default=10000,
+        help="largest size also run with VectorStoreIndex (embeddings as lists)",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embed_model = MockEmbedding(embed_dim=EMBED_DIM)
+    queries = rng.standard_normal((args.batch_size, EMBED_DIM), dtype=np.float32)
+    query_bundle = QueryBundle("question", embedding=queries[0].tolist())
+
+    print(
+        f"{'nodes':>7} {'index ms':>9} {'numpy ms':>9} {'mmap ms':>8} "
+        f"{'batch/query ms':>15}"
+    )
+    for size in args.sizes:
+        embeddings = rng.standard_normal((size, EMBED_DIM), dtype=np.float32)
+        nodes = [TextNode(text=str(i), id_=str(i)) for i in range(size)]
+
+        baseline = "-"
+        if size <= args.baseline_max_size:
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding.tolist()
+            index = VectorStoreIndex(
+                nodes,
+                service_context=ServiceContext.from_defaults(
+                    llm=None, embed_model=embed_model
+                ),
+            )
+            index_retriever = index.as_retriever(similarity_top_k=args.top_k)
+            baseline_ms = median_ms(
+                lambda: index_retriever.retrieve(query_bundle), args.repeats
+            )
+            baseline = f"{baseline_ms:.2f}"
+            for node in nodes:
+                node.embedding = None
+
+        retriever = NumpyVectorRetriever(
+            nodes, embeddings, embed_model, similarity_top_k=args.top_k
+        )
+        numpy_ms = median_ms(lambda: retriever.retrieve(query_bundle), args.repeats)
+        batch_ms = (
+            median_ms(lambda: retriever.batch_retrieve(queries), args.repeats)
+            / args.batch_size
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "embeddings.npy")
+            np.save(path, embeddings)
+            mmap_retriever = NumpyVectorRetriever(
+                nodes,
+                np.load(path, mmap_mode="r"),
+                embed_model,
+                similarity_top_k=args.top_k,
+            )
+            mmap_ms = median_ms(
+                lambda: mmap_retriever.retrieve(query_bundle), args.repeats
+            )
+            del mmap_retriever
+
+        print(
+            f"{size:>7} {baseline:>9} {numpy_ms:>9.2f} {mmap_ms:>8.2f} "
+            f"{batch_ms:>15.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
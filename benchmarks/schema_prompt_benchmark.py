@@ -0,0 +1,172 @@
+"""
+schema_prompt_benchmark.py
+
+Compares text-to-SQL prompts holding the full table schemas with prompts
+holding only the columns retrieved for the question: prompt token counts and
+SQL execution accuracy on the labelled questions of text_to_sql_questions.csv.
+
+A generated query is counted as correct when its result holds the same values
+as the labelled query in the first labelled column, e.g. the same instance
+names, whatever other columns it selects. Both queries run on the embedded
+SQLite copy of the tables, or on Athena when SQLite cannot run them.
+
+Run from the repository root with the action lambda requirements installed,
+AWS credentials configured and the action lambda environment variables set
+(ATHENA_BUCKET_NAME, TEXT2SQL_DATABASE, REGION):
+
+    python benchmarks/schema_prompt_benchmark.py --column-top-k 4 8
+"""
+
+import argparse
+import csv
+import os
+import statistics
+import sys
+
+ACTION_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "action-lambda"
+)
+sys.path.insert(0, ACTION_LAMBDA_DIR)
+
+from llama_index.core import ServiceContext  # noqa: E402
+from llama_index.core.schema import QueryBundle  # noqa: E402
+from llama_index.core.utils import get_tokenizer  # noqa: E402
+
+from build_query_engine import (  # noqa: E402
+    SQL_PROMPT,
+    get_embed_model,
+    get_llm,
+    get_local_sql_database,
+    get_sql_database,
+    get_table_retriever,
+)
+from column_retriever import build_column_retriever  # noqa: E402
+from prompt_templates import column_details, table_key_columns  # noqa: E402
+from sql_query_engine import TextToSQLRetriever  # noqa: E402
+
+
+def read_questions(path):
+    """Reads the (question, labelled SQL) pairs of a csv file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["question"], row["sql"]) for row in csv.DictReader(f)]
+
+
+def normalize(value):
+    """Comparable form of a result value."""
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+def results_match(expected, predicted):
+    """
+    Whether a predicted result holds the values of the labelled result.
+
+    Args:
+        expected (dict): Metadata of the labelled query, "result" and "col_keys".
+        predicted (dict): Metadata of the generated query.
+
+    Returns:
+        bool: True if the first labelled column has the same values.
+    """
+    if "result" not in predicted or not predicted["col_keys"]:
+        return False
+    column = expected["col_keys"][0].lower()
+    predicted_columns = [key.lower() for key in predicted["col_keys"]]
+    index = predicted_columns.index(column) if column in predicted_columns else 0
+    return sorted(
+        (normalize(row[0]) for row in expected["result"]), key=repr
+    ) == sorted((normalize(row[index]) for row in predicted["result"]), key=repr)
+
+
+def evaluate(name, sql_retriever, questions, tokenizer):
+    """
+    Generates and runs the SQL of every question with a retriever.
+
+    Returns:
+        dict: Mean prompt and schema tokens, and accuracy of the variant.
+    """
+    prompt_tokens, schema_tokens, correct = [], [], 0
+    dialect = sql_retriever._sql_database.dialect
+    for question, labelled_sql in questions:
+        query_bundle = QueryBundle(question)
+        schema = sql_retriever._get_table_context(query_bundle)
+        prompt = SQL_PROMPT.format(query_str=question, schema=schema, dialect=dialect)
+        prompt_tokens.append(len(tokenizer(prompt)))
+        schema_tokens.append(len(tokenizer(schema)))
+
+        sql = sql_retriever.generate_sql(query_bundle)
+        _, expected = sql_retriever.execute_sql(labelled_sql)
+        try:
+            _, predicted = sql_retriever.execute_sql(sql)
+        except Exception as e:
+            predicted = {"sql_error": str(e)}
+        if results_match(expected, predicted):
+            correct += 1
+        else:
+            print(f"[{name}] {question}\n    labelled: {labelled_sql}\n    got: {sql}")
+    return {
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "schema_tokens": statistics.mean(schema_tokens),
+        "accuracy": correct / len(questions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--questions",
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "text_to_sql_questions.csv"
+        ),
+    )
+    parser.add_argument("--column-top-k", type=int, nargs="+", default=[8])
+    parser.add_argument("--model-name", default="ClaudeInstant")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    sql_database, schema_snapshot = get_sql_database()
+    llm = get_llm(args.model_name)
+    retriever_kwargs = {
+        "llm": llm,
+        "service_context": ServiceContext.from_defaults(
+            llm=llm, embed_model=get_embed_model()
+        ),
+        "text_to_sql_prompt": SQL_PROMPT,
+        "table_retriever": get_table_retriever(),
+        "local_sql_database": get_local_sql_database(),
+    }
+    variants = {"full schema": TextToSQLRetriever(sql_database, **retriever_kwargs)}
+    for top_k in args.column_top_k:
+        column_retriever = build_column_retriever(
+            sql_database,
+            schema_snapshot,
+            column_details,
+            table_key_columns,
+            get_embed_model(),
+            similarity_top_k=top_k,
+        )
+        variants[f"top {top_k} columns"] = TextToSQLRetriever(
+            sql_database, column_retriever=column_retriever, **retriever_kwargs
+        )
+
+    tokenizer = get_tokenizer()
+    results = {
+        name: evaluate(name, sql_retriever, questions, tokenizer)
+        for name, sql_retriever in variants.items()
+    }
+    print(f"\n{len(questions)} questions")
+    print(
+        f"{'variant':<16} {'prompt tokens':>14} {'schema tokens':>14} {'accuracy':>9}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<16} {result['prompt_tokens']:>14.0f} "
+            f"{result['schema_tokens']:>14.0f} {result['accuracy']:>9.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
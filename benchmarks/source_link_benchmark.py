@@ -0,0 +1,154 @@
+"""
+source_link_benchmark.py
+
+Measures the time the invoke lambda takes to resolve the knowledge base
+references of an answer: fetching every retrieved chunk's document one after
+the other as before, with the de-duplicated, concurrent source_link reading
+the documents with ranged GETs, and with the document manifest.
+
+The S3 client is stubbed: every GetObject sleeps for a latency drawn from a
+lognormal distribution with the given median and a heavy tail, plus the
+transfer time of the bytes read at --bandwidth, and returns a JSON document of
+--document-size bytes. Every answer retrieves --chunks chunks from --documents
+distinct documents, as overlapping chunks of the same pages do.
+
+Run from the repository root:
+
+    python benchmarks/source_link_benchmark.py --chunks 8 --documents 4
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+INVOKE_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "invoke-lambda"
+)
+sys.path.insert(0, INVOKE_LAMBDA_DIR)
+os.environ.setdefault("AGENT_ID", "AGENT")
+os.environ.setdefault("REGION_NAME", "us-east-1")
+
+import index  # noqa: E402
+from document_references import DocumentReferences, parse_s3_uri  # noqa: E402
+
+
+class StubS3Client:
+    """S3 client stub answering GetObject after a random latency."""
+
+    def __init__(self, median, sigma, document_size, bandwidth, seed=0):
+        self.mu = math.log(median)
+        self.sigma = sigma
+        self.document_size = document_size
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.bytes = 0
+
+    def document(self, key):
+        document = {
+            "Url": f"https://docs.aws.amazon.com/{key}",
+            "Topic": key,
+            "Concent": "",
+        }
+        padding = self.document_size - len(json.dumps(document))
+        document["Concent"] = "x" * max(padding, 0)
+        return json.dumps(document).encode("utf-8")
+
+    def get_object(self, Bucket, Key, Range=None):
+        body = self.document(Key)
+        if Range is not None:
+            start, end = Range.split("=")[1].split("-")
+            body = body[int(start) : int(end) + 1]
+        self.calls += 1
+        self.bytes += len(body)
+        latency = self.random.lognormvariate(self.mu, self.sigma)
+        time.sleep(latency + len(body) / self.bandwidth)
+        return {"Body": io.BytesIO(body)}
+
+
+def sequential_source_link(input_source_list):
+    """source_link before: one whole GetObject per chunk, one after the other."""
+    sources = []
+    for input_source in input_source_list:
+        bucket, key = parse_s3_uri(input_source)
+        body = index.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        res = json.loads(body)
+        sources.append((res["Topic"], res["Url"]))
+    return list(dict.fromkeys(sources))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--answers", type=int, default=50)
+    parser.add_argument("--median", type=float, default=0.03)
+    parser.add_argument("--sigma", type=float, default=0.8)
+    parser.add_argument("--timeout", type=float, default=index.SOURCE_LINK_TIMEOUT)
+    # median size of the ec2_dg documents
+    parser.add_argument("--document-size", type=int, default=4300)
+    parser.add_argument("--bandwidth", type=float, default=50e6)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    answers = [
+        [
+            f"s3://kb-bucket/doc-{rng.randrange(args.documents)}.json"
+            for _ in range(args.chunks)
+        ]
+        for _ in range(args.answers)
+    ]
+    print(
+        f"{args.answers} answers of {args.chunks} chunks from up to "
+        f"{args.documents} documents, GetObject median {args.median * 1000:.0f}ms"
+    )
+    print(
+        f"{'source_link':<12} {'GetObject':>10} {'KB read':>9} {'p50 ms':>8} "
+        f"{'p90 ms':>8} {'p99 ms':>8} {'missing':>8}"
+    )
+    documents = sorted({path for paths in answers for path in paths})
+    stub = StubS3Client(args.median, args.sigma, args.document_size, args.bandwidth)
+    manifest = {}
+    for path in documents:
+        key = parse_s3_uri(path)[1]
+        document = json.loads(stub.document(key))
+        manifest[key] = [document["Topic"], document["Url"], ""]
+
+    def concurrent_source_link(paths):
+        return index.source_link(paths, timeout=args.timeout)
+
+    for name, resolve, with_manifest in [
+        ("sequential", sequential_source_link, False),
+        ("concurrent", concurrent_source_link, False),
+        ("manifest", concurrent_source_link, True),
+    ]:
+        index.s3_client = StubS3Client(
+            args.median, args.sigma, args.document_size, args.bandwidth
+        )
+        index.document_references = DocumentReferences(
+            index.s3_client, manifest if with_manifest else None
+        )
+        timings, missing = [], 0
+        for paths in answers:
+            start = time.perf_counter()
+            refs = resolve(paths)
+            timings.append((time.perf_counter() - start) * 1000)
+            if isinstance(refs, str):
+                missing += len(set(paths)) - refs.count("](")
+        quantiles = statistics.quantiles(timings, n=100)
+        print(
+            f"{name:<12} {index.s3_client.calls:>10} "
+            f"{index.s3_client.bytes / 1e6:>7.1f}MB "
+            f"{statistics.median(timings):>8.1f} {quantiles[89]:>8.1f} "
+            f"{quantiles[98]:>8.1f} {missing:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+sql_backend_benchmark.py
+
+Compares the latency of the SQL queries of the few-shot examples on Amazon
+Athena and on the embedded SQLite copy of the tables.
+
+Run from the repository root with the action lambda requirements installed,
+AWS credentials configured and the action lambda environment variables set
+(ATHENA_BUCKET_NAME, TEXT2SQL_DATABASE, REGION):
+
+    python benchmarks/sql_backend_benchmark.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ACTION_LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "code", "lambdas", "action-lambda"
+)
+sys.path.insert(0, ACTION_LAMBDA_DIR)
+
+from llama_index.core import SQLDatabase  # noqa: E402
+
+from build_query_engine import create_sql_engine  # noqa: E402
+from connections import Connections  # noqa: E402
+from few_shot_artifact import read_few_shot_examples  # noqa: E402
+from local_sql import load_local_sql_database  # noqa: E402
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    index = max(0, int(round(pct / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def time_queries(sql_database, queries, runs):
+    """
+    Runs every query several times.
+
+    Returns:
+        tuple: (latencies in milliseconds, number of failed queries).
+    """
+    latencies, failures = [], 0
+    for _ in range(runs):
+        for sql in queries:
+            start = time.perf_counter()
+            try:
+                sql_database.run_sql(sql)
+            except Exception:
+                failures += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--examples-path",
+        default=os.path.join(ACTION_LAMBDA_DIR, "dynamic_examples.csv"),
+    )
+    args = parser.parse_args()
+
+    examples = read_few_shot_examples(args.examples_path)
+    queries = [row["example_output_query"] for row in examples.values()]
+
+    start = time.perf_counter()
+    local_db = load_local_sql_database(
+        Connections.glue_client,
+        Connections.s3_client,
+        Connections.text2sql_database,
+        Connections.local_sql_max_bytes,
+    )
+    load_seconds = time.perf_counter() - start
+    if local_db is None:
+        sys.exit("No table was small enough to be loaded into SQLite")
+    print(f"Loaded {sorted(local_db.cached_tables)} in {load_seconds:.2f}s")
+
+    backends = {
+        "athena": SQLDatabase(create_sql_engine()),
+        "sqlite": local_db,
+    }
+    print(f"{'backend':<8} {'queries':>8} {'failed':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, sql_database in backends.items():
+        latencies, failures = time_queries(sql_database, queries, args.runs)
+        if not latencies:
+            print(f"{name:<8} {0:>8} {failures:>7}")
+            continue
+        print(
+            f"{name:<8} {len(latencies):>8} {failures:>7} "
+            f"{statistics.median(latencies):>9.1f} {percentile(latencies, 95):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
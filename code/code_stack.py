@@ -1,6 +1,7 @@
 import os
 import sys
 import os.path as path
+import hashlib
 import json
 from aws_cdk import (
     CustomResource,
@@ -23,8 +24,11 @@
     aws_ecs_patterns as ecs_patterns,
     aws_opensearchserverless as opensearchserverless,
     aws_bedrock as bedrock,
+    AssetHashType,
     BundlingOptions,
     DockerImage,
+    DockerVolume,
+    FileSystem,
 )
 from constructs import Construct
 from aws_cdk.aws_ecr_assets import Platform
@@ -112,6 +116,9 @@ def get_config(self):
             "knowledgebase_destination_prefix"
         ]
         self.KNOWLEDGEBASE_FILE_NAME = config["paths"]["knowledgebase_file_name"]
+        self.KNOWLEDGEBASE_MANIFEST_PREFIX = config["paths"][
+            "knowledgebase_manifest_prefix"
+        ]
         self.AGENT_SCHEMA_DESTINATION_PREFIX = config["paths"][
             "agent_schema_destination_prefix"
         ]
@@ -134,6 +141,7 @@ def get_config(self):
 
         self.FEWSHOT_EXAMPLES_PATH = config["paths"]["fewshot_examples_path"]
         self.LAMBDAS_SOURCE_FOLDER = config["paths"]["lambdas_source_folder"]
+        self.INGEST_SOURCE_FOLDER = config["paths"]["ingest_source_folder"]
         self.LAYERS_SOURCE_FOLDER = config["paths"]["layers_source_folder"]
 
         return config
@@ -234,16 +242,89 @@ def upload_files_to_s3(self, agent_assets_bucket, athena_bucket, kms_key):
             retain_on_delete=False,
         )
 
+        # The title and URL of every document, read by the invoke lambda to
+        # cite the documents without downloading them
+        knowledgebase_path = path.join(
+            os.getcwd(), self.ASSETS_FOLDER_NAME, self.KNOWLEDGEBASE_DESTINATION_PREFIX
+        )
+        ingest_path = path.join(os.getcwd(), self.INGEST_SOURCE_FOLDER)
+        knowledgebase_manifest_hash = hashlib.sha256(
+            (
+                FileSystem.fingerprint(knowledgebase_path)
+                + FileSystem.fingerprint(ingest_path, exclude=["__pycache__"])
+            ).encode()
+        ).hexdigest()
+        s3deploy.BucketDeployment(
+            self,
+            "KnowledgeBaseManifestDeployment",
+            sources=[
+                s3deploy.Source.asset(
+                    knowledgebase_path,
+                    asset_hash=knowledgebase_manifest_hash,
+                    asset_hash_type=AssetHashType.CUSTOM,
+                    bundling=BundlingOptions(
+                        image=DockerImage.from_registry(
+                            "public.ecr.aws/sam/build-python3.12"
+                        ),
+                        volumes=[
+                            DockerVolume(
+                                host_path=ingest_path, container_path="/ingest"
+                            )
+                        ],
+                        command=[
+                            "python",
+                            "/ingest/kb_manifest.py",
+                            "/asset-input",
+                            "/asset-output/manifest.json",
+                            "--prefix",
+                            f"{self.KNOWLEDGEBASE_DESTINATION_PREFIX}/",
+                        ],
+                    ),
+                )
+            ],
+            destination_bucket=agent_assets_bucket,
+            destination_key_prefix=self.KNOWLEDGEBASE_MANIFEST_PREFIX,
+            retain_on_delete=False,
+        )
+
+        # The csv tables are converted to Parquet before being uploaded
+        athena_data_path = path.join(
+            os.getcwd(), self.ASSETS_FOLDER_NAME, self.ATHENA_DATA_DESTINATION_PREFIX
+        )
+        athena_data_hash = hashlib.sha256(
+            (
+                FileSystem.fingerprint(athena_data_path)
+                + FileSystem.fingerprint(ingest_path, exclude=["__pycache__"])
+            ).encode()
+        ).hexdigest()
         s3deploy.BucketDeployment(
             self,
             "AthenaDataDeployment",
             sources=[
                 s3deploy.Source.asset(
-                    path.join(
-                        os.getcwd(),
-                        self.ASSETS_FOLDER_NAME,
-                        self.ATHENA_DATA_DESTINATION_PREFIX,
-                    )
+                    athena_data_path,
+                    asset_hash=athena_data_hash,
+                    asset_hash_type=AssetHashType.CUSTOM,
+                    bundling=BundlingOptions(
+                        image=DockerImage.from_registry(
+                            "public.ecr.aws/sam/build-python3.12"
+                        ),
+                        volumes=[
+                            DockerVolume(
+                                host_path=ingest_path, container_path="/ingest"
+                            )
+                        ],
+                        command=[
+                            "bash",
+                            "-c",
+                            """
+                            pip install -r /ingest/requirements.txt \
+                                --target /tmp/ingest-packages
+                            PYTHONPATH=/tmp/ingest-packages python \
+                                /ingest/parquet_ingest.py /asset-input /asset-output
+                            """,
+                        ],
+                    ),
                 )
             ],
             destination_bucket=athena_bucket,
@@ -437,6 +518,7 @@ def create_agent_executor_lambda(
                 "ATHENA_BUCKET_NAME": athena_bucket.bucket_name,
                 "TEXT2SQL_DATABASE": glue_database.ref,
                 "LOG_LEVEL": logging_context["lambda_log_level"],
+                "PROFILING_ENABLED": logging_context["lambda_profiling_enabled"],
                 "FEWSHOT_EXAMPLES_PATH": self.FEWSHOT_EXAMPLES_PATH,
             },
             environment_encryption=kms_key,
@@ -916,7 +998,14 @@ def create_bedrock_agent_invoke_lambda(self, agent, agent_assets_bucket):
             code=lambda_.Code.from_asset(
                 path.join(os.getcwd(), self.LAMBDAS_SOURCE_FOLDER, "invoke-lambda")
             ),
-            environment={"AGENT_ID": agent.attr_agent_id, "REGION_NAME": Aws.REGION},
+            environment={
+                "AGENT_ID": agent.attr_agent_id,
+                "REGION_NAME": Aws.REGION,
+                "KB_MANIFEST_BUCKET": agent_assets_bucket.bucket_name,
+                "KB_MANIFEST_KEY": (
+                    f"{self.KNOWLEDGEBASE_MANIFEST_PREFIX}/manifest.json"
+                ),
+            },
             role=invoke_lambda_role,
             timeout=Duration.minutes(15),
             tracing=lambda_.Tracing.ACTIVE,
@@ -0,0 +1,127 @@
+"""
+kb_manifest.py
+
+Builds the manifest of the knowledge base documents, mapping the S3 key of
+every document to its title and URL, so that the citations of an answer are
+resolved without reading the documents.
+
+Every document is a JSON file with "Topic" and "Url" keys. They are read from
+the zip archives and folders of the input directory, and keyed by their path
+in the archive under the knowledge base prefix, as the deployment uploads
+them. The manifest is a JSON file sorted by key:
+
+    {"version": 1, "prefix": "...", "documents": {key: [title, url, md5]}}
+
+The md5 is the hex digest of the document. The S3 ETag of the uploaded
+document is only its md5 without KMS encryption, so it is not stored.
+
+Usage:
+
+    python kb_manifest.py INPUT_DIR OUTPUT_FILE --prefix knowledgebase_data_source/
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import zipfile
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MANIFEST_VERSION = 1
+
+
+def document_entry(content):
+    """
+    Manifest entry of a document.
+
+    Args:
+        content (bytes): Document content.
+
+    Returns:
+        list: Title, URL and md5 of the document.
+    """
+    document = json.loads(content)
+    return [document["Topic"], document["Url"], hashlib.md5(content).hexdigest()]
+
+
+def iter_documents(input_dir):
+    """
+    Yields the relative path and content of the documents of a directory.
+
+    Zip archives are read as the folders they are extracted to.
+    """
+    for root, _, files in os.walk(input_dir):
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            relative_dir = os.path.relpath(root, input_dir)
+            if file_name.endswith(".zip"):
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        if not info.is_dir():
+                            yield info.filename, archive.read(info)
+            else:
+                relative_path = os.path.normpath(os.path.join(relative_dir, file_name))
+                with open(path, "rb") as f:
+                    yield relative_path, f.read()
+
+
+def build_manifest(input_dir, prefix=""):
+    """
+    Builds the manifest of the documents of a directory.
+
+    Args:
+        input_dir (str): Directory of the documents, or of their zip archives.
+        prefix (str): Key prefix of the documents in the bucket.
+
+    Returns:
+        dict: The manifest.
+    """
+    documents = {}
+    for relative_path, content in iter_documents(input_dir):
+        key = prefix + relative_path.replace(os.sep, "/")
+        try:
+            documents[key] = document_entry(content)
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Skipping {key}, not a document with a Topic and Url: {e}")
+    return {
+        "version": MANIFEST_VERSION,
+        "prefix": prefix,
+        "documents": dict(sorted(documents.items())),
+    }
+
+
+def write_manifest(input_dir, output_file, prefix=""):
+    """
+    Builds the manifest of the documents of a directory and writes it.
+
+    Args:
+        input_dir (str): Directory of the documents, or of their zip archives.
+        output_file (str): Path of the manifest.
+        prefix (str): Key prefix of the documents in the bucket.
+
+    Returns:
+        int: Number of documents in the manifest.
+    """
+    manifest = build_manifest(input_dir, prefix)
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    logger.info(
+        f"Wrote the manifest of {len(manifest['documents'])} documents to "
+        f"{output_file}, {os.path.getsize(output_file)} bytes"
+    )
+    return len(manifest["documents"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("input_dir")
+    parser.add_argument("output_file")
+    parser.add_argument("--prefix", default="")
+    args = parser.parse_args()
+    write_manifest(args.input_dir, args.output_file, args.prefix)
@@ -0,0 +1,193 @@
+"""
+parquet_ingest.py
+
+Converts the csv tables of the text-to-SQL data source into Parquet.
+
+Every table folder of the input directory, e.g. ec2_pricing/, is read with its
+csv header lowercased as the Glue crawler would, typed, enriched with the
+parsed columns of the table, sorted so that row group statistics prune scans,
+and written as one zstd compressed Parquet file to the same folder of the
+output directory. For the EC2 pricing table, the free text storage and network
+columns are parsed into storage_gb, storage_disk_count, storage_nvme and
+network_gbps, and the rows are sorted by instance_family.
+
+Usage:
+
+    python parquet_ingest.py INPUT_DIR OUTPUT_DIR
+"""
+
+import argparse
+import logging
+import os
+import re
+
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+STORAGE_TOTAL_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*GB", re.IGNORECASE)
+STORAGE_DISKS_PATTERN = re.compile(r"\((\d+)\s*\*", re.IGNORECASE)
+NETWORK_PATTERN = re.compile(
+    r"^(?:up to\s+)?(?:(\d+)x\s+)?(\d+(?:\.\d+)?)\s*Gigabit", re.IGNORECASE
+)
+
+ROW_GROUP_SIZE = 100000
+
+
+def parse_storage(value):
+    """
+    Parses an instance storage description, e.g. "900 GB (2 * 450 GB NVMe SSD)".
+
+    Args:
+        value (str): Storage description.
+
+    Returns:
+        tuple: (total GB, disk count, NVMe flag), (0, 0, False) for "EBS only"
+            and Nones for unknown formats.
+    """
+    if value is None:
+        return None, None, None
+    if value.strip().lower() == "ebs only":
+        return 0.0, 0, False
+    total = STORAGE_TOTAL_PATTERN.match(value)
+    if total is None:
+        return None, None, None
+    disks = STORAGE_DISKS_PATTERN.search(value)
+    disk_count = int(disks.group(1)) if disks else 1
+    return float(total.group(1)), disk_count, "nvme" in value.lower()
+
+
+def parse_network(value):
+    """
+    Parses a network performance, e.g. "Up to 25 Gigabit" or "4x 100 Gigabit".
+
+    Args:
+        value (str): Network performance.
+
+    Returns:
+        float: Peak bandwidth in Gbps, None for "Low", "Moderate" or "High".
+    """
+    if value is None:
+        return None
+    match = NETWORK_PATTERN.match(value.strip())
+    if match is None:
+        return None
+    links = int(match.group(1)) if match.group(1) else 1
+    return links * float(match.group(2))
+
+
+def ec2_pricing_columns(table):
+    """Parsed columns of the EC2 pricing table."""
+    names = table.column("instance_name").to_pylist()
+    storage = [
+        parse_storage(value)
+        for value in table.column("instance_storage_type_and_capacity").to_pylist()
+    ]
+    network = table.column("network_performance").to_pylist()
+    return {
+        "instance_family": pa.array(
+            [name.split(".")[0] if name else None for name in names], pa.string()
+        ),
+        "storage_gb": pa.array([s[0] for s in storage], pa.float64()),
+        "storage_disk_count": pa.array([s[1] for s in storage], pa.int32()),
+        "storage_nvme": pa.array([s[2] for s in storage], pa.bool_()),
+        "network_gbps": pa.array([parse_network(v) for v in network], pa.float64()),
+    }
+
+
+# Parsed columns and sort order of each table, other tables are only typed
+TABLE_COLUMNS = {"ec2_pricing": ec2_pricing_columns}
+TABLE_SORT_COLUMNS = {"ec2_pricing": ["instance_family", "instance_name"]}
+
+
+def read_csv_table(paths):
+    """
+    Reads the csv files of a table with lowercase column names.
+
+    Args:
+        paths (list): csv files of the table.
+
+    Returns:
+        pyarrow.Table: The table, with the types inferred from all the files.
+    """
+    tables = [pv.read_csv(path) for path in paths]
+    table = pa.concat_tables(tables, promote_options="permissive")
+    return table.rename_columns([name.lower() for name in table.column_names])
+
+
+def convert_table(name, paths):
+    """
+    Converts the csv files of a table into a typed, enriched and sorted table.
+
+    Args:
+        name (str): Table name, i.e. the name of its folder.
+        paths (list): csv files of the table.
+
+    Returns:
+        pyarrow.Table: The converted table.
+    """
+    table = read_csv_table(paths)
+    if name in TABLE_COLUMNS:
+        for column, values in TABLE_COLUMNS[name](table).items():
+            table = table.append_column(column, values)
+    sort_columns = [
+        column
+        for column in TABLE_SORT_COLUMNS.get(name, [])
+        if column in table.column_names
+    ]
+    if sort_columns:
+        table = table.sort_by([(column, "ascending") for column in sort_columns])
+    return table
+
+
+def convert_directory(input_dir, output_dir):
+    """
+    Converts every csv table folder of a directory into Parquet.
+
+    Args:
+        input_dir (str): Directory with one folder of csv files per table.
+        output_dir (str): Directory receiving one folder per table, holding
+            <table>.parquet.
+
+    Returns:
+        dict: Number of rows of each converted table.
+    """
+    converted = {}
+    for name in sorted(os.listdir(input_dir)):
+        folder = os.path.join(input_dir, name)
+        if not os.path.isdir(folder):
+            continue
+        paths = sorted(
+            os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".csv")
+        )
+        if not paths:
+            continue
+        table = convert_table(name, paths)
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+        output_path = os.path.join(output_dir, name, f"{name}.parquet")
+        pq.write_table(
+            table,
+            output_path,
+            compression="zstd",
+            row_group_size=ROW_GROUP_SIZE,
+        )
+        logger.info(
+            f"Converted {name}: {table.num_rows} rows, "
+            f"{sum(os.path.getsize(p) for p in paths)} csv bytes to "
+            f"{os.path.getsize(output_path)} Parquet bytes"
+        )
+        converted[name] = table.num_rows
+    return converted
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+    convert_directory(args.input_dir, args.output_dir)
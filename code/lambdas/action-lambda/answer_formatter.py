@@ -0,0 +1,143 @@
+"""
+answer_formatter.py
+
+Deterministic answers rendered from small SQL results.
+
+Single rows and short top-N results only need their rows restated, so they are
+rendered from templates instead of the response synthesis LLM call. Results
+that are too large, or whose columns cannot be labelled, e.g. unnamed
+aggregates, are left to the LLM. Dollar signs are escaped as required by
+RESPONSE_TEMPLATE_STR.
+"""
+
+import logging
+import re
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# "auto" answers from templates when the result allows it, "llm" always calls
+# the LLM
+SYNTHESIS_MODES = ("auto", "llm")
+
+# Labels of the pricing table columns, other columns are labelled by their name
+COLUMN_LABELS = {
+    "instance_name": "instance",
+    "instance_name_alias": "name",
+    "instance_memory_gib": "memory",
+    "number_vcpus": "vCPUs",
+    "instance_storage_type_and_capacity": "storage",
+    "network_performance": "network performance",
+    "on_demand_hourly_price": "on-demand hourly price",
+    "linux_reserved_cost_1_year_hourly": "1 year reserved Linux hourly price",
+    "linux_spot_minimum_cost_hourly": "minimum Linux spot hourly price",
+}
+
+# Columns naming the row, used as the key of every line
+KEY_COLUMNS = ("instance_name", "instance_name_alias")
+
+# Questions asking for the top of an ordered result
+SUPERLATIVE_PATTERN = re.compile(
+    r"\b(most|least|cheapest|highest|lowest|largest|smallest|biggest|best|"
+    r"fastest|maximum|minimum|max|min|top)\b"
+)
+
+# Column names of expressions without alias, e.g. "_col0" on Athena
+UNNAMED_COLUMN_PATTERN = re.compile(r"^_col\d+$|[()*]")
+
+
+def column_unit(column):
+    """Unit of a column from its name: "price", "gib" or None."""
+    if "price" in column or "cost" in column:
+        return "price"
+    if "gib" in column or "memory" in column:
+        return "gib"
+    return None
+
+
+def format_value(value, unit=None):
+    """
+    Formats a result value for an answer.
+
+    Args:
+        value: Result value.
+        unit (str): "price", "gib" or None.
+
+    Returns:
+        str: Formatted value, prices with an escaped dollar sign.
+    """
+    if value is None:
+        return "not available"
+    if isinstance(value, str):
+        return value
+    if unit == "price":
+        amount = f"{float(value):.4f}".rstrip("0")
+        if len(amount.split(".")[1]) < 2:
+            amount = f"{float(value):.2f}"
+        return f"\\${amount}"
+    number = f"{float(value):,.4f}".rstrip("0").rstrip(".")
+    if unit == "gib":
+        return f"{number} GiB"
+    return number
+
+
+def format_result(question, sql_query, rows, col_keys, max_rows=10, max_columns=6):
+    """
+    Renders the answer of a SQL result from templates.
+
+    Args:
+        question (str): User question.
+        sql_query (str): SQL query of the result.
+        rows (list): Result rows.
+        col_keys (list): Column names of the rows.
+        max_rows (int): Largest result rendered from templates.
+        max_columns (int): Largest number of columns rendered from templates.
+
+    Returns:
+        str: Answer, or None when the result is left to the LLM.
+    """
+    if not rows:
+        return (
+            "According to the latest information, no data was found for this "
+            "question."
+        )
+    if len(rows) > max_rows or len(col_keys) > max_columns:
+        return None
+    columns = [column.lower() for column in col_keys]
+    if any(UNNAMED_COLUMN_PATTERN.search(column) for column in columns):
+        return None
+    superlative = SUPERLATIVE_PATTERN.search(question.lower()) is not None
+    if superlative and "order by" not in " ".join(sql_query.lower().split()):
+        # the top row only answers the question when the result is ordered
+        return None
+
+    key = next((column for column in KEY_COLUMNS if column in columns), None)
+    lines = []
+    for row in rows:
+        record = dict(zip(columns, row))
+        details = ", ".join(
+            f"{COLUMN_LABELS.get(column, column.replace('_', ' '))} "
+            f"{format_value(value, column_unit(column))}"
+            for column, value in record.items()
+            if column != key
+        )
+        if key is None:
+            lines.append(f"- {details}")
+        elif details:
+            lines.append(f"- {record[key]}: {details}")
+        else:
+            lines.append(f"- {record[key]}")
+
+    if len(rows) == 1 and key is None and len(columns) == 1:
+        label = COLUMN_LABELS.get(columns[0], columns[0].replace("_", " "))
+        value = format_value(rows[0][0], column_unit(columns[0]))
+        return f"According to the latest information, the {label} is {value}."
+
+    answer = "According to the latest information:\n" + "\n".join(lines)
+    if key is not None and len(rows) > 1 and superlative:
+        answer = (
+            f"According to the latest information, the top result is "
+            f"{rows[0][columns.index(key)]}:\n" + "\n".join(lines)
+        )
+    return answer
@@ -0,0 +1,163 @@
+"""
+athena_execution.py
+
+Amazon Athena execution layer for the SQL database.
+
+Queries are submitted with StartQueryExecution, and their state is polled with
+short first delays growing exponentially up to a maximum, instead of PyAthena's
+fixed one second interval, so that sub-second queries are seen as soon as they
+finish. Athena query result reuse returns the result of an identical query
+run within a maximum age without scanning the data again. Results are read in
+bulk from the S3 output location as an Arrow table when pyarrow is installed,
+instead of paging through GetQueryResults. Connections are pooled by the
+engine, which is kept across warm invocations.
+"""
+
+import logging
+import time
+
+from sqlalchemy import create_engine
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+try:
+    import pyarrow  # noqa: F401
+    from pyathena.arrow.cursor import ArrowCursor as BaseAthenaCursor
+
+    ATHENA_DIALECT = "awsathena+arrow"
+except ImportError:
+    # without pyarrow, results are paged through GetQueryResults
+    from pyathena.cursor import Cursor as BaseAthenaCursor
+
+    ATHENA_DIALECT = "awsathena+rest"
+
+# Final states of an Athena query execution
+FINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED")
+
+
+def poll_delays(initial_delay, max_delay, backoff=1.5):
+    """
+    Delays between the polls of a query execution.
+
+    Args:
+        initial_delay (float): First delay in seconds.
+        max_delay (float): Largest delay in seconds.
+        backoff (float): Growth factor of the delay.
+
+    Returns:
+        generator: Endless delays in seconds.
+    """
+    delay = initial_delay
+    while True:
+        yield delay
+        delay = min(delay * backoff, max_delay)
+
+
+def wait_for_query(get_query_execution, query_id, delays, sleep=time.sleep):
+    """
+    Polls a query execution until it reaches a final state.
+
+    Args:
+        get_query_execution (callable): Returns the execution of a query id,
+            with a "state" attribute.
+        query_id (str): Athena query execution id.
+        delays (iterator): Delays between polls in seconds.
+        sleep (callable): Sleep function.
+
+    Returns:
+        query_execution: The final query execution.
+        polls (int): Number of GetQueryExecution calls.
+    """
+    polls = 0
+    for delay in delays:
+        query_execution = get_query_execution(query_id)
+        polls += 1
+        if query_execution.state in FINAL_STATES:
+            return query_execution, polls
+        sleep(delay)
+
+
+class AdaptivePollingCursor(BaseAthenaCursor):
+    """
+    PyAthena cursor polling query executions with exponential backoff.
+
+    The delays are set on subclasses created by create_athena_engine.
+    """
+
+    poll_initial_delay = 0.1
+    poll_max_delay = 0.5
+    poll_backoff = 1.5
+
+    def _poll(self, query_id):
+        start_time = time.perf_counter()
+        delays = poll_delays(
+            self.poll_initial_delay, self.poll_max_delay, self.poll_backoff
+        )
+        query_execution, polls = wait_for_query(
+            self._get_query_execution, query_id, delays
+        )
+        logger.info(
+            f"Athena query {query_id} {query_execution.state} after {polls} polls "
+            f"in {time.perf_counter() - start_time:.3f}s"
+        )
+        return query_execution
+
+
+def create_athena_engine(
+    region,
+    database,
+    s3_staging_dir,
+    result_reuse_minutes=60,
+    poll_initial_delay=0.1,
+    poll_max_delay=0.5,
+    poll_backoff=1.5,
+    pool_size=2,
+):
+    """
+    Creates the SQL Alchemy engine of an Athena database.
+
+    Args:
+        region (str): AWS region.
+        database (str): Glue database.
+        s3_staging_dir (str): S3 uri of the query results.
+        result_reuse_minutes (int): Maximum age of the reused query results,
+            0 disables result reuse.
+        poll_initial_delay (float): First delay between polls in seconds.
+        poll_max_delay (float): Largest delay between polls in seconds.
+        poll_backoff (float): Growth factor of the delay between polls.
+        pool_size (int): Number of pooled connections.
+
+    Returns:
+        engine (sqlalchemy.engine.base.Engine): SQL Alchemy engine.
+    """
+    cursor_class = type(
+        "AdaptivePollingCursor",
+        (AdaptivePollingCursor,),
+        {
+            "__module__": __name__,
+            "poll_initial_delay": poll_initial_delay,
+            "poll_max_delay": poll_max_delay,
+            "poll_backoff": poll_backoff,
+        },
+    )
+    connect_args = {"cursor_class": cursor_class}
+    if result_reuse_minutes > 0:
+        connect_args.update(
+            {"result_reuse_enable": True, "result_reuse_minutes": result_reuse_minutes}
+        )
+
+    conn_url = (
+        f"{ATHENA_DIALECT}://athena.{region}.amazonaws.com/{database}"
+        f"?s3_staging_dir={s3_staging_dir}"
+    )
+    logger.info(f"Connecting to Athena with {ATHENA_DIALECT}")
+    # Athena connections are stateless, a pre-ping would run a query
+    return create_engine(
+        conn_url,
+        connect_args=connect_args,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        pool_pre_ping=False,
+    )
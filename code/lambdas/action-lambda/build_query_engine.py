@@ -1,17 +1,51 @@
-from sqlalchemy import create_engine
-from llama_index.core.objects import ObjectIndex, SQLTableNodeMapping, SQLTableSchema
-from llama_index.core.indices.struct_store import SQLTableRetrieverQueryEngine
-from llama_index.core import VectorStoreIndex
 from llama_index.core import SQLDatabase
 from llama_index.core import ServiceContext
-from llama_index.embeddings.bedrock import BedrockEmbedding
 from llama_index.core.prompts import Prompt
 from connections import Connections
-from prompt_templates import SQL_TEMPLATE_STR, RESPONSE_TEMPLATE_STR, table_details
+from prompt_templates import (
+    SQL_TEMPLATE_STR,
+    RESPONSE_TEMPLATE_STR,
+    column_details,
+    table_details,
+    table_key_columns,
+)
 from llama_index.core.schema import TextNode
 from llama_index.core.prompts import PromptTemplate
-import csv
+from llama_index.llms.bedrock.utils import STREAMING_MODELS
+from few_shot_artifact import load_few_shot_artifact, read_few_shot_examples, node_text
+from few_shot_store import FewShotStoreRetriever, load_few_shot_store
+from hot_reload import (
+    EXAMPLES_FILE,
+    PROMPTS_FILE,
+    HotReloadPoller,
+    S3ObjectWatcher,
+    parse_prompt_config,
+)
+from sql_cache import create_sql_cache
+from embedding_cache import create_embedding_cache
+from result_cache import GlueTableVersions, SQLResultCache
+from local_sql import load_local_sql_database
+from athena_execution import create_athena_engine
+from sql_query_engine import TextToSQLQueryEngine
+from vector_retriever import NumpyVectorRetriever
+from column_retriever import build_column_retriever
+from model_router import ModelRouter
+from profiler import ProfileTokenHandler, stage
+from fast_path import FAST_PATH_TABLE, answer_question
+from instance_names import INSTANCE_NAME_TABLE, load_instance_name_index
+from schema_snapshot import (
+    SnapshotSQLDatabase,
+    build_table_retriever,
+    get_glue_table_versions,
+    load_schema_snapshot,
+    save_schema_snapshot,
+    start_background_refresh,
+    take_schema_snapshot,
+)
 import json
+import os
+import threading
+import time
 
 import logging
 
@@ -30,51 +64,72 @@ def create_sql_engine():
     Returns:
         engine (sqlalchemy.engine.base.Engine): SQL Alchemy engine.
     """
-    s3_staging_dir = Connections.athena_bucket_name
-    region = Connections.region_name
-    database = Connections.text2sql_database
-    # Construct the connection string
-    conn_url = f"awsathena+rest://athena.{region}.amazonaws.com/{database}?s3_staging_dir=s3://{s3_staging_dir}"
-    # Create an SQLAlchemy engine
-    engine = create_engine(conn_url)
-    return engine
+    return create_athena_engine(
+        Connections.region_name,
+        Connections.text2sql_database,
+        f"s3://{Connections.athena_bucket_name}",
+        result_reuse_minutes=Connections.athena_result_reuse_minutes,
+        poll_initial_delay=Connections.athena_poll_initial_delay,
+        poll_max_delay=Connections.athena_poll_max_delay,
+        pool_size=Connections.athena_pool_size,
+    )
 
 
-def get_few_shot_retriever(FEWSHOT_EXAMPLES_PATH):
+def get_few_shot_retriever(FEWSHOT_EXAMPLES_PATH, embed_model):
     """
-    Creates a fewshot retriever from a csv file.
+    Creates a fewshot retriever, from the few-shot store or from a csv file.
+
+    Uses the few-shot store when one is found under FEWSHOT_STORE_PREFIX in the
+    Athena bucket or at FEWSHOT_STORE_PATH. Otherwise uses the precomputed
+    embedding artifact when it matches the csv content, and falls back to
+    embedding every example through Bedrock.
 
     Args:
         FEWSHOT_EXAMPLES_PATH (str): Path to fewshot examples csv file.
+        embed_model (BaseEmbedding): Embedding model for the questions.
 
     Returns:
-        few_shot_retriever (VectorStoreIndex): VectorStoreIndex with fewshot examples.
-        data_dict (dict): Dictionary with fewshot examples.
-    """
-    with open(FEWSHOT_EXAMPLES_PATH, newline="", encoding="utf-8-sig") as csvfile:
-        # with StringIO(file_content) as file_like_object:
-        reader = csv.DictReader(csvfile)
-        data, data_dict, few_shot_nodes = [], {}, []
-        data, data_dict, few_shot_nodes = [], {}, []
-        for row in reader:
-            data.append(row["example_input_question"])
-            data_dict[row["example_input_question"]] = row
-            few_shot_nodes.append(
-                TextNode(text=json.dumps(row["example_input_question"]))
+        few_shot_retriever (BaseRetriever): Retriever over the fewshot examples.
+        data_dict (dict): Dictionary with fewshot examples, empty for the store
+            whose nodes hold their example in metadata["example"].
+    """
+    store = load_few_shot_store(
+        Connections.fewshot_store_path,
+        Connections.embed_model_name,
+        nprobe=Connections.fewshot_store_nprobe,
+        s3_location=(
+            (
+                Connections.s3_client,
+                Connections.athena_bucket_name,
+                Connections.fewshot_store_prefix,
             )
-
-    embed_model = BedrockEmbedding(
-        client=Connections.bedrock_client, model_name="amazon.titan-embed-text-v1"
+            if Connections.fewshot_store_prefix
+            else None
+        ),
     )
-
-    few_shot_service_context = ServiceContext.from_defaults(
-        embed_model=embed_model, llm=None
-    )
-
-    few_shot_index = VectorStoreIndex(
-        few_shot_nodes, service_context=few_shot_service_context
+    if store is not None:
+        logger.info(f"Loaded few-shot store with {len(store)} examples")
+        return FewShotStoreRetriever(store, embed_model, similarity_top_k=2), {}
+
+    artifact = load_few_shot_artifact(
+        FEWSHOT_EXAMPLES_PATH,
+        Connections.fewshot_embeddings_path,
+        Connections.embed_model_name,
     )
-    few_shot_retriever = few_shot_index.as_retriever(similarity_top_k=2)
+    if artifact is not None:
+        embeddings, data_dict = artifact
+        logger.info(f"Loaded {len(data_dict)} precomputed few-shot embeddings")
+        few_shot_nodes = [TextNode(text=node_text(question)) for question in data_dict]
+        few_shot_retriever = NumpyVectorRetriever(
+            few_shot_nodes, embeddings, embed_model, similarity_top_k=2
+        )
+    else:
+        logger.info("Embedding few-shot examples with Bedrock")
+        data_dict = read_few_shot_examples(FEWSHOT_EXAMPLES_PATH)
+        few_shot_nodes = [TextNode(text=node_text(question)) for question in data_dict]
+        few_shot_retriever = NumpyVectorRetriever.from_nodes(
+            few_shot_nodes, embed_model, similarity_top_k=2
+        )
     return few_shot_retriever, data_dict
 
 
@@ -89,13 +144,15 @@ def few_shot_examples_fn(**kwargs):
         example_set (str): Example set.
     """
     question = kwargs["query_str"]
-    retrieved_nodes = few_shot_retriever.retrieve(question)
+    few_shot_retriever, data_dict = get_few_shot_examples()
+    with stage("few_shot_retrieval"):
+        retrieved_nodes = few_shot_retriever.retrieve(question)
     result_strs = []
     example_set = "No example set provided"
     for n in retrieved_nodes:
         logger.info(f"Few shots node:\n {n}")
         content = json.loads(n.get_content())
-        raw_dict = data_dict[content]
+        raw_dict = n.node.metadata.get("example") or data_dict[content]
         example = [f"{k.capitalize()}: {raw_dict[k]}" for k in raw_dict.keys()]
 
         result_str = "\n".join(example)
@@ -107,74 +164,653 @@ def few_shot_examples_fn(**kwargs):
     return example_set
 
 
-few_shot_retriever, data_dict = get_few_shot_retriever(
-    Connections.fewshot_examples_path
-)
+def make_sql_prompt(template):
+    """Creates the text-to-SQL prompt, with its fewshot examples function."""
+    return PromptTemplate(
+        template,
+        function_mappings={
+            "few_shot_examples": few_shot_examples_fn,
+        },
+    )
 
-SQL_PROMPT = PromptTemplate(
-    SQL_TEMPLATE_STR,
-    function_mappings={
-        "few_shot_examples": few_shot_examples_fn,
-    },
-)
+
+SQL_PROMPT = make_sql_prompt(SQL_TEMPLATE_STR)
 
 RESPONSE_PROMPT = Prompt(RESPONSE_TEMPLATE_STR)
 
+# Prompt templates, table descriptions and fewshot examples baked into the image
+DEFAULT_PROMPT_CONFIG = {
+    "sql_template": SQL_TEMPLATE_STR,
+    "response_template": RESPONSE_TEMPLATE_STR,
+    "table_details": table_details,
+}
 
-def create_query_engine(
-    model_name="ClaudeInstant", SQL_PROMPT=SQL_PROMPT, RESPONSE_PROMPT=RESPONSE_PROMPT
-):
-    """Generates a query engine and object index fo answering questions using SQL retrieval.
+# The ones in use, replaced by hot reloads from S3
+_prompt_config = {
+    **DEFAULT_PROMPT_CONFIG,
+    "fewshot_examples_path": Connections.fewshot_examples_path,
+}
+
+WARMUP_QUESTION = "Which instance has the most memory?"
+
+
+def load_sql_database(engine, embed_model, use_snapshot=True):
+    """
+    Creates the SQL database object, from the schema snapshot when one is available.
+
+    Without a usable snapshot, the database is reflected from Athena and a new
+    snapshot is taken and stored in S3.
 
     Args:
-        model_name (str): Model to use. Defaults to "ClaudeInstant".
-        SQL_PROMPT (PromptTemplate): Prompt for generating SQL. Defaults to SQL_PROMPT.
-        RESPONSE_PROMPT (Prompt): Prompt for generating final response. Defaults to RESPONSE_PROMPT.
+        engine (sqlalchemy.engine.base.Engine): SQL Alchemy engine.
+        embed_model (BaseEmbedding): Embedding model for the table nodes.
+        use_snapshot (bool): Whether to load an existing snapshot. Defaults to True.
 
     Returns:
-        query_engine (SQLTableRetrieverQueryEngine): SQLTableRetrieverQueryEngine object.
-        obj_index (ObjectIndex): ObjectIndex object.
+        sql_database (SQLDatabase): SQL database object.
+        schema_snapshot (dict): Schema snapshot matching the database object.
     """
-    # create sql database object
-    engine = create_sql_engine()
+    if use_snapshot:
+        schema_snapshot = load_schema_snapshot(
+            Connections.schema_snapshot_path,
+            Connections.s3_client,
+            Connections.athena_bucket_name,
+            Connections.schema_snapshot_key,
+            Connections.embed_model_name,
+        )
+        if schema_snapshot is not None:
+            return SnapshotSQLDatabase(engine, schema_snapshot), schema_snapshot
+
+    glue_versions = get_glue_table_versions(
+        Connections.glue_client, Connections.text2sql_database
+    )
     sql_database = SQLDatabase(engine, sample_rows_in_table_info=2)
+    schema_snapshot = take_schema_snapshot(
+        sql_database,
+        _prompt_config["table_details"],
+        embed_model,
+        glue_versions,
+        column_details,
+    )
+    save_schema_snapshot(
+        schema_snapshot,
+        Connections.s3_client,
+        Connections.athena_bucket_name,
+        Connections.schema_snapshot_key,
+    )
+    return sql_database, schema_snapshot
+
+
+# Components are built on first use, once per container, and shared by all
+# invocations. The lock is re-entrant since components build their dependencies.
+_components = {}
+_components_lock = threading.RLock()
+_MISSING = object()
+init_timings = {}
+
+
+def get_component(name, build_fn):
+    """
+    Gets a component, building it on first use.
+
+    Args:
+        name (str): Name of the component.
+        build_fn (callable): Function building the component.
+
+    Returns:
+        Any: The component.
+    """
+    # a single read, as a refresh can drop the component between two
+    component = _components.get(name, _MISSING)
+    if component is not _MISSING:
+        return component
+    with _components_lock:
+        if name not in _components:
+            start = time.perf_counter()
+            _components[name] = build_fn()
+            init_timings[name] = time.perf_counter() - start
+            logger.info(f"Initialized {name} in {init_timings[name]:.3f}s")
+        return _components[name]
+
+
+def get_embed_model():
+    """Gets the shared Bedrock embedding model, behind the embedding cache."""
+
+    def build():
+        embed_model = Connections.get_bedrock_embedding()
+        if not Connections.embedding_cache_enabled:
+            return embed_model
+        return create_embedding_cache(
+            embed_model,
+            Connections.embedding_cache_path,
+            Connections.embedding_cache_max_entries,
+            Connections.embedding_cache_backend,
+            s3_location=(
+                Connections.s3_client,
+                Connections.athena_bucket_name,
+                Connections.embedding_cache_prefix,
+            ),
+            table=(
+                Connections.get_dynamodb_table(Connections.embedding_cache_table)
+                if Connections.embedding_cache_backend == "dynamodb"
+                else None
+            ),
+        )
+
+    return get_component("embed_model", build)
+
+
+def embedding_cache_stats():
+    """Hit rates of the embedding cache, None when disabled."""
+    embed_model = get_embed_model()
+    return embed_model.stats() if hasattr(embed_model, "stats") else None
+
 
-    embed_model = BedrockEmbedding(
-        client=Connections.bedrock_client, model_name="amazon.titan-embed-text-v1"
+def get_few_shot_examples():
+    """Gets the fewshot retriever and the fewshot examples dictionary."""
+    return get_component(
+        "few_shot_retriever",
+        lambda: get_few_shot_retriever(
+            _prompt_config["fewshot_examples_path"], get_embed_model()
+        ),
     )
 
-    # initialize llm
-    llm = Connections.get_bedrock_llm(model_name=model_name, max_tokens=1024)
 
-    # initialize service context
-    service_context = ServiceContext.from_defaults(llm=llm, embed_model=embed_model)
+def get_llm(model_name="ClaudeInstant"):
+    """Gets the Bedrock LLM for a model name, counting its tokens when profiling."""
+
+    def build():
+        llm = Connections.get_bedrock_llm(model_name=model_name, max_tokens=1024)
+        if Connections.profiling_enabled:
+            llm.callback_manager.add_handler(ProfileTokenHandler())
+        return llm
+
+    return get_component(f"llm_{model_name}", build)
+
+
+def few_shot_score(question):
+    """Similarity of the closest fewshot example of a question."""
+    few_shot_retriever, _ = get_few_shot_examples()
+    with stage("few_shot_retrieval"):
+        retrieved_nodes = few_shot_retriever.retrieve(question)
+    return retrieved_nodes[0].score if retrieved_nodes else None
+
 
-    table_node_mapping = SQLTableNodeMapping(sql_database)
-    table_schema_objs = []
-    tables = list(sql_database._all_tables)
-    for table in tables:
-        table_schema_objs.append(
-            (SQLTableSchema(table_name=table, context_str=table_details[table]))
+def get_model_router():
+    """Gets the router choosing the model generating the SQL, None if disabled."""
+
+    def build():
+        if not Connections.model_routing_enabled:
+            return None
+        return ModelRouter(
+            Connections.router_fast_model,
+            Connections.router_strong_model,
+            get_llm,
+            threshold=Connections.router_complexity_threshold,
+            few_shot_threshold=Connections.router_few_shot_threshold,
+            escalate=Connections.router_escalate,
+            few_shot_score_fn=few_shot_score,
         )
 
-    obj_index = ObjectIndex.from_objects(
-        table_schema_objs,
-        table_node_mapping,
-        VectorStoreIndex,
-        service_context=service_context,
+    return get_component("model_router", build)
+
+
+def get_prompts():
+    """Gets the text-to-SQL and response synthesis prompts in use."""
+    return get_component(
+        "prompts",
+        lambda: (
+            make_sql_prompt(_prompt_config["sql_template"]),
+            Prompt(_prompt_config["response_template"]),
+        ),
+    )
+
+
+def get_sql_engine():
+    """Gets the Athena engine, whose connections are pooled across invocations."""
+    return get_component("sql_engine", create_sql_engine)
+
+
+def _build_sql_database():
+    """Builds the SQL database object and starts the schema snapshot refresh."""
+    sql_database, schema_snapshot = load_sql_database(
+        get_sql_engine(), get_embed_model()
+    )
+    start_background_refresh(
+        schema_snapshot,
+        Connections.glue_client,
+        Connections.text2sql_database,
+        refresh_query_engine,
+        Connections.schema_refresh_interval,
     )
+    return sql_database, schema_snapshot
+
+
+def get_sql_database():
+    """Gets the SQL database object and its schema snapshot."""
+    return get_component("sql_database", _build_sql_database)
+
+
+def get_table_retriever():
+    """Gets the retriever of the table schemas."""
+
+    def build():
+        sql_database, schema_snapshot = get_sql_database()
+        return build_table_retriever(
+            sql_database,
+            schema_snapshot,
+            _prompt_config["table_details"],
+            get_embed_model(),
+            similarity_top_k=5,
+        )
+
+    return get_component("table_retriever", build)
+
+
+def get_column_retriever():
+    """Gets the retriever of the relevant columns, None when disabled."""
+
+    def build():
+        if not Connections.column_retrieval_enabled:
+            return None
+        sql_database, schema_snapshot = get_sql_database()
+        return build_column_retriever(
+            sql_database,
+            schema_snapshot,
+            column_details,
+            table_key_columns,
+            get_embed_model(),
+            similarity_top_k=Connections.column_top_k,
+        )
+
+    return get_component("column_retriever", build)
+
+
+def get_sql_cache():
+    """Gets the semantic question -> SQL cache, None when disabled."""
+
+    def build():
+        return create_sql_cache(
+            get_embed_model(),
+            Connections.sql_cache_backend,
+            Connections.sql_cache_path,
+            (
+                Connections.get_dynamodb_table(Connections.sql_cache_table)
+                if Connections.sql_cache_backend == "dynamodb"
+                else None
+            ),
+            Connections.sql_cache_threshold,
+            Connections.sql_cache_max_entries,
+            Connections.sql_cache_ttl,
+        )
+
+    return get_component("sql_cache", build)
+
+
+def get_result_cache():
+    """Gets the SQL result cache, None when disabled."""
+
+    def build():
+        if not Connections.result_cache_enabled:
+            return None
+        table_versions = GlueTableVersions(
+            Connections.glue_client,
+            Connections.text2sql_database,
+            Connections.result_cache_version_check_interval,
+        )
+        return SQLResultCache(
+            table_versions,
+            Connections.result_cache_max_entries,
+            Connections.result_cache_ttl,
+        )
+
+    return get_component("result_cache", build)
+
 
-    query_engine = SQLTableRetrieverQueryEngine(
+def get_local_sql_database():
+    """Gets the in-memory SQLite copy of the tables, None when disabled."""
+
+    def build():
+        if not Connections.local_sql_enabled:
+            return None
+        try:
+            return load_local_sql_database(
+                Connections.glue_client,
+                Connections.s3_client,
+                Connections.text2sql_database,
+                Connections.local_sql_max_bytes,
+            )
+        except Exception as e:
+            logger.warning(f"Could not load tables into SQLite, using Athena: {e}")
+            return None
+
+    return get_component("local_sql_database", build)
+
+
+def get_instance_name_index():
+    """Gets the index resolving instance mentions, None when unavailable."""
+
+    def build():
+        sql_database, _ = get_sql_database()
+        local_sql_database = get_local_sql_database()
+        if local_sql_database is not None and local_sql_database.can_run(
+            f"SELECT instance_name FROM {INSTANCE_NAME_TABLE}"
+        ):
+            sql_database = local_sql_database
+        try:
+            return load_instance_name_index(sql_database, INSTANCE_NAME_TABLE)
+        except Exception as e:
+            logger.warning(f"Could not build the instance name index: {e}")
+            return None
+
+    return get_component("instance_name_index", build)
+
+
+def create_query_engine(
+    model_name="ClaudeInstant", SQL_PROMPT=None, RESPONSE_PROMPT=None
+):
+    """Generates a query engine and table retriever fo answering questions using SQL retrieval.
+
+    Args:
+        model_name (str): Model to use. Defaults to "ClaudeInstant".
+        SQL_PROMPT (PromptTemplate): Prompt for generating SQL. Defaults to the prompt in use.
+        RESPONSE_PROMPT (Prompt): Prompt for generating final response. Defaults to the prompt in use.
+
+    Returns:
+        query_engine (TextToSQLQueryEngine): TextToSQLQueryEngine object.
+        table_retriever (ObjectRetriever): Retriever of the table schemas.
+    """
+    sql_prompt, response_prompt = get_prompts()
+    SQL_PROMPT = SQL_PROMPT or sql_prompt
+    RESPONSE_PROMPT = RESPONSE_PROMPT or response_prompt
+    sql_database, _ = get_sql_database()
+    table_retriever = get_table_retriever()
+    llm = get_llm(model_name)
+
+    # initialize service context, keeping the callbacks of the LLM, e.g. the
+    # token counts of the profiler
+    service_context = ServiceContext.from_defaults(
+        llm=llm, embed_model=get_embed_model(), callback_manager=llm.callback_manager
+    )
+
+    query_engine = TextToSQLQueryEngine(
         sql_database,
-        obj_index.as_retriever(similarity_top_k=5),
+        table_retriever,
         service_context=service_context,
         text_to_sql_prompt=SQL_PROMPT,
         response_synthesis_prompt=RESPONSE_PROMPT,
+        sql_cache=get_sql_cache(),
+        result_cache=get_result_cache(),
+        local_sql_database=get_local_sql_database(),
+        instance_name_index=get_instance_name_index(),
+        column_retriever=get_column_retriever(),
+        model_router=get_model_router(),
+        streaming=llm.model in STREAMING_MODELS,
+        synthesis_mode=Connections.synthesis_mode,
+        template_max_rows=Connections.template_max_rows,
     )
     prompts_dict = query_engine.get_prompts()
     logger.info(f"prompts_dict{prompts_dict}")
 
-    return query_engine, obj_index
+    return query_engine, table_retriever
+
+
+def get_query_engine():
+    """Gets the text-to-SQL query engine."""
+    query_engine, _ = get_component("query_engine", create_query_engine)
+    return query_engine
 
 
-query_engine, obj_index = create_query_engine()
+def get_fast_path_columns():
+    """Gets the columns of the table answered by the fast path."""
+
+    def build():
+        sql_database, _ = get_sql_database()
+        if FAST_PATH_TABLE not in sql_database.get_usable_table_names():
+            return set()
+        return {
+            column["name"].lower()
+            for column in sql_database.get_table_columns(FAST_PATH_TABLE)
+        }
+
+    return get_component("fast_path_columns", build)
+
+
+def answer_with_fast_path(question):
+    """
+    Answers simple pricing lookups and comparisons without calling the LLM.
+
+    Args:
+        question (str): User question.
+
+    Returns:
+        dict: "answer", "sql_query" and "metadata", or None when the question
+            must go through the query engine.
+    """
+    if not Connections.fast_path_enabled:
+        return None
+    try:
+        sql_retriever = get_query_engine().sql_retriever
+        question, entities = sql_retriever.resolve_instance_names(question)
+        fast_answer = answer_question(
+            question, sql_retriever, get_fast_path_columns()
+        )
+        if fast_answer is not None and entities is not None:
+            fast_answer["metadata"]["instance_names"] = entities
+        return fast_answer
+    except Exception as e:
+        logger.warning(f"Fast path failed, using the query engine: {e}")
+        return None
+
+
+def refresh_query_engine():
+    """
+    Rebuilds the SQL database from a fresh reflection, and drops the components
+    depending on it so they are rebuilt on next use.
+
+    Args:
+        None
+
+    Returns:
+        schema_snapshot (dict): The new schema snapshot.
+    """
+    sql_database, schema_snapshot = load_sql_database(
+        get_sql_engine(), get_embed_model(), use_snapshot=False
+    )
+    with _components_lock:
+        _components["sql_database"] = (sql_database, schema_snapshot)
+        _components.pop("table_retriever", None)
+        _components.pop("column_retriever", None)
+        _components.pop("local_sql_database", None)
+        _components.pop("fast_path_columns", None)
+        _components.pop("instance_name_index", None)
+        _components.pop("query_engine", None)
+    return schema_snapshot
+
+
+def get_hot_reload_poller():
+    """Gets the poller of the S3 prompt location, None when disabled."""
+
+    def build():
+        if not Connections.hot_reload_prefix:
+            return None
+        files = {"prompts": PROMPTS_FILE, "examples": EXAMPLES_FILE}
+        watchers = {
+            name: S3ObjectWatcher(
+                Connections.s3_client,
+                Connections.athena_bucket_name,
+                f"{Connections.hot_reload_prefix}{file_name}",
+            )
+            for name, file_name in files.items()
+        }
+        few_shot_retriever, _ = get_few_shot_examples()
+        if isinstance(few_shot_retriever, FewShotStoreRetriever):
+            watchers["few_shot_store"] = S3ObjectWatcher(
+                Connections.s3_client,
+                Connections.athena_bucket_name,
+                f"{Connections.fewshot_store_prefix}manifest.json",
+                etag=few_shot_retriever.store.etag,
+            )
+        return HotReloadPoller(watchers, Connections.hot_reload_interval)
+
+    return get_component("hot_reload_poller", build)
+
+
+def apply_prompt_config(config):
+    """
+    Swaps in new prompt templates and table descriptions.
+
+    The new prompts, and the table retriever when the table descriptions
+    changed, are built before the swap. The query engine is rebuilt on next use
+    from the cached components.
+
+    Args:
+        config (dict): "sql_template", "response_template" and "table_details".
+    """
+    prompts = (
+        make_sql_prompt(config["sql_template"]),
+        Prompt(config["response_template"]),
+    )
+    table_details_changed = config["table_details"] != _prompt_config["table_details"]
+    table_retriever = None
+    if table_details_changed and "table_retriever" in _components:
+        sql_database, schema_snapshot = get_sql_database()
+        table_retriever = build_table_retriever(
+            sql_database,
+            schema_snapshot,
+            config["table_details"],
+            get_embed_model(),
+            similarity_top_k=5,
+        )
+    with _components_lock:
+        _prompt_config.update(config)
+        _components["prompts"] = prompts
+        if table_retriever is not None:
+            _components["table_retriever"] = table_retriever
+        elif table_details_changed:
+            _components.pop("table_retriever", None)
+        _components.pop("query_engine", None)
+
+
+def apply_few_shot_examples(content):
+    """
+    Swaps in new fewshot examples, embedding only the new questions.
+
+    Args:
+        content (bytes): Content of the fewshot examples csv file.
+    """
+    path = Connections.hot_reload_examples_path
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+    data_dict = read_few_shot_examples(path)
+
+    current = _components.get("few_shot_retriever")
+    few_shot_examples = None
+    if current is not None and isinstance(current[0], NumpyVectorRetriever):
+        few_shot_retriever, embedded = current[0].updated(
+            [TextNode(text=node_text(question)) for question in data_dict]
+        )
+        few_shot_examples = (few_shot_retriever, data_dict)
+        logger.info(
+            f"Reloaded {len(data_dict)} few-shot examples, embedded {embedded}"
+        )
+    with _components_lock:
+        _prompt_config["fewshot_examples_path"] = path
+        if few_shot_examples is not None:
+            _components["few_shot_retriever"] = few_shot_examples
+        elif current is not None and not isinstance(
+            current[0], FewShotStoreRetriever
+        ):
+            # the few-shot store, when used, takes precedence over the csv
+            _components.pop("few_shot_retriever", None)
+
+
+def reload_few_shot_store():
+    """Swaps in the few-shot store updated in S3."""
+    store = load_few_shot_store(
+        Connections.fewshot_store_path,
+        Connections.embed_model_name,
+        nprobe=Connections.fewshot_store_nprobe,
+        s3_location=(
+            Connections.s3_client,
+            Connections.athena_bucket_name,
+            Connections.fewshot_store_prefix,
+        ),
+    )
+    if store is None:
+        return
+    with _components_lock:
+        current = _components.get("few_shot_retriever")
+        _components["few_shot_retriever"] = (
+            FewShotStoreRetriever(store, get_embed_model(), similarity_top_k=2),
+            {},
+        )
+    if current is not None and isinstance(current[0], FewShotStoreRetriever):
+        current[0].store.close()
+    logger.info(f"Reloaded few-shot store with {len(store)} examples")
+
+
+def reload_prompt_config():
+    """
+    Swaps in the prompts, table descriptions and fewshot examples changed in the
+    S3 prompt location since the last poll.
+
+    Args:
+        None
+
+    Returns:
+        list: Names of the reloaded objects.
+    """
+    poller = get_hot_reload_poller()
+    if poller is None:
+        return []
+    start = time.perf_counter()
+    changes = poller.poll()
+    if "prompts" in changes:
+        try:
+            apply_prompt_config(
+                parse_prompt_config(changes["prompts"], DEFAULT_PROMPT_CONFIG)
+            )
+        except ValueError as e:
+            logger.warning(f"Ignoring invalid {PROMPTS_FILE}: {e}")
+    if "examples" in changes:
+        apply_few_shot_examples(changes["examples"])
+    if "few_shot_store" in changes:
+        reload_few_shot_store()
+    if changes:
+        logger.info(
+            f"Hot reloaded {sorted(changes)} in {time.perf_counter() - start:.3f}s"
+        )
+    return sorted(changes)
+
+
+def warm_up(question=WARMUP_QUESTION):
+    """
+    Builds every component and primes the HTTP connections with a canned question.
+
+    Args:
+        question (str): Question run through the query engine.
+
+    Returns:
+        dict: Initialization time of each component, and of the canned question.
+    """
+    get_few_shot_examples()
+    get_llm()
+    model_router = get_model_router()
+    if model_router is not None:
+        get_llm(model_router.fast_model)
+        get_llm(model_router.strong_model)
+    get_sql_database()
+    get_table_retriever()
+    get_column_retriever()
+    get_local_sql_database()
+    get_instance_name_index()
+    query_engine = get_query_engine()
+
+    start = time.perf_counter()
+    query_engine.query(question)
+    timings = dict(init_timings)
+    timings["warmup_query"] = time.perf_counter() - start
+    logger.info(f"Warm-up timings: {json.dumps(timings)}")
+    return timings
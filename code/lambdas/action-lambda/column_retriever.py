@@ -0,0 +1,216 @@
+"""
+column_retriever.py
+
+Column-level schema retrieval for the text-to-SQL prompt.
+
+Every column is indexed as a node holding its table, name, type and a short
+description, and embedded once. For a question, the columns of the retrieved
+tables are ranked by similarity, and the {schema} slot of the prompt only lists
+the top k columns of each table plus its key columns, in table order. Tables
+with no more columns than that keep their full schema.
+"""
+
+import logging
+
+from llama_index.core.schema import TextNode
+
+from vector_retriever import NumpyVectorRetriever, embed_nodes
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TABLE_INFO_TEMPLATE = "Table '{table_name}' has columns: {columns}, and foreign keys: ."
+
+
+def column_description(table, column, column_details):
+    """Description of a column, its name in words when none is configured."""
+    description = column_details.get(table, {}).get(column["name"])
+    return description or column["name"].replace("_", " ")
+
+
+def column_node_text(table, column, description):
+    """Text embedded for a column, e.g. "ec2_pricing.storage_gb (DOUBLE): ..."."""
+    return f"{table}.{column['name']} ({column['type']}): {description}"
+
+
+def column_nodes(sql_database, column_details):
+    """
+    Creates one node per column of the usable tables.
+
+    Args:
+        sql_database (SQLDatabase): SQL database object.
+        column_details (dict): Table name -> column name -> description.
+
+    Returns:
+        list: TextNode objects with "table", "column", "type", "description"
+            and "position" metadata.
+    """
+    nodes = []
+    for table in sorted(sql_database.get_usable_table_names()):
+        for position, column in enumerate(sql_database.get_table_columns(table)):
+            description = column_description(table, column, column_details)
+            nodes.append(
+                TextNode(
+                    text=column_node_text(table, column, description),
+                    metadata={
+                        "table": table,
+                        "column": column["name"],
+                        "type": str(column["type"]),
+                        "description": description,
+                        "position": position,
+                    },
+                    excluded_embed_metadata_keys=[
+                        "table",
+                        "column",
+                        "type",
+                        "description",
+                        "position",
+                    ],
+                )
+            )
+    return nodes
+
+
+class ColumnSchemaRetriever:
+    """
+    Builds the schema of the text-to-SQL prompt from the relevant columns.
+
+    Args:
+        nodes (list): Column nodes, see column_nodes.
+        embeddings (numpy.ndarray): Column embeddings, one row per node.
+        embed_model (BaseEmbedding): Embedding model for the questions.
+        similarity_top_k (int): Number of columns kept per table.
+        key_columns (dict): Table name -> columns always kept, e.g. the ones
+            identifying the rows.
+    """
+
+    def __init__(
+        self, nodes, embeddings, embed_model, similarity_top_k=8, key_columns=None
+    ):
+        self._retriever = NumpyVectorRetriever(
+            nodes, embeddings, embed_model, similarity_top_k=len(nodes)
+        )
+        self._similarity_top_k = similarity_top_k
+        self._key_columns = key_columns or {}
+        self._table_columns = {}
+        for node in nodes:
+            self._table_columns.setdefault(node.metadata["table"], []).append(node)
+
+    def retrieve_columns(self, query_bundle, tables):
+        """
+        Retrieves the relevant columns of some tables.
+
+        Args:
+            query_bundle (QueryBundle): User question.
+            tables (list): Names of the tables in the prompt.
+
+        Returns:
+            dict: Table name -> column nodes kept, in table order.
+        """
+        tables = [table for table in tables if table in self._table_columns]
+        ranked = self._retriever.retrieve(query_bundle)
+        selected = {}
+        for table in tables:
+            columns = self._table_columns[table]
+            keys = set(self._key_columns.get(table, []))
+            if len(columns) <= self._similarity_top_k + len(keys):
+                selected[table] = columns
+                continue
+            top = [n.node for n in ranked if n.node.metadata["table"] == table]
+            top = top[: self._similarity_top_k]
+            kept = {node.metadata["column"] for node in top} | keys
+            selected[table] = [
+                node for node in columns if node.metadata["column"] in kept
+            ]
+        return selected
+
+    def get_table_context(
+        self, query_bundle, table_schema_objs, context_str_prefix=None
+    ):
+        """
+        Gets the schema string of the prompt, as SQLDatabase formats it.
+
+        Args:
+            query_bundle (QueryBundle): User question.
+            table_schema_objs (list): SQLTableSchema objects of the retrieved
+                tables.
+            context_str_prefix (str): Prefix of the schema string.
+
+        Returns:
+            str: Schema of the relevant columns and table descriptions.
+        """
+        selected = self.retrieve_columns(
+            query_bundle, [obj.table_name for obj in table_schema_objs]
+        )
+        context_strs = [context_str_prefix] if context_str_prefix is not None else []
+        for obj in table_schema_objs:
+            if obj.table_name not in selected:
+                continue
+            columns = ", ".join(
+                f"{node.metadata['column']} ({node.metadata['type']}): "
+                f"'{node.metadata['description']}'"
+                for node in selected[obj.table_name]
+            )
+            table_info = TABLE_INFO_TEMPLATE.format(
+                table_name=obj.table_name, columns=columns
+            )
+            if obj.context_str:
+                table_info += f" The table description is: {obj.context_str}"
+            context_strs.append(table_info)
+        logger.info(
+            "Columns in prompt: "
+            + ", ".join(
+                f"{table} {len(nodes)}/{len(self._table_columns[table])}"
+                for table, nodes in selected.items()
+            )
+        )
+        return "\n\n".join(context_strs)
+
+
+def build_column_retriever(
+    sql_database,
+    snapshot,
+    column_details,
+    key_columns,
+    embed_model,
+    similarity_top_k=8,
+):
+    """
+    Creates the column retriever, reusing snapshot embeddings where possible.
+
+    Args:
+        sql_database (SQLDatabase): SQL database object.
+        snapshot (dict): Schema snapshot.
+        column_details (dict): Table name -> column name -> description.
+        key_columns (dict): Table name -> columns always kept.
+        embed_model (BaseEmbedding): Embedding model.
+        similarity_top_k (int): Number of columns kept per table.
+
+    Returns:
+        ColumnSchemaRetriever: The retriever, None if there is no column.
+    """
+    nodes = column_nodes(sql_database, column_details)
+    if not nodes:
+        return None
+    embeddings, missing = [], []
+    for i, node in enumerate(nodes):
+        table_snapshot = snapshot["tables"].get(node.metadata["table"], {})
+        embedding = table_snapshot.get("column_embeddings", {}).get(node.text)
+        if embedding is None:
+            missing.append(i)
+        embeddings.append(embedding)
+
+    if missing:
+        logger.info(f"Embedding {len(missing)} column nodes")
+        new_embeddings = embed_nodes([nodes[i] for i in missing], embed_model)
+        for i, embedding in zip(missing, new_embeddings):
+            embeddings[i] = embedding
+
+    return ColumnSchemaRetriever(
+        nodes,
+        embeddings,
+        embed_model,
+        similarity_top_k=similarity_top_k,
+        key_columns=key_columns,
+    )
@@ -1,6 +1,7 @@
 import os
 import boto3
 from llama_index.llms.bedrock import Bedrock
+from llama_index.embeddings.bedrock import BedrockEmbedding
 
 
 class Connections:
@@ -9,9 +10,98 @@ class Connections:
     text2sql_database = os.environ["TEXT2SQL_DATABASE"]
     log_level = os.environ["LOG_LEVEL"]
     fewshot_examples_path = os.environ["FEWSHOT_EXAMPLES_PATH"]
+    fewshot_embeddings_path = os.environ.get(
+        "FEWSHOT_EMBEDDINGS_PATH", "few_shot_embeddings.npz"
+    )
+    fewshot_store_path = os.environ.get("FEWSHOT_STORE_PATH", "/tmp/few_shot_store")
+    fewshot_store_prefix = os.environ.get("FEWSHOT_STORE_PREFIX", "")
+    fewshot_store_nprobe = int(os.environ.get("FEWSHOT_STORE_NPROBE", "8"))
+    hot_reload_prefix = os.environ.get("HOT_RELOAD_PREFIX", "")
+    hot_reload_interval = int(os.environ.get("HOT_RELOAD_INTERVAL", "30"))
+    hot_reload_examples_path = os.environ.get(
+        "HOT_RELOAD_EXAMPLES_PATH", "/tmp/dynamic_examples.csv"
+    )
+    profiling_enabled = os.environ.get("PROFILING_ENABLED", "false") == "true"
+    metrics_namespace = os.environ.get("METRICS_NAMESPACE", "GenAIChatbot/ActionLambda")
+    embed_model_name = "amazon.titan-embed-text-v1"
+    embedding_cache_enabled = (
+        os.environ.get("EMBEDDING_CACHE_ENABLED", "true") == "true"
+    )
+    embedding_cache_max_entries = int(
+        os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "4096")
+    )
+    embedding_cache_path = os.environ.get(
+        "EMBEDDING_CACHE_PATH", "/tmp/embedding_cache"
+    )
+    embedding_cache_backend = os.environ.get("EMBEDDING_CACHE_BACKEND", "none")
+    embedding_cache_prefix = os.environ.get(
+        "EMBEDDING_CACHE_PREFIX", "embedding_cache/"
+    )
+    embedding_cache_table = os.environ.get("EMBEDDING_CACHE_TABLE", "")
+    schema_snapshot_path = os.environ.get(
+        "SCHEMA_SNAPSHOT_PATH", "schema_snapshot.json"
+    )
+    schema_snapshot_key = os.environ.get(
+        "SCHEMA_SNAPSHOT_KEY", "schema_snapshot/schema_snapshot.json"
+    )
+    schema_refresh_interval = int(os.environ.get("SCHEMA_REFRESH_INTERVAL", "300"))
+    column_retrieval_enabled = (
+        os.environ.get("COLUMN_RETRIEVAL_ENABLED", "true") == "true"
+    )
+    column_top_k = int(os.environ.get("COLUMN_TOP_K", "8"))
+    sql_cache_backend = os.environ.get("SQL_CACHE_BACKEND", "none")
+    sql_cache_threshold = float(os.environ.get("SQL_CACHE_THRESHOLD", "0.95"))
+    sql_cache_max_entries = int(os.environ.get("SQL_CACHE_MAX_ENTRIES", "1000"))
+    sql_cache_ttl = int(os.environ.get("SQL_CACHE_TTL", "86400"))
+    sql_cache_path = os.environ.get("SQL_CACHE_PATH", "/tmp/sql_cache.jsonl")
+    sql_cache_table = os.environ.get("SQL_CACHE_TABLE", "")
+    result_cache_enabled = os.environ.get("RESULT_CACHE_ENABLED", "true") == "true"
+    result_cache_max_entries = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "256"))
+    result_cache_ttl = int(os.environ.get("RESULT_CACHE_TTL", "3600"))
+    result_cache_version_check_interval = int(
+        os.environ.get("RESULT_CACHE_VERSION_CHECK_INTERVAL", "60")
+    )
+    athena_result_reuse_minutes = int(
+        os.environ.get("ATHENA_RESULT_REUSE_MINUTES", "60")
+    )
+    athena_poll_initial_delay = float(
+        os.environ.get("ATHENA_POLL_INITIAL_DELAY", "0.1")
+    )
+    athena_poll_max_delay = float(os.environ.get("ATHENA_POLL_MAX_DELAY", "0.5"))
+    athena_pool_size = int(os.environ.get("ATHENA_POOL_SIZE", "2"))
+    local_sql_enabled = os.environ.get("LOCAL_SQL_ENABLED", "true") == "true"
+    local_sql_max_bytes = int(os.environ.get("LOCAL_SQL_MAX_BYTES", "67108864"))
+    fast_path_enabled = os.environ.get("FAST_PATH_ENABLED", "true") == "true"
+    synthesis_mode = os.environ.get("SYNTHESIS_MODE", "auto")
+    template_max_rows = int(os.environ.get("TEMPLATE_MAX_ROWS", "10"))
+    model_routing_enabled = os.environ.get("MODEL_ROUTING_ENABLED", "true") == "true"
+    router_fast_model = os.environ.get("ROUTER_FAST_MODEL", "ClaudeInstant")
+    router_strong_model = os.environ.get("ROUTER_STRONG_MODEL", "Claude2")
+    router_complexity_threshold = float(
+        os.environ.get("ROUTER_COMPLEXITY_THRESHOLD", "2.0")
+    )
+    router_few_shot_threshold = float(
+        os.environ.get("ROUTER_FEW_SHOT_THRESHOLD", "0.8")
+    )
+    router_escalate = os.environ.get("ROUTER_ESCALATE", "true") == "true"
     s3_resource = boto3.resource("s3", region_name=region_name)
+    s3_client = boto3.client("s3", region_name=region_name)
+    glue_client = boto3.client("glue", region_name=region_name)
     bedrock_client = boto3.client("bedrock-runtime", region_name=region_name)
 
+    @staticmethod
+    def get_dynamodb_table(table_name):
+        return boto3.resource("dynamodb", region_name=Connections.region_name).Table(
+            table_name
+        )
+
+    @staticmethod
+    def get_bedrock_embedding():
+        return BedrockEmbedding(
+            client=Connections.bedrock_client,
+            model_name=Connections.embed_model_name,
+        )
+
     @staticmethod
     def get_bedrock_llm(model_name="ClaudeInstant", max_tokens=256):
         MODELID_MAPPING = {
@@ -0,0 +1,356 @@
+"""
+embedding_cache.py
+
+Content-addressed cache of Bedrock embeddings.
+
+Embeddings are keyed by the sha256 digest of the embedding model id, the kind of
+embedding (query or text) and the text, and looked up through layered stores:
+an in-process LRU, a directory under /tmp that survives warm restarts, then an
+optional store shared across containers and Lambdas, an S3 prefix or a DynamoDB
+table. Hits of a lower store are copied to the stores above it, and only the
+texts missing from every store are sent to Bedrock.
+
+Vectors are stored as raw float32 bytes.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, ClassVar, List
+
+import numpy as np
+from botocore.exceptions import ClientError
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from embedding_context import EMBED_MAX_WORKERS, embed_texts
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# DynamoDB BatchGetItem reads at most 100 items per request
+DYNAMODB_BATCH_SIZE = 100
+
+
+def embedding_key(model_name, kind, text):
+    """
+    Key of a cached embedding.
+
+    Args:
+        model_name (str): Embedding model id.
+        kind (str): "query" or "text".
+        text (str): Embedded text.
+
+    Returns:
+        str: Hex encoded sha256 digest.
+    """
+    content = "\0".join([model_name, kind, text])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def to_bytes(embedding):
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+class DiskEmbeddingStore:
+    """Store keeping one file per embedding in a directory, e.g. under /tmp."""
+
+    name = "disk"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.f32")
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            try:
+                with open(self._path(key), "rb") as f:
+                    found[key] = from_bytes(f.read())
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Could not read cached embedding {key}: {e}")
+        return found
+
+    def put_many(self, embeddings):
+        for key, embedding in embeddings.items():
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(to_bytes(embedding))
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write cached embedding {key}: {e}")
+
+
+class S3EmbeddingStore:
+    """Store keeping one object per embedding under an S3 prefix."""
+
+    name = "s3"
+
+    def __init__(self, s3_client, bucket, prefix, max_workers=EMBED_MAX_WORKERS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_workers = max_workers
+
+    def _get(self, key):
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=f"{self.prefix}{key}"
+            )
+            return from_bytes(response["Body"].read())
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                logger.warning(f"Could not read cached embedding {key}: {e}")
+            return None
+
+    def _put(self, item):
+        key, embedding = item
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=f"{self.prefix}{key}", Body=to_bytes(embedding)
+            )
+        except ClientError as e:
+            logger.warning(f"Could not store cached embedding {key}: {e}")
+
+    def _map(self, fn, items):
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fn, items))
+
+    def get_many(self, keys):
+        embeddings = self._map(self._get, keys)
+        return {
+            key: embedding
+            for key, embedding in zip(keys, embeddings)
+            if embedding is not None
+        }
+
+    def put_many(self, embeddings):
+        self._map(self._put, list(embeddings.items()))
+
+
+class DynamoDBEmbeddingStore:
+    """
+    Store keeping the embeddings in a DynamoDB table.
+
+    The table has a string partition key named "key", and the embedding in the
+    binary "embedding" attribute.
+    """
+
+    name = "dynamodb"
+
+    def __init__(self, table):
+        self.table = table
+
+    def get_many(self, keys):
+        found = {}
+        client = self.table.meta.client
+        for start in range(0, len(keys), DYNAMODB_BATCH_SIZE):
+            request = {
+                self.table.name: {
+                    "Keys": [
+                        {"key": {"S": key}}
+                        for key in keys[start : start + DYNAMODB_BATCH_SIZE]
+                    ]
+                }
+            }
+            try:
+                while request:
+                    response = client.batch_get_item(RequestItems=request)
+                    for item in response["Responses"].get(self.table.name, []):
+                        found[item["key"]["S"]] = from_bytes(item["embedding"]["B"])
+                    request = response.get("UnprocessedKeys")
+            except ClientError as e:
+                logger.warning(f"Could not read cached embeddings: {e}")
+        return found
+
+    def put_many(self, embeddings):
+        try:
+            with self.table.batch_writer() as batch:
+                for key, embedding in embeddings.items():
+                    batch.put_item(Item={"key": key, "embedding": to_bytes(embedding)})
+        except ClientError as e:
+            logger.warning(f"Could not store cached embeddings: {e}")
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model serving embeddings from layered caches before Bedrock.
+
+    Args:
+        embed_model (BaseEmbedding): Embedding model computing the misses.
+        stores (list): Stores looked up after the in-process LRU, in order,
+            e.g. a DiskEmbeddingStore then an S3EmbeddingStore.
+        max_entries (int): Maximum number of embeddings kept in process.
+    """
+
+    # embed_texts hands whole batches to get_text_embedding_batch, which
+    # embeds the misses concurrently
+    embeds_batches: ClassVar[bool] = True
+
+    embed_model: BaseEmbedding = Field(description="Embedding model of the misses.")
+    max_entries: int = Field(default=4096)
+
+    _lru: Any = PrivateAttr()
+    _stores: List[Any] = PrivateAttr()
+    _stats: Any = PrivateAttr()
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, embed_model, stores=None, max_entries=4096, **kwargs):
+        super().__init__(
+            embed_model=embed_model,
+            max_entries=max_entries,
+            model_name=embed_model.model_name,
+            # a single _get_text_embeddings call fetches all the misses at once
+            embed_batch_size=max(embed_model.embed_batch_size, 2048),
+            **kwargs,
+        )
+        self._lru = OrderedDict()
+        self._stores = list(stores or [])
+        self._stats = {"lru": 0, "misses": 0}
+        for store in self._stores:
+            self._stats[store.name] = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    def stats(self):
+        """Hits of every store, misses, and hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats["hit_rate"] = (
+            round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        )
+        return stats
+
+    def _remember(self, embeddings):
+        with self._lock:
+            for key, embedding in embeddings.items():
+                self._lru[key] = embedding
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _get_embeddings(self, kind, texts, embed_fn):
+        """
+        Gets the embeddings of texts, computing only the ones of no store.
+
+        Args:
+            kind (str): "query" or "text".
+            texts (list): Texts to embed.
+            embed_fn (callable): Function embedding a list of texts.
+
+        Returns:
+            list: One embedding per text, in order.
+        """
+        keys = [embedding_key(self.model_name, kind, text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+            self._stats["lru"] += len(found)
+
+        upper_stores = []
+        for store in self._stores:
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            if not missing:
+                break
+            store_found = store.get_many(missing)
+            with self._lock:
+                self._stats[store.name] += len(store_found)
+            # copy the hits to the faster stores
+            for upper_store in upper_stores:
+                upper_store.put_many(store_found)
+            self._remember(store_found)
+            found.update(store_found)
+            upper_stores.append(store)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            computed = embed_fn(list(missing.values()))
+            computed = {
+                key: np.asarray(embedding, dtype=np.float32).tolist()
+                for key, embedding in zip(missing, computed)
+            }
+            with self._lock:
+                self._stats["misses"] += len(computed)
+            for store in self._stores:
+                store.put_many(computed)
+            self._remember(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query):
+        return self._get_embeddings(
+            "query",
+            [query],
+            lambda texts: [self.embed_model.get_query_embedding(t) for t in texts],
+        )[0]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._get_embeddings(
+            "text", texts, lambda misses: embed_texts(misses, self.embed_model)
+        )
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    async def _aget_text_embedding(self, text):
+        return self._get_text_embedding(text)
+
+
+def create_embedding_cache(
+    embed_model, path, max_entries, backend_name="none", s3_location=None, table=None
+):
+    """
+    Wraps an embedding model with the embedding cache.
+
+    Args:
+        embed_model (BaseEmbedding): Embedding model computing the misses.
+        path (str): Directory of the disk store, None disables it.
+        max_entries (int): Maximum number of embeddings kept in process.
+        backend_name (str): Shared store: "none", "s3" or "dynamodb".
+        s3_location (tuple): (S3 client, bucket, key prefix) of the s3 store.
+        table: DynamoDB Table resource of the dynamodb store.
+
+    Returns:
+        CachedEmbedding: The caching embedding model.
+    """
+    stores = []
+    if path:
+        try:
+            stores.append(DiskEmbeddingStore(path))
+        except OSError as e:
+            logger.warning(f"Embedding cache directory {path} is not usable: {e}")
+    if backend_name == "s3":
+        stores.append(S3EmbeddingStore(*s3_location))
+    elif backend_name == "dynamodb":
+        stores.append(DynamoDBEmbeddingStore(table))
+    elif backend_name != "none":
+        raise ValueError(f"Unknown embedding cache backend: {backend_name}")
+    return CachedEmbedding(embed_model, stores, max_entries=max_entries)
@@ -0,0 +1,99 @@
+"""
+embedding_context.py
+
+Request-scoped sharing of the question embeddings, and concurrent embedding of
+text batches.
+
+A /uc2 question goes through several retrievers and caches: the semantic SQL
+cache, the model router, the table and column retrievers and the few-shot
+examples of the prompt. Inside an embedding_scope, the first of them embeds
+the question and the others reuse its vector, so a question costs one Titan
+call whatever the number of stages.
+
+Titan embeds one text per request, so batches are embedded with concurrent
+requests instead of the sequential calls of get_text_embedding_batch.
+"""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+EMBED_MAX_WORKERS = 8
+
+_scope = contextvars.ContextVar("embedding_scope", default=None)
+
+
+@contextmanager
+def embedding_scope():
+    """
+    Shares the query embeddings computed until the end of the block.
+
+    Nested scopes reuse the outer scope.
+
+    Returns:
+        dict: Scope statistics, "computed" and "reused" query embeddings.
+    """
+    scope = _scope.get()
+    if scope is not None:
+        yield scope["stats"]
+        return
+    scope = {"embeddings": {}, "stats": {"computed": 0, "reused": 0}}
+    token = _scope.set(scope)
+    try:
+        yield scope["stats"]
+    finally:
+        _scope.reset(token)
+        logger.info(f"Query embeddings: {scope['stats']}")
+
+
+def get_query_embedding(embed_model, query):
+    """
+    Embeds a query once per embedding scope.
+
+    Args:
+        embed_model (BaseEmbedding): Embedding model.
+        query (str): Query text.
+
+    Returns:
+        list: Query embedding.
+    """
+    scope = _scope.get()
+    if scope is None:
+        return embed_model.get_query_embedding(query)
+    key = (embed_model.model_name, query)
+    if key in scope["embeddings"]:
+        scope["stats"]["reused"] += 1
+        return scope["embeddings"][key]
+    embedding = embed_model.get_query_embedding(query)
+    scope["embeddings"][key] = embedding
+    scope["stats"]["computed"] += 1
+    return embedding
+
+
+def embed_texts(texts, embed_model, max_workers=EMBED_MAX_WORKERS):
+    """
+    Embeds texts with concurrent requests.
+
+    Args:
+        texts (list): Texts to embed.
+        embed_model (BaseEmbedding): Embedding model.
+        max_workers (int): Maximum number of concurrent requests.
+
+    Returns:
+        list: One embedding per text, in order.
+    """
+    # models embedding their batches concurrently, e.g. CachedEmbedding, get
+    # the whole batch
+    if (
+        len(texts) <= 1
+        or max_workers <= 1
+        or getattr(embed_model, "embeds_batches", False)
+    ):
+        return embed_model.get_text_embedding_batch(texts)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(texts))) as executor:
+        return list(executor.map(embed_model.get_text_embedding, texts))
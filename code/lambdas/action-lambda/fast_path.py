@@ -0,0 +1,299 @@
+"""
+fast_path.py
+
+Deterministic answers to simple EC2 pricing lookups, without LLM calls.
+
+Questions naming instances in the INSTANCE_FAMILY.INSTANCE_SIZE format and
+asking for their price, memory, vCPUs, spot or reserved cost, e.g. "how much is
+p3.8xlarge per hour?" or "compare c5.4xlarge and trn1n.32xlarge", are parsed
+with rules, answered with a templated SQL query and formatted directly. Any
+question with a word the rules do not know, or that they are not confident
+about, is left to the query engine.
+"""
+
+import logging
+import re
+
+from answer_formatter import format_value
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+FAST_PATH_TABLE = "ec2_pricing"
+
+INSTANCE_SIZE = r"(?:\d*xlarge|large|medium|small|micro|nano|metal(?:-\d+xl)?)"
+
+# Instance names in the format used by the table, e.g. "p3.8xlarge"
+INSTANCE_NAME_PATTERN = re.compile(
+    rf"(?<![\w.-])([a-z][a-z0-9-]*\d[a-z0-9-]*\.{INSTANCE_SIZE})(?![\w-])"
+)
+
+# Instance names in other formats, e.g. "p3 8xlarge" or "p32xlarge"
+LOOSE_INSTANCE_NAME_PATTERN = re.compile(
+    rf"\b[a-z]+\d[a-z0-9-]*\s*\.?\s*(?:\d+\s*)?{INSTANCE_SIZE}\b"
+)
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:-[a-z]+)*")
+
+# Column, label, unit and keywords of every metric, spot and reserved first as
+# their questions also mention prices
+METRICS = [
+    (
+        "linux_spot_minimum_cost_hourly",
+        "minimum Linux spot hourly price",
+        "price",
+        {"spot"},
+    ),
+    (
+        "linux_reserved_cost_1_year_hourly",
+        "1 year reserved Linux hourly price",
+        "price",
+        {"reserved", "reservation", "ri"},
+    ),
+    ("instance_memory_gib", "memory", "gib", {"memory", "ram", "gib"}),
+    ("number_vcpus", "vCPUs", None, {"vcpu", "vcpus", "cpu", "cpus", "cores"}),
+]
+ON_DEMAND_METRIC = (
+    "on_demand_hourly_price",
+    "on-demand hourly price",
+    "price",
+    {"on-demand", "ondemand", "price", "prices", "priced", "cost", "costs", "pay"},
+)
+
+# Words a lookup question can use besides its instances and metrics. Any other
+# word, e.g. a duration ("for a year"), an operating system ("on windows"), a
+# tenancy or an aggregation, sends the question to the query engine.
+LOOKUP_WORDS = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "between",
+    "both",
+    "can",
+    "current",
+    "currently",
+    "do",
+    "does",
+    "each",
+    "for",
+    "get",
+    "give",
+    "has",
+    "have",
+    "hour",
+    "hourly",
+    "how",
+    "i",
+    "instance",
+    "is",
+    "it",
+    "its",
+    "latest",
+    "many",
+    "me",
+    "much",
+    "number",
+    "of",
+    "on",
+    "or",
+    "per",
+    "please",
+    "rate",
+    "s",
+    "show",
+    "tell",
+    "the",
+    "what",
+    "whats",
+    "with",
+    "you",
+}
+
+# Words only answerable by comparing several instances
+COMPARISON_WORDS = {
+    "which",
+    "cheaper",
+    "cheapest",
+    "expensive",
+    "more",
+    "most",
+    "less",
+    "least",
+    "higher",
+    "highest",
+    "lower",
+    "lowest",
+    "bigger",
+    "biggest",
+    "larger",
+    "largest",
+    "smaller",
+    "smallest",
+    "than",
+}
+
+COMPARE_WORDS = {"compare", "vs", "versus"}
+
+ALLOWED_WORDS = (
+    LOOKUP_WORDS
+    | COMPARISON_WORDS
+    | COMPARE_WORDS
+    | ON_DEMAND_METRIC[3]
+    | {keyword for metric in METRICS for keyword in metric[3]}
+)
+
+
+def parse_question(question, available_columns):
+    """
+    Parses a pricing lookup or comparison question.
+
+    Args:
+        question (str): User question.
+        available_columns (set): Columns of the pricing table.
+
+    Returns:
+        dict: "instances" and "metrics" (METRICS entries) asked for, or None
+            when the question is not a simple lookup or comparison.
+    """
+    text = " ".join(question.lower().split())
+    instances = list(dict.fromkeys(INSTANCE_NAME_PATTERN.findall(text)))
+    if not instances:
+        return None
+
+    rest = INSTANCE_NAME_PATTERN.sub(" ", text)
+    reserved_term = re.search(r"\b1[ -]year\b", rest)
+    if reserved_term:
+        rest = rest.replace(reserved_term.group(0), " ")
+    if LOOSE_INSTANCE_NAME_PATTERN.search(rest) or re.search(r"[\d$%]", rest):
+        return None
+
+    words = set(WORD_PATTERN.findall(rest.replace("on demand", "on-demand")))
+    if words - ALLOWED_WORDS:
+        return None
+    if len(instances) < 2 and words & COMPARISON_WORDS:
+        return None
+    if reserved_term and "reserved" not in words:
+        return None
+
+    metrics = [metric for metric in METRICS if words & metric[3]]
+    price_asked = (
+        words & (ON_DEMAND_METRIC[3] | {"cheaper", "cheapest", "expensive"})
+        or "per hour" in rest
+    )
+    if words & {"on-demand", "ondemand"} or (
+        price_asked and not any(metric[2] == "price" for metric in metrics)
+    ):
+        metrics.insert(0, ON_DEMAND_METRIC)
+    if not metrics and "how much" in rest:
+        metrics = [ON_DEMAND_METRIC]
+    if not metrics and len(instances) > 1 and words & COMPARE_WORDS:
+        metrics = [ON_DEMAND_METRIC]
+    if not metrics:
+        return None
+    if any(metric[0] not in available_columns for metric in metrics):
+        return None
+
+    return {"instances": instances, "metrics": metrics}
+
+
+def build_sql(intent):
+    """
+    Creates the SQL query answering a parsed question.
+
+    Args:
+        intent (dict): Parsed question.
+
+    Returns:
+        str: SQL query.
+    """
+    columns = ", ".join(["instance_name"] + [m[0] for m in intent["metrics"]])
+    # instance names only hold [a-z0-9.-], as matched by INSTANCE_NAME_PATTERN
+    names = ", ".join(f"'{name}'" for name in intent["instances"])
+    if len(intent["instances"]) == 1:
+        condition = f"instance_name = {names}"
+    else:
+        condition = f"instance_name IN ({names})"
+    return (
+        f"SELECT {columns} \nFROM {FAST_PATH_TABLE}\nWHERE {condition}\n"
+        f"ORDER BY {intent['metrics'][0][0]} ASC"
+    )
+
+
+def format_answer(intent, rows, col_keys):
+    """
+    Formats the answer of a parsed question from the SQL result.
+
+    Args:
+        intent (dict): Parsed question.
+        rows (list): Result rows.
+        col_keys (list): Column names of the rows.
+
+    Returns:
+        str: Answer.
+    """
+    results = {}
+    for row in rows:
+        record = dict(zip(col_keys, row))
+        results.setdefault(record["instance_name"], record)
+    missing = [name for name in intent["instances"] if name not in results]
+    if not results:
+        return f"No data was found for {', '.join(missing)}."
+
+    lines = []
+    for name, record in results.items():
+        details = ", ".join(
+            f"{label} {format_value(record.get(column), unit)}"
+            for column, label, unit, _ in intent["metrics"]
+        )
+        lines.append(f"- {name}: {details}")
+    answer = "According to the latest information:\n" + "\n".join(lines)
+
+    column, label, unit, _ = intent["metrics"][0]
+    ranked = [
+        (record[column], name)
+        for name, record in results.items()
+        if record.get(column) is not None
+    ]
+    if len(ranked) > 1:
+        ranked.sort()
+        (low, low_name), (high, high_name) = ranked[0], ranked[-1]
+        answer += (
+            f"\n{low_name} has the lowest {label} ({format_value(low, unit)}) and "
+            f"{high_name} the highest ({format_value(high, unit)})."
+        )
+    if missing:
+        answer += f"\nNo data was found for {', '.join(missing)}."
+    return answer
+
+
+def answer_question(question, sql_retriever, available_columns):
+    """
+    Answers a simple pricing question without calling the LLM.
+
+    Args:
+        question (str): User question.
+        sql_retriever (TextToSQLRetriever): Retriever running the SQL query.
+        available_columns (set): Columns of the pricing table.
+
+    Returns:
+        dict: "answer", "sql_query" and "metadata", or None when the question
+            is left to the query engine.
+    """
+    intent = parse_question(question, available_columns)
+    if intent is None:
+        return None
+
+    sql_query = build_sql(intent)
+    _, metadata = sql_retriever.run_sql(sql_query)
+    if "sql_error" in metadata or "result" not in metadata:
+        logger.info(f"Fast path query failed, using the query engine: {metadata}")
+        return None
+
+    answer = format_answer(intent, metadata["result"], metadata["col_keys"])
+    return {
+        "answer": answer,
+        "sql_query": sql_query,
+        "metadata": {**metadata, "fast_path": True},
+    }
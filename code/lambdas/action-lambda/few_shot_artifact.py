@@ -0,0 +1,177 @@
+"""
+few_shot_artifact.py
+
+Build and load the precomputed few-shot embedding artifact.
+
+The artifact stores the Titan embedding of every example question in the
+few-shot CSV together with the question -> row map, so the action Lambda can
+build its few-shot retriever at cold start without calling Bedrock. It is
+keyed by a content hash of the CSV and the embedding model name; a mismatch
+on either marks it as stale.
+
+Run as a script to (re)build the artifact before building the container image:
+
+    python few_shot_artifact.py --region us-east-1
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+
+import boto3
+import numpy as np
+from llama_index.embeddings.bedrock import BedrockEmbedding
+
+from embedding_context import embed_texts
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ARTIFACT_VERSION = 1
+DEFAULT_EXAMPLES_PATH = "dynamic_examples.csv"
+DEFAULT_ARTIFACT_PATH = "few_shot_embeddings.npz"
+DEFAULT_EMBED_MODEL_NAME = "amazon.titan-embed-text-v1"
+
+
+def csv_content_hash(examples_path):
+    """
+    Computes the content hash of the few-shot examples csv file.
+
+    Args:
+        examples_path (str): Path to fewshot examples csv file.
+
+    Returns:
+        str: Hex encoded sha256 digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(examples_path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_few_shot_examples(examples_path):
+    """
+    Reads the few-shot examples csv file.
+
+    Args:
+        examples_path (str): Path to fewshot examples csv file.
+
+    Returns:
+        data_dict (dict): Dictionary with fewshot examples, keyed by question.
+    """
+    data_dict = {}
+    with open(examples_path, newline="", encoding="utf-8-sig") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            data_dict[row["example_input_question"]] = row
+    return data_dict
+
+
+def node_text(question):
+    """
+    Text embedded for a few-shot question, matching the retriever node content.
+
+    Args:
+        question (str): Example input question.
+
+    Returns:
+        str: JSON encoded question.
+    """
+    return json.dumps(question)
+
+
+def build_few_shot_artifact(examples_path, artifact_path, embed_model, model_name):
+    """
+    Embeds every example question once and writes the artifact.
+
+    Args:
+        examples_path (str): Path to fewshot examples csv file.
+        artifact_path (str): Path of the artifact to write.
+        embed_model (BaseEmbedding): Embedding model used for the questions.
+        model_name (str): Name of the embedding model, stored for staleness checks.
+
+    Returns:
+        None
+    """
+    data_dict = read_few_shot_examples(examples_path)
+    questions = list(data_dict.keys())
+    embeddings = embed_texts([node_text(q) for q in questions], embed_model)
+    metadata = {
+        "version": ARTIFACT_VERSION,
+        "csv_sha256": csv_content_hash(examples_path),
+        "model_name": model_name,
+        "questions": questions,
+        "rows": [data_dict[q] for q in questions],
+    }
+    with open(artifact_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+            metadata=np.array(json.dumps(metadata)),
+        )
+    logger.info(f"Wrote {len(questions)} few-shot embeddings to {artifact_path}")
+
+
+def load_few_shot_artifact(examples_path, artifact_path, model_name):
+    """
+    Loads the artifact if it exists and matches the csv content and model.
+
+    Args:
+        examples_path (str): Path to fewshot examples csv file.
+        artifact_path (str): Path of the artifact to load.
+        model_name (str): Name of the embedding model in use.
+
+    Returns:
+        tuple: (embeddings, data_dict) where embeddings is a float32 matrix with
+            one row per question of data_dict, in order. None if the artifact is
+            missing or stale.
+    """
+    if not os.path.exists(artifact_path):
+        logger.info(f"Few-shot artifact {artifact_path} not found")
+        return None
+
+    try:
+        with np.load(artifact_path, allow_pickle=False) as artifact:
+            embeddings = artifact["embeddings"]
+            metadata = json.loads(str(artifact["metadata"]))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not read few-shot artifact {artifact_path}: {e}")
+        return None
+
+    if (
+        metadata.get("version") != ARTIFACT_VERSION
+        or metadata.get("model_name") != model_name
+        or metadata.get("csv_sha256") != csv_content_hash(examples_path)
+    ):
+        logger.info(f"Few-shot artifact {artifact_path} is stale")
+        return None
+
+    data_dict = dict(zip(metadata["questions"], metadata["rows"]))
+    return embeddings, data_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the precomputed few-shot embedding artifact."
+    )
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    parser.add_argument("--examples-path", default=DEFAULT_EXAMPLES_PATH)
+    parser.add_argument("--artifact-path", default=DEFAULT_ARTIFACT_PATH)
+    parser.add_argument("--model-name", default=DEFAULT_EMBED_MODEL_NAME)
+    args = parser.parse_args()
+
+    bedrock_client = boto3.client("bedrock-runtime", region_name=args.region)
+    embed_model = BedrockEmbedding(client=bedrock_client, model_name=args.model_name)
+    build_few_shot_artifact(
+        args.examples_path, args.artifact_path, embed_model, args.model_name
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    main()
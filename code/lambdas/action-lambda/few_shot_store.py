@@ -0,0 +1,577 @@
+"""
+few_shot_store.py
+
+Few-shot example store with an approximate nearest neighbour (IVF) index.
+
+The store is a directory of NumPy and JSON files, loaded memory-mapped:
+
+    manifest.json       version, embedding model, dimension and counts
+    examples.jsonl      one example row per line, in insertion order
+    line_offsets.npy    byte offset of every line of examples.jsonl
+    centroids.npy       normalized centroids of the inverted lists
+    list_offsets.npy    start of every inverted list in list_vectors.npy
+    list_vectors.npy    normalized embeddings of the indexed examples, by list
+    list_ids.npy        example id of every row of list_vectors.npy
+    delta_vectors.npy   normalized embeddings appended since the last compaction
+
+A query is compared with the centroids, and only the examples of the nprobe
+closest lists are scored, plus the appended examples not yet indexed, which are
+scanned exhaustively. Appending writes the new rows and delta embeddings
+without touching the index. compact() assigns the delta to the existing
+centroids, and retrains them only when asked or when the store first becomes
+large enough for an index. Stores smaller than that are scanned exhaustively.
+Files are replaced atomically and the manifest written last, so readers see a
+consistent store.
+
+Run as a script to build or extend a store from a few-shot csv file, and
+upload it to S3:
+
+    python few_shot_store.py build --examples-path dynamic_examples.csv \\
+        --store-path few_shot_store --bucket <bucket> --prefix few_shot_store/
+    python few_shot_store.py append --examples-path harvested.csv \\
+        --store-path few_shot_store --bucket <bucket> --prefix few_shot_store/
+"""
+
+import argparse
+import json
+import logging
+import os
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.embeddings.bedrock import BedrockEmbedding
+
+from embedding_context import embed_texts, get_query_embedding
+from few_shot_artifact import (
+    DEFAULT_EMBED_MODEL_NAME,
+    node_text,
+    read_few_shot_examples,
+)
+from vector_retriever import top_k
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+STORE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EXAMPLES_FILE = "examples.jsonl"
+ARRAY_FILES = [
+    "line_offsets.npy",
+    "centroids.npy",
+    "list_offsets.npy",
+    "list_vectors.npy",
+    "list_ids.npy",
+    "delta_vectors.npy",
+]
+
+# Smallest number of indexed examples trained into inverted lists
+MIN_IVF_SIZE = 1024
+# Delta size, relative to the indexed examples, from which append compacts
+COMPACT_RATIO = 0.1
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 20000
+
+
+def normalize(vectors):
+    """Rows scaled to unit norm, as float32."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+def default_nlist(count):
+    """Number of inverted lists for a number of examples, about sqrt(count)."""
+    return max(1, int(round(np.sqrt(count))))
+
+
+def train_centroids(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Trains the centroids of the inverted lists with spherical k-means.
+
+    Args:
+        vectors (numpy.ndarray): Normalized embeddings, one row per example.
+        nlist (int): Number of centroids.
+        iterations (int): Number of k-means iterations.
+        seed (int): Seed of the sampling.
+
+    Returns:
+        numpy.ndarray: Normalized centroids, one row per list.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(KMEANS_SAMPLE_SIZE, len(vectors))
+    sample = np.asarray(
+        vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    )
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        one_hot = np.zeros((nlist, sample_size), dtype=np.float32)
+        one_hot[assignments, np.arange(sample_size)] = 1.0
+        sums = one_hot @ sample
+        # empty lists restart from a random example
+        empty = one_hot.sum(axis=1) == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign_lists(vectors, centroids, batch_size=8192):
+    """Index of the closest centroid of every vector."""
+    return np.concatenate(
+        [
+            np.argmax(np.asarray(vectors[i : i + batch_size]) @ centroids.T, axis=1)
+            for i in range(0, len(vectors), batch_size)
+        ]
+        or [np.empty(0, dtype=np.int64)]
+    )
+
+
+def write_array(directory, name, array):
+    """Writes a .npy file atomically."""
+    path = os.path.join(directory, name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class FewShotStore:
+    """
+    Few-shot examples and their embeddings, searched through an IVF index.
+
+    Args:
+        directory (str): Store directory.
+        nprobe (int): Number of inverted lists scored per query.
+    """
+
+    def __init__(self, directory, nprobe=8):
+        self.directory = directory
+        self.nprobe = nprobe
+        # ETag of the S3 manifest the store was downloaded from, if any
+        self.etag = None
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported few-shot store version in {directory}")
+        self.model_name = self.manifest["model_name"]
+        self.dim = self.manifest["dim"]
+        self.count = self.manifest["count"]
+        self.base_count = self.manifest["base_count"]
+
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        self.line_offsets = np.array(load("line_offsets.npy")[: self.count + 1])
+        self.centroids = (
+            np.array(load("centroids.npy")) if self.manifest["nlist"] else None
+        )
+        self.list_offsets = np.array(load("list_offsets.npy"))
+        self.list_vectors = load("list_vectors.npy")
+        self.list_ids = load("list_ids.npy")
+        self.delta_vectors = load("delta_vectors.npy")[: self.count - self.base_count]
+        self._examples_fd = os.open(os.path.join(directory, EXAMPLES_FILE), os.O_RDONLY)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Closes the examples file."""
+        if self._examples_fd is not None:
+            os.close(self._examples_fd)
+            self._examples_fd = None
+
+    @classmethod
+    def create(cls, directory, model_name, dim, nprobe=8):
+        """
+        Creates an empty store.
+
+        Args:
+            directory (str): Store directory, created if needed.
+            model_name (str): Embedding model of the examples.
+            dim (int): Embedding dimension.
+            nprobe (int): Number of inverted lists scored per query.
+
+        Returns:
+            FewShotStore: The empty store.
+        """
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, EXAMPLES_FILE), "wb").close()
+        write_array(directory, "line_offsets.npy", np.zeros(1, dtype=np.int64))
+        write_array(directory, "centroids.npy", np.empty((0, dim), np.float32))
+        write_array(directory, "list_offsets.npy", np.zeros(1, dtype=np.int64))
+        write_array(directory, "list_vectors.npy", np.empty((0, dim), np.float32))
+        write_array(directory, "list_ids.npy", np.empty(0, dtype=np.int64))
+        write_array(directory, "delta_vectors.npy", np.empty((0, dim), np.float32))
+        cls._write_manifest(
+            directory,
+            {
+                "version": STORE_VERSION,
+                "model_name": model_name,
+                "dim": dim,
+                "count": 0,
+                "base_count": 0,
+                "nlist": 0,
+            },
+        )
+        return cls(directory, nprobe)
+
+    @staticmethod
+    def _write_manifest(directory, manifest):
+        path = os.path.join(directory, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def example(self, example_id):
+        """Row of an example, read from the examples file."""
+        start, end = self.line_offsets[example_id], self.line_offsets[example_id + 1]
+        line = os.pread(self._examples_fd, int(end - start), int(start))
+        return json.loads(line)
+
+    def questions(self):
+        """Questions of every example, in insertion order."""
+        return [
+            self.example(i)["example_input_question"] for i in range(self.count)
+        ]
+
+    def _candidates(self, query, nprobe):
+        """Example ids and scores of the examples scored for a query."""
+        ids, scores = [], []
+        if self.centroids is None:
+            ranges = [(0, self.base_count)]
+        else:
+            list_scores = self.centroids @ query
+            probe = np.argpartition(-list_scores, min(nprobe, len(list_scores)) - 1)
+            ranges = [
+                (self.list_offsets[i], self.list_offsets[i + 1])
+                for i in probe[:nprobe]
+            ]
+        for start, end in ranges:
+            if end > start:
+                scores.append(np.asarray(self.list_vectors[start:end]) @ query)
+                ids.append(np.asarray(self.list_ids[start:end]))
+        if len(self.delta_vectors):
+            scores.append(np.asarray(self.delta_vectors) @ query)
+            ids.append(np.arange(self.base_count, self.count))
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(ids), np.concatenate(scores)
+
+    def search(self, query_embeddings, k, nprobe=None):
+        """
+        Finds the most similar examples of a batch of query embeddings.
+
+        Args:
+            query_embeddings (array-like): Query embeddings, one row per query.
+            k (int): Number of examples per query.
+            nprobe (int): Number of inverted lists scored. Defaults to the store
+                setting.
+
+        Returns:
+            list: One list of (example id, cosine similarity) per query, best
+                first.
+        """
+        results = []
+        for query in normalize(query_embeddings):
+            ids, scores = self._candidates(query, nprobe or self.nprobe)
+            indices, top_scores = top_k(scores[None, :], k)
+            results.append(
+                [(int(ids[i]), float(s)) for i, s in zip(indices[0], top_scores[0])]
+            )
+        return results
+
+    def append(self, rows, embeddings, compact_ratio=COMPACT_RATIO):
+        """
+        Appends examples without rebuilding the index.
+
+        Args:
+            rows (list): Example rows, dictionaries with "example_input_question"
+                and "example_output_query".
+            embeddings (array-like): Embedding of every row question.
+            compact_ratio (float): Delta size, relative to the indexed examples,
+                from which the store is compacted. None never compacts.
+
+        Returns:
+            FewShotStore: The store reopened with the new examples.
+        """
+        vectors = normalize(embeddings)
+        if len(rows) != len(vectors) or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {len(rows)} embeddings of dimension {self.dim}")
+        lines = [json.dumps(row).encode("utf-8") + b"\n" for row in rows]
+        examples_path = os.path.join(self.directory, EXAMPLES_FILE)
+        with open(examples_path, "r+b") as f:
+            # drop bytes of an interrupted append not recorded in the manifest
+            f.truncate(int(self.line_offsets[-1]))
+            f.seek(0, os.SEEK_END)
+            f.write(b"".join(lines))
+        offsets = self.line_offsets[-1] + np.cumsum([len(line) for line in lines])
+        write_array(
+            self.directory,
+            "line_offsets.npy",
+            np.concatenate([self.line_offsets, offsets]).astype(np.int64),
+        )
+        write_array(
+            self.directory,
+            "delta_vectors.npy",
+            np.concatenate([np.asarray(self.delta_vectors), vectors]),
+        )
+        manifest = {**self.manifest, "count": self.count + len(rows)}
+        self._write_manifest(self.directory, manifest)
+        logger.info(f"Appended {len(rows)} few-shot examples to {self.directory}")
+
+        store = self._reopen()
+        delta_count = store.count - store.base_count
+        if compact_ratio is not None and delta_count > compact_ratio * max(
+            store.base_count, MIN_IVF_SIZE
+        ):
+            store = store.compact()
+        return store
+
+    def compact(self, retrain=False, nlist=None):
+        """
+        Moves the appended examples into the inverted lists.
+
+        Args:
+            retrain (bool): Whether to retrain the centroids on every example.
+                They are always trained when the store first reaches
+                MIN_IVF_SIZE examples.
+            nlist (int): Number of lists when training. Defaults to about the
+                square root of the number of examples.
+
+        Returns:
+            FewShotStore: The store reopened after compaction.
+        """
+        vectors = np.concatenate(
+            [
+                np.asarray(self.list_vectors),
+                np.asarray(self.delta_vectors),
+            ]
+        )
+        ids = np.concatenate(
+            [np.asarray(self.list_ids), np.arange(self.base_count, self.count)]
+        )
+        centroids = self.centroids
+        if self.count < MIN_IVF_SIZE:
+            centroids = None
+        elif centroids is None or retrain:
+            centroids = train_centroids(vectors, nlist or default_nlist(self.count))
+
+        if centroids is None:
+            order = np.argsort(ids, kind="stable")
+            list_offsets = np.array([0, len(ids)], dtype=np.int64)
+        else:
+            assignments = assign_lists(vectors, centroids)
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=len(centroids))
+            list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        write_array(
+            self.directory,
+            "centroids.npy",
+            (
+                centroids
+                if centroids is not None
+                else np.empty((0, self.dim), np.float32)
+            ),
+        )
+        write_array(self.directory, "list_offsets.npy", list_offsets)
+        write_array(self.directory, "list_vectors.npy", vectors[order])
+        write_array(self.directory, "list_ids.npy", ids[order].astype(np.int64))
+        write_array(
+            self.directory, "delta_vectors.npy", np.empty((0, self.dim), np.float32)
+        )
+        manifest = {
+            **self.manifest,
+            "base_count": self.count,
+            "nlist": 0 if centroids is None else len(centroids),
+        }
+        self._write_manifest(self.directory, manifest)
+        logger.info(
+            f"Compacted {self.count} few-shot examples into {manifest['nlist']} lists"
+        )
+        return self._reopen()
+
+    def _reopen(self):
+        self.close()
+        return FewShotStore(self.directory, self.nprobe)
+
+
+def upload_store(directory, s3_client, bucket, prefix):
+    """Uploads a store to S3, the manifest last."""
+    for name in ARRAY_FILES + [EXAMPLES_FILE, MANIFEST_FILE]:
+        s3_client.upload_file(os.path.join(directory, name), bucket, f"{prefix}{name}")
+    logger.info(f"Uploaded few-shot store to s3://{bucket}/{prefix}")
+
+
+def download_store(s3_client, bucket, prefix, directory):
+    """
+    Downloads a store from S3, the manifest first.
+
+    Args:
+        s3_client: Boto3 S3 client.
+        bucket (str): Bucket of the store.
+        prefix (str): Key prefix of the store files.
+        directory (str): Local directory receiving the files.
+
+    Returns:
+        str: ETag of the downloaded manifest, None if there is no store under
+            the prefix.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=f"{prefix}{MANIFEST_FILE}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    with open(f"{manifest_path}.s3", "wb") as f:
+        f.write(response["Body"].read())
+    # files written after the manifest belong to a newer version, which readers
+    # ignore until its manifest is downloaded
+    for name in ARRAY_FILES + [EXAMPLES_FILE]:
+        path = os.path.join(directory, name)
+        s3_client.download_file(bucket, f"{prefix}{name}", f"{path}.s3")
+        os.replace(f"{path}.s3", path)
+    os.replace(f"{manifest_path}.s3", manifest_path)
+    return response["ETag"]
+
+
+class FewShotStoreRetriever(BaseRetriever):
+    """
+    Retriever of few-shot examples from a FewShotStore.
+
+    The nodes hold the JSON encoded question, as the csv based retriever, and
+    the example row in their "example" metadata.
+
+    Args:
+        store (FewShotStore): Few-shot store.
+        embed_model (BaseEmbedding): Embedding model for the queries.
+        similarity_top_k (int): Number of examples returned per query.
+    """
+
+    def __init__(self, store, embed_model, similarity_top_k=2, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle):
+        if query_bundle.embedding is None:
+            query_bundle.embedding = get_query_embedding(
+                self._embed_model, query_bundle.query_str
+            )
+        nodes = []
+        for example_id, score in self.store.search(
+            [query_bundle.embedding], self._similarity_top_k
+        )[0]:
+            row = self.store.example(example_id)
+            node = TextNode(
+                text=node_text(row["example_input_question"]),
+                metadata={"example": row},
+                excluded_embed_metadata_keys=["example"],
+                excluded_llm_metadata_keys=["example"],
+            )
+            nodes.append(NodeWithScore(node=node, score=score))
+        return nodes
+
+
+def load_few_shot_store(path, model_name, nprobe=8, s3_location=None):
+    """
+    Loads the few-shot store, downloading it from S3 when given a location.
+
+    Args:
+        path (str): Local store directory.
+        model_name (str): Embedding model in use.
+        nprobe (int): Number of inverted lists scored per query.
+        s3_location (tuple): (S3 client, bucket, key prefix) of the store.
+
+    Returns:
+        FewShotStore: The store, None if missing, empty or embedded with
+            another model.
+    """
+    etag = None
+    if s3_location is not None:
+        _, bucket, prefix = s3_location
+        try:
+            etag = download_store(*s3_location, path)
+            if etag is None:
+                logger.info(f"No few-shot store under s3://{bucket}/{prefix}")
+                return None
+        except ClientError as e:
+            logger.warning(f"Could not download the few-shot store: {e}")
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return None
+    try:
+        store = FewShotStore(path, nprobe)
+        store.etag = etag
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not read few-shot store {path}: {e}")
+        return None
+    if store.model_name != model_name or not len(store):
+        logger.info(f"Few-shot store {path} is empty or stale")
+        store.close()
+        return None
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or extend the few-shot store from a csv file."
+    )
+    parser.add_argument("command", choices=["build", "append", "compact"])
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    parser.add_argument("--examples-path", default="dynamic_examples.csv")
+    parser.add_argument("--store-path", default="few_shot_store")
+    parser.add_argument("--model-name", default=DEFAULT_EMBED_MODEL_NAME)
+    parser.add_argument("--bucket", help="also upload the store to this bucket")
+    parser.add_argument("--prefix", default="few_shot_store/")
+    parser.add_argument("--retrain", action="store_true")
+    args = parser.parse_args()
+
+    s3_client = boto3.client("s3", region_name=args.region)
+    if args.command == "build":
+        store = None
+    else:
+        if args.bucket:
+            download_store(s3_client, args.bucket, args.prefix, args.store_path)
+        store = FewShotStore(args.store_path)
+
+    if args.command == "compact":
+        store = store.compact(retrain=args.retrain)
+    else:
+        data_dict = read_few_shot_examples(args.examples_path)
+        if store is not None:
+            # only examples with new questions are appended
+            for question in store.questions():
+                data_dict.pop(question, None)
+        rows = list(data_dict.values())
+        if store is None and not rows:
+            parser.error(f"No few-shot example in {args.examples_path}")
+        embed_model = BedrockEmbedding(
+            client=boto3.client("bedrock-runtime", region_name=args.region),
+            model_name=args.model_name,
+        )
+        embeddings = np.asarray(
+            embed_texts([node_text(q) for q in data_dict], embed_model),
+            dtype=np.float32,
+        )
+        if store is None:
+            store = FewShotStore.create(
+                args.store_path, args.model_name, embeddings.shape[1]
+            )
+        if rows:
+            store = store.append(rows, embeddings)
+        if args.command == "build":
+            store = store.compact(retrain=True)
+
+    if args.bucket:
+        upload_store(args.store_path, s3_client, args.bucket, args.prefix)
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    main()
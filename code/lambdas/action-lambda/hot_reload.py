@@ -0,0 +1,153 @@
+"""
+hot_reload.py
+
+Hot reload of the prompt templates, table descriptions and few-shot examples
+from S3.
+
+Every watched object is fetched with a conditional GetObject on its last ETag,
+so an unchanged object costs one 304 response and no download. The poller
+checks its objects at most once per interval, at the start of an invocation,
+and hands the changed contents to the action lambda, which swaps them in
+without rebuilding the components they do not affect.
+
+The prompt location holds prompts.json, with any of "sql_template",
+"response_template" and "table_details", and dynamic_examples.csv.
+"""
+
+import json
+import logging
+import string
+import time
+
+from botocore.exceptions import ClientError
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PROMPTS_FILE = "prompts.json"
+EXAMPLES_FILE = "dynamic_examples.csv"
+
+# Placeholders every template must keep
+REQUIRED_PLACEHOLDERS = {
+    "sql_template": {"query_str", "schema", "dialect"},
+    "response_template": {"query_str", "context_str"},
+}
+
+
+class S3ObjectWatcher:
+    """
+    Fetches an S3 object only when its ETag changed since the last fetch.
+
+    Args:
+        s3_client (boto3.client): The S3 client.
+        bucket (str): Bucket of the object.
+        key (str): Key of the object.
+        etag (str): ETag of the content already in use, if any.
+    """
+
+    def __init__(self, s3_client, bucket, key, etag=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+
+    def fetch_if_changed(self):
+        """
+        Gets the object content when it changed.
+
+        Returns:
+            bytes: New content, None when unchanged or missing.
+        """
+        kwargs = {"IfNoneMatch": self.etag} if self.etag else {}
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self.key, **kwargs
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("304", "NotModified"):
+                return None
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                self.etag = None
+                return None
+            raise
+        self.etag = response["ETag"]
+        return response["Body"].read()
+
+
+class HotReloadPoller:
+    """
+    Polls S3 objects at most once per interval.
+
+    Args:
+        watchers (dict): Name -> S3ObjectWatcher.
+        interval (float): Minimum seconds between two polls.
+    """
+
+    def __init__(self, watchers, interval):
+        self.watchers = watchers
+        self.interval = interval
+        self._last_poll = None
+
+    def poll(self, now=None):
+        """
+        Fetches the objects that changed, when the interval elapsed.
+
+        Returns:
+            dict: Name -> new content of the changed objects.
+        """
+        now = time.monotonic() if now is None else now
+        if self._last_poll is not None and now - self._last_poll < self.interval:
+            return {}
+        self._last_poll = now
+        changes = {}
+        for name, watcher in self.watchers.items():
+            try:
+                content = watcher.fetch_if_changed()
+            except ClientError as e:
+                location = f"s3://{watcher.bucket}/{watcher.key}"
+                logger.warning(f"Could not poll {location}: {e}")
+                continue
+            if content is not None:
+                changes[name] = content
+        return changes
+
+
+def template_placeholders(template):
+    """Names of the {placeholders} of a template string."""
+    return {
+        field for _, field, _, _ in string.Formatter().parse(template) if field
+    }
+
+
+def parse_prompt_config(content, defaults):
+    """
+    Parses and validates a prompts.json file.
+
+    Args:
+        content (bytes): File content.
+        defaults (dict): Values of the keys missing from the file.
+
+    Returns:
+        dict: "sql_template", "response_template" and "table_details".
+
+    Raises:
+        ValueError: If the file is not a valid JSON object, or a template
+            misses a required placeholder.
+    """
+    config = json.loads(content)
+    if not isinstance(config, dict):
+        raise ValueError("prompts.json must hold a JSON object")
+    config = {key: config.get(key, value) for key, value in defaults.items()}
+    if not isinstance(config["table_details"], dict):
+        raise ValueError("table_details must map table names to descriptions")
+    # tables missing from the file keep their default description
+    config["table_details"] = {
+        **defaults["table_details"],
+        **config["table_details"],
+    }
+    for key, required in REQUIRED_PLACEHOLDERS.items():
+        missing = required - template_placeholders(config[key])
+        if missing:
+            raise ValueError(f"{key} misses placeholders {sorted(missing)}")
+    return config
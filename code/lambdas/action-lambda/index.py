@@ -3,7 +3,16 @@
 
 os.environ["NLTK_DATA"] = tempfile.gettempdir()
 
-from build_query_engine import query_engine
+from answer_formatter import SYNTHESIS_MODES
+from build_query_engine import (
+    answer_with_fast_path,
+    embedding_cache_stats,
+    get_query_engine,
+    reload_prompt_config,
+    warm_up,
+)
+from connections import Connections
+from profiler import emit_metrics, profile_request, record, stage
 import json
 import logging
 
@@ -15,54 +24,87 @@ def log(message):
     logger.info(message)
 
 
-def get_response(event, context):
-    """
-    Get response RAG or Query
+def answer_chunks(response):
     """
+    Yields the answer of a query engine response chunk by chunk.
 
-    log("Logging event:")
-    log(json.dumps(event))
-    responses = []
-
-    prediction = event
-    response_code = 200
-    api_path = prediction["apiPath"]
-    parameters = prediction["parameters"]
-    user_input = parameters[0]["value"]
+    Args:
+        response (Response or StreamingResponse): Query engine response.
 
-    # Only allow one str, to mitigate mixed prompt injection
-    if isinstance(user_input, str):
+    Returns:
+        generator: Answer chunks.
+    """
+    if getattr(response, "response_gen", None) is not None:
+        # the answer is generated while it is streamed
+        with stage("response_synthesis"):
+            yield from response.response_gen
+    else:
+        yield str(response.response)
 
-        log(f"Question {user_input}")
-        if api_path == "/uc2":
-            response = query_engine.query(user_input)
 
-            log("Sql query:")
-            log(response.metadata["sql_query"].replace("\n", " "))
-            log(f"Provided response: {response.response}")
-            output = {
-                "source": response.metadata["sql_query"],
-                "answer": response.response,
-            }
+def get_output(api_path, user_input, streaming=False, synthesis_mode=None):
+    """
+    Answers a question.
 
-        elif api_path == "/uc1":
-            output = {
-                "source": "Doc retrieval",
-                "answer": "Getting info from knowledgebase.",
-            }
+    Args:
+        api_path (str): API path of the action group.
+        user_input (str): User question.
+        streaming (bool): Whether to stream the synthesized answer.
+        synthesis_mode (str): "auto" or "llm", defaults to the engine setting.
 
+    Returns:
+        dict: "source" of the answer, and the "answer" chunks as a generator.
+    """
+    if api_path == "/uc2":
+        try:
+            reload_prompt_config()
+        except Exception as e:
+            log(f"Hot reload failed, keeping the current prompts: {e}")
+        # Simple lookups are answered without the LLM, unless it is requested
+        fast_answer = None
+        if synthesis_mode != "llm":
+            with stage("fast_path"):
+                fast_answer = answer_with_fast_path(user_input)
+        if fast_answer is not None:
+            log("Answered with the fast path")
+            sql_query, chunks = fast_answer["sql_query"], iter([fast_answer["answer"]])
+            metadata = fast_answer["metadata"]
         else:
-            output = {
-                "source": "Not Found",
-                "answer": "I don't know enough to answer this question, please try to clarify you quesiton.",
-            }
+            response = get_query_engine().answer_query(
+                user_input, streaming=streaming, synthesis_mode=synthesis_mode
+            )
+            log(f"Synthesis: {response.metadata.get('synthesis')}")
+            if "model_routing" in response.metadata:
+                log(f"Model routing: {json.dumps(response.metadata['model_routing'])}")
+            log(f"Embedding cache: {json.dumps(embedding_cache_stats())}")
+            sql_query, chunks = response.metadata["sql_query"], answer_chunks(response)
+            metadata = response.metadata
+        record("rows", len(metadata.get("result") or []))
+
+        log("Sql query:")
+        log(sql_query.replace("\n", " "))
+        return {"source": sql_query, "answer": chunks}
+
+    elif api_path == "/uc1":
+        answer = "Getting info from knowledgebase."
+        return {"source": "Doc retrieval", "answer": iter([answer])}
+
+    answer = "I don't know enough to answer this question, please try to clarify you quesiton."
+    return {"source": "Not Found", "answer": iter([answer])}
+
+
+def build_response(prediction, output, response_code=200):
+    """
+    Builds the action group response expected by the Amazon Bedrock Agent.
 
-    else:
-        output = {
-            "source": "Not Found",
-            "answer": "Please ask questions one by one.",
-        }
+    Args:
+        prediction (dict): Action group event.
+        output (dict): "source" and "answer" strings.
+        response_code (int): HTTP status code.
 
+    Returns:
+        dict: Lambda response.
+    """
     body = f"""
             Source: {output["source"]}
             Returned information: {output["answer"]}
@@ -78,6 +120,93 @@ def get_response(event, context):
         "responseBody": response_body,
     }
 
-    responses.append(action_response)
-
     return {"messageVersion": "1.0", "response": action_response}
+
+
+def stream_response(event, context=None, streaming=True):
+    """
+    Get response RAG or Query, chunk by chunk.
+
+    Yields {"chunk": str} for every answer chunk as it is generated, then
+    {"response": dict} with the response expected by the agent.
+
+    The synthesis mode ("auto" or "llm") can be set per request with the
+    synthesisMode session attribute, or a synthesisMode event field. Unknown
+    modes are logged and replaced with the configured SYNTHESIS_MODE.
+
+    The stage timings, token counts and rows of the request are logged as
+    CloudWatch EMF metrics when profiling is enabled. When the debug session
+    attribute or event field is "true", they are also logged and returned as
+    JSON in the debugProfile session attribute of the response.
+    """
+
+    log("Logging event:")
+    log(json.dumps(event))
+
+    prediction = event
+    api_path = prediction["apiPath"]
+    parameters = prediction["parameters"]
+    user_input = parameters[0]["value"]
+    session_attributes = prediction.get("sessionAttributes") or {}
+    synthesis_mode = session_attributes.get(
+        "synthesisMode", prediction.get("synthesisMode")
+    )
+    if synthesis_mode is not None and synthesis_mode not in SYNTHESIS_MODES:
+        logger.warning(
+            f"Unknown synthesis mode {synthesis_mode!r}, using "
+            f"{Connections.synthesis_mode}"
+        )
+        synthesis_mode = Connections.synthesis_mode
+    debug = str(session_attributes.get("debug", prediction.get("debug"))) == "true"
+
+    with profile_request(Connections.profiling_enabled or debug) as profile:
+        # Only allow one str, to mitigate mixed prompt injection
+        if isinstance(user_input, str):
+            log(f"Question {user_input}")
+            output = get_output(api_path, user_input, streaming, synthesis_mode)
+        else:
+            output = {
+                "source": "Not Found",
+                "answer": iter(["Please ask questions one by one."]),
+            }
+
+        answer = ""
+        for chunk in output["answer"]:
+            answer += chunk
+            yield {"chunk": chunk}
+    log(f"Provided response: {answer}")
+
+    response = build_response(prediction, {**output, "answer": answer})
+    if profile is not None:
+        if Connections.profiling_enabled:
+            emit_metrics(
+                profile,
+                Connections.metrics_namespace,
+                {"ApiPath": api_path},
+                {"requestId": context.aws_request_id} if context else None,
+            )
+        if debug:
+            debug_profile = json.dumps(profile.to_dict())
+            log(f"Request profile: {debug_profile}")
+            # returned session attributes replace those of the session
+            response["sessionAttributes"] = {
+                **session_attributes,
+                "debugProfile": debug_profile,
+            }
+    yield {"response": response}
+
+
+def get_response(event, context):
+    """
+    Get response RAG or Query
+    """
+
+    # Warm-up events prime the query engine components and connections
+    if event.get("warmUp"):
+        log("Logging event:")
+        log(json.dumps(event))
+        return {"warmUp": warm_up()}
+
+    for message in stream_response(event, context, streaming=False):
+        if "response" in message:
+            return message["response"]
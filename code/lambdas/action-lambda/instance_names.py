@@ -0,0 +1,192 @@
+"""
+instance_names.py
+
+Index resolving instance mentions in a question to canonical instance names.
+
+Names and aliases of the pricing table are indexed by their compact form,
+lowercase without separators, so "p3 8xlarge", "P3.8XLARGE" and "p38xlarge"
+all resolve to "p3.8xlarge", and "A1 Extra Large" to "a1.xlarge".
+
+A mention written as family and size, e.g. "m5.xlrge" or "p3 8xlrge", is
+resolved with a typo only when its family is a family of the table and its
+size is one edit away from a single size of that family. A mention whose size
+is already a size of the table, e.g. "g6.xlarge" when only g5 instances are
+listed, is a well-formed name missing from the table: it is left unchanged, so
+the query returns no rows instead of the price of another instance. Mentions
+matching several instances are left unchanged too.
+"""
+
+import logging
+import re
+import time
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[.\-][A-Za-z0-9]+)*")
+
+INSTANCE_NAME_TABLE = "ec2_pricing"
+
+# Family of a mention matched with a typo, e.g. "p3" or "u-6tb1"
+FUZZY_FAMILY_PATTERN = re.compile(r"[a-z][a-z0-9\-]*\d[a-z0-9\-]*")
+
+# Shortest compact size matched with a typo
+FUZZY_MIN_SIZE_LENGTH = 4
+
+
+def compact(text):
+    """Lowercase text without separators, e.g. "p38xlarge" for "P3 8xlarge"."""
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def within_one_edit(a, b):
+    """Whether two strings are at most one insertion, deletion or substitution
+    apart."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1 :] == b[i + 1 :]
+    return a[i:] == b[i + 1 :]
+
+
+class InstanceNameIndex:
+    """
+    Index of the canonical instance names and their aliases.
+
+    Args:
+        names (list): (instance_name, instance_name_alias) pairs. The alias
+            can be None.
+    """
+
+    def __init__(self, names):
+        self._keys = {}
+        self._sizes = {}
+        self._size_keys = set()
+        self._max_window = 1
+        for name, alias in names:
+            for text, match in ((name, "exact"), (alias, "alias")):
+                if not text:
+                    continue
+                self._keys.setdefault(compact(text), {}).setdefault(name, match)
+                self._max_window = max(
+                    self._max_window, len(TOKEN_PATTERN.findall(text))
+                )
+            family, _, size = name.lower().partition(".")
+            if size:
+                family_sizes = self._sizes.setdefault(compact(family), {})
+                family_sizes.setdefault(compact(size), set()).add(name)
+                self._size_keys.add(compact(size))
+        self.size = len({name for name, _ in names})
+
+    def _exact(self, key):
+        matches = self._keys.get(key, {})
+        if len(matches) != 1:
+            return None
+        return next(iter(matches.items()))
+
+    def _fuzzy(self, tokens):
+        """Resolves a family and size mention with a typo in the size."""
+        if len(tokens) == 1:
+            family, _, size = tokens[0].lower().partition(".")
+        # a word after a family, e.g. "m5 larger", is not taken for a size
+        elif "." not in tokens[0] and any(c.isdigit() for c in tokens[1]):
+            family, size = tokens[0].lower(), tokens[1].lower()
+        else:
+            return None
+        if not FUZZY_FAMILY_PATTERN.fullmatch(family):
+            return None
+        family_sizes = self._sizes.get(compact(family))
+        size_key = compact(size)
+        # an unknown family, or a size of the table, is a name missing from it
+        if not family_sizes or size_key in self._size_keys:
+            return None
+        if len(size_key) < FUZZY_MIN_SIZE_LENGTH:
+            return None
+        names = {
+            name
+            for candidate, candidate_names in family_sizes.items()
+            if within_one_edit(size_key, candidate)
+            for name in candidate_names
+        }
+        if len(names) != 1:
+            return None
+        return names.pop(), "fuzzy"
+
+    def resolve(self, question):
+        """
+        Rewrites the instance mentions of a question to canonical names.
+
+        Mentions are matched left to right, longest first.
+
+        Args:
+            question (str): User question.
+
+        Returns:
+            rewritten (str): Question with canonical instance names.
+            entities (list): Resolved mentions, as dictionaries with "mention",
+                "instance_name" and "match" ("exact", "alias" or "fuzzy").
+        """
+        start_time = time.perf_counter()
+        tokens = list(TOKEN_PATTERN.finditer(question))
+        entities, parts, position, i = [], [], 0, 0
+        while i < len(tokens):
+            resolved = None
+            for end in range(min(len(tokens), i + self._max_window), i, -1):
+                key = compact("".join(t.group(0) for t in tokens[i:end]))
+                resolved = self._exact(key)
+                if resolved is None and end - i <= 2:
+                    resolved = self._fuzzy([t.group(0) for t in tokens[i:end]])
+                if resolved is not None:
+                    break
+            if resolved is None:
+                i += 1
+                continue
+
+            name, match = resolved
+            span_start, span_end = tokens[i].start(), tokens[end - 1].end()
+            mention = question[span_start:span_end]
+            entities.append(
+                {"mention": mention, "instance_name": name, "match": match}
+            )
+            parts.extend([question[position:span_start], name])
+            position, i = span_end, end
+
+        parts.append(question[position:])
+        logger.debug(
+            f"Resolved {len(entities)} instance names in "
+            f"{(time.perf_counter() - start_time) * 1000:.3f}ms"
+        )
+        return "".join(parts), entities
+
+
+def load_instance_name_index(sql_database, table):
+    """
+    Builds the instance name index from the pricing table.
+
+    Args:
+        sql_database (SQLDatabase): SQL database holding the table.
+        table (str): Name of the pricing table.
+
+    Returns:
+        InstanceNameIndex: The index, or None if the table has no instance_name.
+    """
+    if table not in sql_database.get_usable_table_names():
+        return None
+    columns = {
+        column["name"].lower() for column in sql_database.get_table_columns(table)
+    }
+    if "instance_name" not in columns:
+        return None
+    alias = "instance_name_alias" if "instance_name_alias" in columns else "NULL"
+    _, metadata = sql_database.run_sql(
+        f"SELECT DISTINCT instance_name, {alias} FROM {table}"
+    )
+    index = InstanceNameIndex([tuple(row) for row in metadata["result"]])
+    logger.info(f"Indexed {index.size} instance names")
+    return index
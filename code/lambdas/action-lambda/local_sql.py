@@ -0,0 +1,410 @@
+"""
+local_sql.py
+
+Embedded SQL execution over an in-memory SQLite copy of the Glue tables.
+
+At cold start, the csv or Parquet data files of every Glue table below a size
+threshold are read from S3 into an in-memory SQLite database, with the Glue
+column names and types. Queries reading only cached tables then run in process, without the
+Athena queueing and S3 staging. Queries on other tables, or queries SQLite
+fails to run, fall back to Athena.
+
+The same query must return the same rows from both engines. LIKE is made case
+sensitive, as in Athena, and every ORDER BY item without a NULLS clause is
+sorted NULLS LAST, Athena's default, where SQLite sorts NULLs first in
+ascending order. Queries whose semantics differ in SQLite are left to Athena: divisions (decimal precision, division by zero), comparisons of a
+string column with a number or of a numeric column with a string (converted
+by SQLite, rejected by Athena), and functions other than the few both engines
+implement alike.
+"""
+
+import csv
+import io
+import logging
+
+from llama_index.core import SQLDatabase
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from result_cache import SQL_TOKEN_PATTERN, normalize_sql, referenced_tables
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    # without pyarrow, Parquet tables are left to Athena
+    pq = None
+
+# Glue column types and the SQLite type and Python conversion used for them
+GLUE_TYPE_MAPPING = {
+    "string": ("TEXT", str),
+    "varchar": ("TEXT", str),
+    "char": ("TEXT", str),
+    "double": ("REAL", float),
+    "float": ("REAL", float),
+    "decimal": ("REAL", float),
+    "bigint": ("INTEGER", int),
+    "int": ("INTEGER", int),
+    "smallint": ("INTEGER", int),
+    "tinyint": ("INTEGER", int),
+    "boolean": ("INTEGER", lambda v: v.lower() == "true"),
+}
+
+# Functions SQLite and Athena evaluate alike
+LOCAL_SQL_FUNCTIONS = {
+    "abs",
+    "avg",
+    "cast",
+    "coalesce",
+    "count",
+    "length",
+    "lower",
+    "max",
+    "min",
+    "nullif",
+    "round",
+    "sum",
+    "upper",
+}
+
+# Keywords that can precede a parenthesis without being a function call
+SQL_KEYWORDS_BEFORE_PARENTHESIS = {
+    "and",
+    "as",
+    "by",
+    "case",
+    "else",
+    "exists",
+    "from",
+    "having",
+    "in",
+    "join",
+    "not",
+    "on",
+    "or",
+    "select",
+    "then",
+    "values",
+    "when",
+    "where",
+}
+
+COMPARISON_OPERATORS = {"=", "<>", "!=", "<", ">", "<=", ">="}
+
+# Keywords ending an ORDER BY clause
+ORDER_BY_END_KEYWORDS = {"limit", "offset", "fetch", "union", "intersect", "except"}
+
+
+def glue_type(column_type):
+    """SQLite type and conversion of a Glue column type, e.g. "decimal(10,2)"."""
+    base_type = column_type.split("(")[0].strip().lower()
+    return GLUE_TYPE_MAPPING.get(base_type, ("TEXT", str))
+
+
+def convert_value(convert, value):
+    """Converts a csv value, mapping empty and malformed values to NULL."""
+    if value == "":
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        return None
+
+
+def set_case_sensitive_like(dbapi_connection, connection_record):
+    """Makes LIKE case sensitive on a new SQLite connection, as in Athena."""
+    dbapi_connection.execute("PRAGMA case_sensitive_like = ON")
+
+
+def is_number(token):
+    """Whether a SQL token is a numeric literal."""
+    return token[0].isdigit()
+
+
+def nulls_last(sql):
+    """
+    Sorts the NULLs of every ORDER BY item last, as Athena does by default.
+
+    Args:
+        sql (str): SQL query.
+
+    Returns:
+        str: The query, with NULLS LAST after every ORDER BY item without a
+            NULLS clause.
+    """
+    tokens = list(SQL_TOKEN_PATTERN.finditer(sql))
+    words = [token.group(0).lower() for token in tokens]
+    positions = []
+    for i in range(len(tokens) - 1):
+        if words[i] != "order" or words[i + 1] != "by":
+            continue
+        depth, has_nulls = 0, False
+        for j in range(i + 2, len(tokens) + 1):
+            word = words[j] if j < len(tokens) else None
+            if word == "(":
+                depth += 1
+                continue
+            if word == ")" and depth > 0:
+                depth -= 1
+                continue
+            if depth == 0 and (
+                word in (None, ",", ")", ";") or word in ORDER_BY_END_KEYWORDS
+            ):
+                # end of an item, right after its last token
+                if not has_nulls:
+                    positions.append(tokens[j - 1].end())
+                has_nulls = False
+                if word != ",":
+                    break
+                continue
+            if word == "nulls":
+                has_nulls = True
+    for position in sorted(positions, reverse=True):
+        sql = f"{sql[:position]} NULLS LAST{sql[position:]}"
+    return sql
+
+
+def split_s3_uri(uri):
+    """Splits an s3://bucket/prefix uri into bucket and prefix."""
+    bucket, _, prefix = uri.split("//", 1)[1].partition("/")
+    return bucket, prefix
+
+
+def list_table_objects(s3_client, location):
+    """
+    Lists the data files of a table location.
+
+    Args:
+        s3_client (boto3.client): The S3 client.
+        location (str): S3 location of the table.
+
+    Returns:
+        list: (bucket, key, size) of every object below the location.
+    """
+    bucket, prefix = split_s3_uri(location)
+    objects = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):
+                objects.append((bucket, obj["Key"], obj["Size"]))
+    return objects
+
+
+def read_csv_rows(body, columns, skip_header):
+    """
+    Parses the rows of a csv data file with the Glue column types.
+
+    Args:
+        body (str): Content of the csv file.
+        columns (list): Glue columns, with "Name" and "Type".
+        skip_header (bool): Whether the first line is a header.
+
+    Returns:
+        list: Converted rows.
+    """
+    converters = [glue_type(column["Type"])[1] for column in columns]
+    reader = csv.reader(io.StringIO(body))
+    if skip_header:
+        next(reader, None)
+    rows = []
+    for record in reader:
+        rows.append(
+            tuple(
+                convert_value(convert, value)
+                for convert, value in zip(converters, record)
+            )
+        )
+    return rows
+
+
+def read_parquet_rows(body, columns):
+    """
+    Reads the rows of a Parquet data file in the order of the Glue columns.
+
+    Args:
+        body (bytes): Content of the Parquet file.
+        columns (list): Glue columns, with "Name" and "Type".
+
+    Returns:
+        list: Rows.
+    """
+    table = pq.read_table(io.BytesIO(body))
+    names = {name.lower(): name for name in table.column_names}
+    values = [table.column(names[column["Name"]]).to_pylist() for column in columns]
+    return list(zip(*values))
+
+
+def table_format(glue_table):
+    """Data format of a Glue table: "csv", "parquet" or None if unsupported."""
+    classification = glue_table.get("Parameters", {}).get("classification")
+    serde_library = (
+        glue_table["StorageDescriptor"]
+        .get("SerdeInfo", {})
+        .get("SerializationLibrary", "")
+        .lower()
+    )
+    if classification == "parquet" or "parquet" in serde_library:
+        return "parquet" if pq is not None else None
+    if classification == "csv" or "csv" in serde_library:
+        return "csv"
+    if "lazysimple" in serde_library:
+        return "csv"
+    return None
+
+
+def load_table(connection, s3_client, glue_table, max_bytes):
+    """
+    Copies a Glue csv or Parquet table into SQLite.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Connection to the SQLite database.
+        s3_client (boto3.client): The S3 client.
+        glue_table (dict): Table definition returned by Glue.
+        max_bytes (int): Maximum size of the table data files.
+
+    Returns:
+        bool: True if the table was copied.
+    """
+    name = glue_table["Name"]
+    storage = glue_table["StorageDescriptor"]
+    data_format = table_format(glue_table)
+    if data_format is None:
+        logger.info(f"Not caching table {name}: unsupported format")
+        return False
+
+    objects = list_table_objects(s3_client, storage["Location"])
+    total_bytes = sum(size for _, _, size in objects)
+    if total_bytes > max_bytes:
+        logger.info(f"Not caching table {name}: {total_bytes} bytes")
+        return False
+
+    columns = storage["Columns"]
+    skip_header = glue_table.get("Parameters", {}).get("skip.header.line.count") == "1"
+    column_defs = ", ".join(
+        f'"{column["Name"]}" {glue_type(column["Type"])[0]}' for column in columns
+    )
+    placeholders = ", ".join(f":c{i}" for i in range(len(columns)))
+    connection.execute(text(f'CREATE TABLE "{name}" ({column_defs})'))
+    for bucket, key, _ in objects:
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        if data_format == "parquet":
+            rows = read_parquet_rows(body, columns)
+        else:
+            rows = read_csv_rows(body.decode("utf-8-sig"), columns, skip_header)
+        if rows:
+            connection.execute(
+                text(f'INSERT INTO "{name}" VALUES ({placeholders})'),
+                [{f"c{i}": value for i, value in enumerate(row)} for row in rows],
+            )
+    logger.info(f"Cached table {name} in SQLite ({total_bytes} bytes)")
+    return True
+
+
+class LocalSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase over an in-memory SQLite copy of some of the Glue tables.
+
+    Args:
+        engine (sqlalchemy.engine.base.Engine): SQLite engine holding the tables.
+        cached_tables (set): Names of the tables copied into SQLite.
+        column_types (dict): Table name -> lowercase column name -> SQLite type.
+    """
+
+    def __init__(self, engine, cached_tables, column_types=None):
+        super().__init__(engine)
+        self.cached_tables = cached_tables
+        self.column_types = column_types or {}
+
+    def run_sql(self, command):
+        """Runs a query, sorting NULLs last as Athena does."""
+        return super().run_sql(nulls_last(command))
+
+    def _column_types(self, tables, sqlite_type):
+        """Lowercase names of the columns of a SQLite type in some tables."""
+        return {
+            column
+            for table in tables
+            for column, column_type in self.column_types.get(table, {}).items()
+            if column_type == sqlite_type
+        }
+
+    def can_run(self, sql):
+        """
+        Whether a query only reads tables held in SQLite, and SQLite returns the
+        rows Athena would.
+
+        Args:
+            sql (str): SQL query generated for Athena.
+
+        Returns:
+            bool: True if the query can run in SQLite.
+        """
+        normalized_sql = normalize_sql(sql)
+        tables = referenced_tables(normalized_sql)
+        if not tables or not tables <= self.cached_tables:
+            return False
+
+        tokens = normalized_sql.split(" ")
+        text_columns = self._column_types(tables, "TEXT")
+        numeric_columns = self._column_types(tables, "INTEGER") | self._column_types(
+            tables, "REAL"
+        )
+        for i, token in enumerate(tokens):
+            if token == "/":
+                return False
+            following = tokens[i + 1] if i + 1 < len(tokens) else ""
+            if (
+                following == "("
+                and token[0].isalpha()
+                and token not in SQL_KEYWORDS_BEFORE_PARENTHESIS
+                and token not in LOCAL_SQL_FUNCTIONS
+            ):
+                return False
+            if token in COMPARISON_OPERATORS and 0 < i < len(tokens) - 1:
+                left, right = tokens[i - 1], tokens[i + 1]
+                for column, literal in ((left, right), (right, left)):
+                    if column in text_columns and is_number(literal):
+                        return False
+                    if column in numeric_columns and literal.startswith("'"):
+                        return False
+        return True
+
+
+def load_local_sql_database(glue_client, s3_client, database, max_bytes):
+    """
+    Copies the Glue tables of a database below a size threshold into SQLite.
+
+    Args:
+        glue_client (boto3.client): The Glue client.
+        s3_client (boto3.client): The S3 client.
+        database (str): Name of the Glue database.
+        max_bytes (int): Maximum size of the data files of a cached table.
+
+    Returns:
+        LocalSQLDatabase: The in-memory database, or None if no table was cached.
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    event.listen(engine, "connect", set_case_sensitive_like)
+    cached_tables, column_types = set(), {}
+    paginator = glue_client.get_paginator("get_tables")
+    with engine.begin() as connection:
+        for page in paginator.paginate(DatabaseName=database):
+            for glue_table in page["TableList"]:
+                if load_table(connection, s3_client, glue_table, max_bytes):
+                    cached_tables.add(glue_table["Name"])
+                    column_types[glue_table["Name"]] = {
+                        column["Name"].lower(): glue_type(column["Type"])[0]
+                        for column in glue_table["StorageDescriptor"]["Columns"]
+                    }
+
+    if not cached_tables:
+        return None
+    return LocalSQLDatabase(engine, cached_tables, column_types)
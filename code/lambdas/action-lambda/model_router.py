@@ -0,0 +1,208 @@
+"""
+model_router.py
+
+Complexity based routing of the text-to-SQL generation between Bedrock models.
+
+Every question is scored from the number of instances it names, its aggregation
+and comparison keywords, its length, and whether a few-shot example is close to
+it. Questions scoring below the threshold go to the fast model, the others to
+the strong model. When the SQL of the fast model fails to execute, the question
+is escalated to the strong model.
+"""
+
+import logging
+
+from fast_path import INSTANCE_NAME_PATTERN, WORD_PATTERN
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+AGGREGATION_WORDS = {
+    "average",
+    "avg",
+    "mean",
+    "median",
+    "sum",
+    "total",
+    "count",
+    "many",
+    "number",
+    "group",
+    "per",
+    "each",
+    "every",
+    "distribution",
+    "top",
+    "rank",
+    "most",
+    "least",
+    "highest",
+    "lowest",
+    "largest",
+    "smallest",
+    "maximum",
+    "minimum",
+    "max",
+    "min",
+}
+COMPARISON_WORDS = {
+    "compare",
+    "comparison",
+    "versus",
+    "vs",
+    "difference",
+    "between",
+    "than",
+    "cheaper",
+    "cheapest",
+    "better",
+    "best",
+    "ratio",
+    "relative",
+    "percent",
+    "percentage",
+    "without",
+    "except",
+    "excluding",
+}
+
+# Weight of every feature in the complexity score
+DEFAULT_WEIGHTS = {
+    "entities": 0.5,
+    "aggregations": 1.0,
+    "comparisons": 1.0,
+    "words": 0.05,
+    "few_shot_match": -1.5,
+}
+
+
+def question_features(question, entities=None, few_shot_score=None):
+    """
+    Extracts the complexity features of a question.
+
+    Args:
+        question (str): User question.
+        entities (list): Instance mentions resolved by the instance name index.
+            None counts the instance names in the INSTANCE_FAMILY.INSTANCE_SIZE
+            format instead.
+        few_shot_score (float): Similarity of the closest few-shot example.
+
+    Returns:
+        dict: "entities", "aggregations", "comparisons", "words" counts and the
+            "few_shot_score".
+    """
+    lowered = question.lower()
+    words = WORD_PATTERN.findall(lowered)
+    if entities is None:
+        entity_count = len(set(INSTANCE_NAME_PATTERN.findall(lowered)))
+    else:
+        entity_count = len({entity["instance_name"] for entity in entities})
+    return {
+        "entities": entity_count,
+        "aggregations": sum(word in AGGREGATION_WORDS for word in words),
+        "comparisons": sum(word in COMPARISON_WORDS for word in words),
+        "words": len(words),
+        "few_shot_score": few_shot_score,
+    }
+
+
+def complexity_score(features, weights, few_shot_threshold):
+    """
+    Scores the complexity of a question from its features.
+
+    The first named instance and the first ten words are free, as every
+    question has them.
+
+    Args:
+        features (dict): Features of the question, see question_features.
+        weights (dict): Weight of every feature, see DEFAULT_WEIGHTS.
+        few_shot_threshold (float): Similarity from which a few-shot example
+            matches the question.
+
+    Returns:
+        float: Complexity score, higher for harder questions.
+    """
+    few_shot_score = features["few_shot_score"]
+    few_shot_match = few_shot_score is not None and few_shot_score >= few_shot_threshold
+    return (
+        weights["entities"] * max(features["entities"] - 1, 0)
+        + weights["aggregations"] * features["aggregations"]
+        + weights["comparisons"] * features["comparisons"]
+        + weights["words"] * max(features["words"] - 10, 0)
+        + weights["few_shot_match"] * few_shot_match
+    )
+
+
+class ModelRouter:
+    """
+    Chooses the model generating the SQL of a question.
+
+    Args:
+        fast_model (str): Model name of the simple questions, e.g. "ClaudeInstant".
+        strong_model (str): Model name of the hard questions, e.g. "Claude2".
+        get_llm (callable): Function returning the LLM of a model name.
+        threshold (float): Complexity score from which the strong model is used.
+        few_shot_threshold (float): Similarity from which a few-shot example
+            matches the question.
+        escalate (bool): Whether to retry with the strong model when the SQL
+            of the fast model fails.
+        few_shot_score_fn (callable): Function returning the similarity of the
+            closest few-shot example of a question. None ignores the feature.
+        weights (dict): Weight of every feature. Defaults to DEFAULT_WEIGHTS.
+    """
+
+    def __init__(
+        self,
+        fast_model,
+        strong_model,
+        get_llm,
+        threshold=2.0,
+        few_shot_threshold=0.8,
+        escalate=True,
+        few_shot_score_fn=None,
+        weights=None,
+    ):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self._get_llm = get_llm
+        self._threshold = threshold
+        self._few_shot_threshold = few_shot_threshold
+        self._escalate = escalate
+        self._few_shot_score_fn = few_shot_score_fn
+        self._weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+
+    def get_llm(self, model_name):
+        """Gets the LLM of a model name."""
+        return self._get_llm(model_name)
+
+    def route(self, question, entities=None):
+        """
+        Chooses the model of a question.
+
+        Args:
+            question (str): User question.
+            entities (list): Instance mentions resolved in the question.
+
+        Returns:
+            dict: Chosen "model", complexity "score" and "features".
+        """
+        few_shot_score = None
+        if self._few_shot_score_fn is not None:
+            try:
+                few_shot_score = self._few_shot_score_fn(question)
+            except Exception as e:
+                logger.warning(f"Could not score the few-shot examples: {e}")
+        features = question_features(question, entities, few_shot_score)
+        score = complexity_score(features, self._weights, self._few_shot_threshold)
+        model = self.strong_model if score >= self._threshold else self.fast_model
+        logger.info(f"Routed to {model} with complexity {score:.2f}: {features}")
+        return {"model": model, "score": round(score, 4), "features": features}
+
+    def should_escalate(self, model_name, metadata):
+        """Whether to retry a question with the strong model after a run."""
+        return (
+            self._escalate
+            and model_name != self.strong_model
+            and "sql_error" in metadata
+        )
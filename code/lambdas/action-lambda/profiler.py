@@ -0,0 +1,275 @@
+"""
+profiler.py
+
+Per-stage latency profiling of the action lambda requests.
+
+A request opens a profile_request scope, and every stage of interest runs in a
+stage block: few-shot retrieval, table retrieval, SQL generation, SQL
+execution and response synthesis. Stage times are exclusive, so a stage nested
+in another, e.g. the few-shot retrieval run while formatting the text-to-SQL
+prompt, is not counted twice. Token counts of the Bedrock LLM calls are added
+by ProfileTokenHandler, and the rows returned by the request.
+
+The profile is emitted as one CloudWatch Embedded Metric Format (EMF) log line,
+which CloudWatch turns into metrics without any PutMetricData call. Outside a
+profile_request scope, stage and record do nothing but read a context variable.
+"""
+
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Rough number of characters per token of the Bedrock models, used when the
+# response does not report its token counts
+CHARS_PER_TOKEN = 4
+
+_profile = contextvars.ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """Stage times, in seconds, and counts of a request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.stages = {}
+        self.counts = {}
+        # time spent in the nested stages of every open stage
+        self._children = []
+
+    def finish(self):
+        """Stops the total time of the request."""
+        self.total = time.perf_counter() - self.start
+
+    def to_dict(self):
+        """Stage times in milliseconds, and counts."""
+        total = self.total
+        if total is None:
+            total = time.perf_counter() - self.start
+        return {
+            "stages_ms": {
+                name: round(seconds * 1000, 2) for name, seconds in self.stages.items()
+            },
+            "total_ms": round(total * 1000, 2),
+            **self.counts,
+        }
+
+
+@contextmanager
+def profile_request(enabled=True):
+    """
+    Profiles the stages run until the end of the block.
+
+    Nested scopes reuse the outer profile.
+
+    Args:
+        enabled (bool): Whether to profile, a disabled scope yields None.
+
+    Returns:
+        RequestProfile: The request profile, None when disabled.
+    """
+    profile = _profile.get()
+    if profile is not None or not enabled:
+        yield profile
+        return
+    profile = RequestProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+        profile.finish()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the profiled request, if any.
+
+    Args:
+        name (str): Stage name, times of the stages with the same name add up.
+    """
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    profile._children.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        children = profile._children.pop()
+        profile.stages[name] = profile.stages.get(name, 0.0) + elapsed - children
+        if profile._children:
+            profile._children[-1] += elapsed
+
+
+def record(name, value=1):
+    """
+    Adds a value to a count of the profiled request, if any.
+
+    Args:
+        name (str): Count name, e.g. "prompt_tokens".
+        value (int): Value to add.
+    """
+    profile = _profile.get()
+    if profile is not None:
+        profile.counts[name] = profile.counts.get(name, 0) + value
+
+
+def emf_record(profile, namespace, dimensions, properties=None):
+    """
+    Embedded Metric Format record of a request profile.
+
+    Args:
+        profile (RequestProfile): The request profile.
+        namespace (str): CloudWatch metrics namespace.
+        dimensions (dict): Dimension name -> value of every metric.
+        properties (dict): Values logged with the metrics, but not as metrics,
+            e.g. the request id.
+
+    Returns:
+        dict: The EMF record.
+    """
+    profile_dict = profile.to_dict()
+    metrics = {
+        f"{name}_ms": value for name, value in profile_dict["stages_ms"].items()
+    }
+    metrics["total_ms"] = profile_dict["total_ms"]
+    definitions = [{"Name": name, "Unit": "Milliseconds"} for name in metrics]
+    definitions += [{"Name": name, "Unit": "Count"} for name in profile.counts]
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": definitions,
+                }
+            ],
+        },
+        **(properties or {}),
+        **dimensions,
+        **metrics,
+        **profile.counts,
+    }
+
+
+def emit_metrics(profile, namespace, dimensions, properties=None):
+    """
+    Writes the EMF record of a request profile to the Lambda logs.
+
+    The record is printed rather than logged, since CloudWatch only extracts
+    the metrics of log events that are a JSON object, without the prefix of
+    the Lambda log handler.
+
+    Args:
+        profile (RequestProfile): The request profile.
+        namespace (str): CloudWatch metrics namespace.
+        dimensions (dict): Dimension name -> value of every metric.
+        properties (dict): Values logged with the metrics.
+    """
+    emf = emf_record(profile, namespace, dimensions, properties)
+    print(json.dumps(emf, default=str), flush=True)
+
+
+def count_tokens(text):
+    """Estimated number of tokens of a text."""
+    return -(-len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def reported_token_counts(raw):
+    """
+    Token counts reported in a Bedrock response body, if any.
+
+    Args:
+        raw (dict): Response body.
+
+    Returns:
+        tuple: Prompt and completion tokens, None when not reported.
+    """
+    if not isinstance(raw, dict):
+        return None
+    usage = raw.get("usage")
+    if isinstance(usage, dict) and "input_tokens" in usage:
+        return usage["input_tokens"], usage.get("output_tokens", 0)
+    # amazon.titan-tg1-large
+    if "inputTextTokenCount" in raw:
+        results = raw.get("results", [])
+        return raw["inputTextTokenCount"], sum(r.get("tokenCount", 0) for r in results)
+    return None
+
+
+class ProfileTokenHandler(BaseCallbackHandler):
+    """
+    Callback handler adding the tokens of the LLM calls to the request profile.
+
+    The tokens reported by the model are used when the response body holds
+    them, otherwise they are estimated from the text length, which is flagged
+    by the "estimated_tokens" count.
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        if event_type != CBEventType.LLM or not payload or _profile.get() is None:
+            return
+        # streamed completions report the last response as the completion
+        response = payload.get(EventPayload.RESPONSE) or payload.get(
+            EventPayload.COMPLETION
+        )
+        counts = reported_token_counts(getattr(response, "raw", None))
+        if counts is None:
+            if EventPayload.PROMPT in payload:
+                prompt = str(payload[EventPayload.PROMPT])
+            else:
+                prompt = "\n".join(
+                    str(m) for m in payload.get(EventPayload.MESSAGES, [])
+                )
+            completion = getattr(response, "text", None)
+            if completion is None and response is not None:
+                completion = str(response)
+            counts = count_tokens(prompt), count_tokens(completion)
+            record("estimated_tokens", counts[0] + counts[1])
+        record("llm_calls")
+        record("prompt_tokens", counts[0])
+        record("completion_tokens", counts[1])
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        return None
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        return None
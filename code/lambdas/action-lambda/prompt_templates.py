@@ -1,6 +1,43 @@
 # Tables used by Agent for text to SQL
 table_details = {
-    "ec2_pricing": "Information about EC2 instance pricing and other details.",
+    "ec2_pricing": (
+        "Information about EC2 instance pricing and other details. Use the "
+        "numeric storage_gb, storage_disk_count, storage_nvme and network_gbps "
+        "columns and instance_family to filter on storage, network performance "
+        "or instance family."
+    ),
+}
+
+# Short descriptions of the columns, retrieved with the columns for the prompt
+column_details = {
+    "ec2_pricing": {
+        "instance_name_alias": 'Descriptive instance name, e.g. "A1 Extra Large"',
+        "instance_name": 'Instance name as family.size, e.g. "p3.8xlarge"',
+        "instance_family": 'Instance family, e.g. "p3" or "trn1n"',
+        "instance_memory_gib": "Memory (RAM) in GiB",
+        "number_vcpus": "Number of vCPUs, CPU cores",
+        "instance_storage_type_and_capacity": (
+            'Instance storage as text, e.g. "900 GB (2 * 450 GB NVMe SSD)" or '
+            '"EBS only"'
+        ),
+        "storage_gb": "Total instance storage (disk) in GB, 0 for EBS only",
+        "storage_disk_count": "Number of instance storage disks",
+        "storage_nvme": "Whether the instance storage is NVMe",
+        "network_performance": (
+            'Network performance as text, e.g. "Up to 25 Gigabit"'
+        ),
+        "network_gbps": "Peak network bandwidth in Gbps",
+        "on_demand_hourly_price": "On-demand price per hour in USD",
+        "linux_reserved_cost_1_year_hourly": (
+            "1 year reserved Linux price per hour in USD"
+        ),
+        "linux_spot_minimum_cost_hourly": "Minimum Linux spot price per hour in USD",
+    },
+}
+
+# Columns always included in the prompt schema
+table_key_columns = {
+    "ec2_pricing": ["instance_name"],
 }
 
 # prompts for pricing details retrieval
@@ -0,0 +1,236 @@
+"""
+result_cache.py
+
+Cache of SQL query results between the query engine and Athena.
+
+Results are keyed by a canonical form of the SQL query, so queries differing
+only in whitespace, keyword case or the order of IN list literals share an
+entry. Every entry is tagged with the Glue version (VersionId and UpdateTime)
+of the tables it reads, and is dropped once one of them changes, e.g. after the
+Glue crawler updated the table. A time to live bounds how long results are
+served when the data changes without a table update.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from schema_snapshot import get_glue_table_versions
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SQL_TOKEN_PATTERN = re.compile(
+    r"""
+    '(?:[^']|'')*'          # string literal
+    | "(?:[^"]|"")*"        # quoted identifier
+    | `[^`]*`               # backquoted identifier
+    | \d+(?:\.\d+)?         # number
+    | [A-Za-z_][\w$]*       # keyword or identifier
+    | <> | != | <= | >= | \|\|
+    | \S                    # any other symbol
+    """,
+    re.VERBOSE,
+)
+
+
+def _is_literal(token):
+    return token.startswith("'") or token[0].isdigit()
+
+
+def _sort_in_lists(tokens):
+    """Sorts the literals of every IN (...) list that holds literals only."""
+    result = []
+    i = 0
+    while i < len(tokens):
+        result.append(tokens[i])
+        if tokens[i] == "in" and i + 1 < len(tokens) and tokens[i + 1] == "(":
+            end = i + 2
+            while end < len(tokens) and tokens[end] != ")":
+                end += 1
+            items = tokens[i + 2 : end : 2]
+            separators = tokens[i + 3 : end : 2]
+            if (
+                end < len(tokens)
+                and items
+                and all(_is_literal(t) for t in items)
+                and all(t == "," for t in separators)
+            ):
+                sorted_items = sorted(set(items))
+                result.append("(")
+                result.append(" , ".join(sorted_items))
+                result.append(")")
+                i = end + 1
+                continue
+        i += 1
+    return result
+
+
+def normalize_sql(sql):
+    """
+    Canonical form of a SQL query.
+
+    Whitespace is collapsed, keywords and identifiers are lowercased, trailing
+    semicolons are removed, and the literals of IN lists are sorted. String
+    literals keep their case.
+
+    Args:
+        sql (str): SQL query.
+
+    Returns:
+        str: Canonical SQL query.
+    """
+    tokens = [
+        token if token.startswith("'") else token.lower()
+        for token in SQL_TOKEN_PATTERN.findall(sql.strip().rstrip(";"))
+    ]
+    tokens = [token.strip('"`') if token[0] in '"`' else token for token in tokens]
+    return " ".join(_sort_in_lists(tokens))
+
+
+def referenced_tables(normalized_sql):
+    """
+    Names of the tables a canonical SQL query reads from.
+
+    Args:
+        normalized_sql (str): Canonical SQL query.
+
+    Returns:
+        set: Table names, without database prefix.
+    """
+    tokens = normalized_sql.split(" ")
+    tables = set()
+    for i, token in enumerate(tokens[:-1]):
+        if token in ("from", "join") and tokens[i + 1] != "(":
+            name = tokens[i + 1]
+            # skip "database . table"
+            if i + 3 < len(tokens) and tokens[i + 2] == ".":
+                name = tokens[i + 3]
+            tables.add(name)
+    return tables
+
+
+class GlueTableVersions:
+    """
+    Glue table versions of a database, fetched at most once per check interval.
+
+    Args:
+        glue_client (boto3.client): The Glue client.
+        database (str): Name of the Glue database.
+        check_interval (int): Seconds during which fetched versions are reused.
+    """
+
+    def __init__(self, glue_client, database, check_interval=60):
+        self.glue_client = glue_client
+        self.database = database
+        self.check_interval = check_interval
+        self._versions = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if (
+                self._versions is None
+                or time.time() - self._fetched_at > self.check_interval
+            ):
+                self._versions = get_glue_table_versions(
+                    self.glue_client, self.database
+                )
+                self._fetched_at = time.time()
+            return self._versions
+
+
+class SQLResultCache:
+    """
+    In-process LRU cache of SQL results, invalidated by Glue table versions.
+
+    Args:
+        table_versions (GlueTableVersions): Source of the current table versions.
+        max_entries (int): Maximum number of cached results.
+        ttl (int): Seconds after which a result expires. 0 disables expiry.
+    """
+
+    def __init__(self, table_versions, max_entries=256, ttl=3600):
+        self.table_versions = table_versions
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _versions_of(self, key):
+        versions = self.table_versions.get()
+        tables = referenced_tables(key) & set(versions)
+        if not tables:
+            # unknown tables, tag with every table of the database
+            tables = set(versions)
+        return {table: versions[table] for table in sorted(tables)}
+
+    def get(self, sql):
+        """
+        Gets the cached result of a SQL query.
+
+        Args:
+            sql (str): SQL query.
+
+        Returns:
+            tuple: (retrieved_nodes, metadata) of the query, or None on a miss.
+        """
+        key = normalize_sql(sql)
+        # the versions may take a Glue call, made without holding the lock and
+        # only for a cached query
+        versions = self._versions_of(key) if key in self._entries else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and versions is not None:
+                expired = self.ttl and time.time() - entry["stored_at"] > self.ttl
+                if expired or entry["versions"] != versions:
+                    logger.info("Dropping outdated SQL result from cache")
+                    del self._entries[key]
+                    entry = None
+            if entry is None or versions is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return list(entry["nodes"]), dict(entry["metadata"])
+
+    def put(self, sql, retrieved_nodes, metadata):
+        """
+        Stores the result of a SQL query.
+
+        Args:
+            sql (str): SQL query.
+            retrieved_nodes (list): Result nodes of the query.
+            metadata (dict): Result metadata of the query.
+
+        Returns:
+            None
+        """
+        key = normalize_sql(sql)
+        versions = self._versions_of(key)
+        with self._lock:
+            self._entries[key] = {
+                "nodes": list(retrieved_nodes),
+                "metadata": dict(metadata),
+                "versions": versions,
+                "stored_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit and miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,364 @@
+"""
+schema_snapshot.py
+
+Snapshot of the reflected Athena schema, so the SQL engine can be rebuilt on
+cold start without metadata queries or table-schema embeddings.
+
+A snapshot holds, per table, the reflected columns, the table info string
+handed to the text-to-SQL prompt, the table context string, the table node text
+and its embedding, the column node embeddings, and the Glue table version it
+was taken from. It is read
+from a file baked into the image, or from S3, and is refreshed in the
+background when the Glue table versions no longer match. A snapshot that cannot
+be read, or has another format, is ignored and the schema is introspected live.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+from llama_index.core import SQLDatabase
+from llama_index.core.objects import SQLTableNodeMapping, SQLTableSchema
+from llama_index.core.objects.base import ObjectRetriever
+from llama_index.core.schema import MetadataMode
+from sqlalchemy import MetaData
+
+from column_retriever import column_nodes
+from embedding_context import embed_texts
+from vector_retriever import NumpyVectorRetriever, embed_nodes
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase that serves table metadata from a schema snapshot.
+
+    Unlike SQLDatabase, it does not inspect or reflect the engine on creation.
+    Queries still run against the engine.
+    """
+
+    def __init__(self, engine, snapshot, max_string_length=300):
+        self._engine = engine
+        self._schema = None
+        self._snapshot_tables = snapshot["tables"]
+        self._all_tables = set(self._snapshot_tables)
+        self._include_tables = set()
+        self._ignore_tables = set()
+        self._usable_tables = set(self._all_tables)
+        self._sample_rows_in_table_info = snapshot["sample_rows_in_table_info"]
+        self._indexes_in_table_info = False
+        self._custom_table_info = None
+        self._max_string_length = max_string_length
+        self._metadata = MetaData()
+
+    def get_table_columns(self, table_name):
+        return self._snapshot_tables[table_name]["columns"]
+
+    def get_single_table_info(self, table_name):
+        return self._snapshot_tables[table_name]["table_info"]
+
+
+def get_glue_table_versions(glue_client, database):
+    """
+    Gets the version of every table in a Glue database.
+
+    Args:
+        glue_client (boto3.client): The Glue client.
+        database (str): Name of the Glue database.
+
+    Returns:
+        dict: Table name -> version string (VersionId and UpdateTime).
+    """
+    versions = {}
+    paginator = glue_client.get_paginator("get_tables")
+    for page in paginator.paginate(DatabaseName=database):
+        for table in page["TableList"]:
+            update_time = table.get("UpdateTime") or table.get("CreateTime")
+            update_str = update_time.isoformat() if update_time else ""
+            versions[table["Name"]] = f"{table.get('VersionId', '')}:{update_str}"
+    return versions
+
+
+def table_schema_objs(sql_database, table_details):
+    """
+    Creates the table schema objects indexed for table retrieval.
+
+    Args:
+        sql_database (SQLDatabase): SQL database object.
+        table_details (dict): Table name -> table context string.
+
+    Returns:
+        list: SQLTableSchema objects, one per table of the database.
+    """
+    return [
+        SQLTableSchema(table_name=table, context_str=table_details[table])
+        for table in sorted(sql_database._all_tables)
+    ]
+
+
+def take_schema_snapshot(
+    sql_database, table_details, embed_model, glue_versions, column_details=None
+):
+    """
+    Takes a snapshot of a reflected SQL database.
+
+    Args:
+        sql_database (SQLDatabase): Reflected SQL database object.
+        table_details (dict): Table name -> table context string.
+        embed_model (BaseEmbedding): Embedding model for the table nodes.
+        glue_versions (dict): Glue table versions the database was reflected from.
+        column_details (dict): Table name -> column name -> description. None
+            skips the column node embeddings.
+
+    Returns:
+        dict: Schema snapshot.
+    """
+    table_node_mapping = SQLTableNodeMapping(sql_database)
+    schema_objs = table_schema_objs(sql_database, table_details)
+    node_texts = [
+        table_node_mapping.to_node(obj).get_content(metadata_mode=MetadataMode.EMBED)
+        for obj in schema_objs
+    ]
+    nodes = [] if column_details is None else column_nodes(sql_database, column_details)
+    # table and column nodes are embedded together
+    vectors = embed_texts(node_texts + [node.text for node in nodes], embed_model)
+    embeddings, vectors = vectors[: len(node_texts)], vectors[len(node_texts) :]
+
+    column_embeddings = {}
+    if column_details is not None:
+        for node, vector in zip(nodes, vectors):
+            table_vectors = column_embeddings.setdefault(node.metadata["table"], {})
+            table_vectors[node.text] = vector
+
+    tables = {}
+    for obj, node_text, embedding in zip(schema_objs, node_texts, embeddings):
+        columns = [
+            {"name": column["name"], "type": str(column["type"])}
+            for column in sql_database.get_table_columns(obj.table_name)
+        ]
+        tables[obj.table_name] = {
+            "columns": columns,
+            "table_info": sql_database.get_single_table_info(obj.table_name),
+            "context_str": obj.context_str,
+            "node_text": node_text,
+            "embedding": embedding,
+            "column_embeddings": column_embeddings.get(obj.table_name, {}),
+            "glue_version": glue_versions.get(obj.table_name),
+        }
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "dialect": sql_database.dialect,
+        "embed_model_name": embed_model.model_name,
+        "sample_rows_in_table_info": sql_database._sample_rows_in_table_info,
+        "taken_at": time.time(),
+        "tables": tables,
+    }
+
+
+def build_table_retriever(
+    sql_database, snapshot, table_details, embed_model, similarity_top_k=5
+):
+    """
+    Creates the table schema retriever, reusing snapshot embeddings where possible.
+
+    A table node is only embedded again when its text differs from the text
+    embedded in the snapshot, e.g. after a change of the table context string.
+
+    Args:
+        sql_database (SQLDatabase): SQL database object.
+        snapshot (dict): Schema snapshot.
+        table_details (dict): Table name -> table context string.
+        embed_model (BaseEmbedding): Embedding model for the table nodes.
+        similarity_top_k (int): Number of tables retrieved per question.
+
+    Returns:
+        ObjectRetriever: Retriever of the SQLTableSchema objects.
+    """
+    table_node_mapping = SQLTableNodeMapping(sql_database)
+    nodes, embeddings, missing = [], [], []
+    for obj in table_schema_objs(sql_database, table_details):
+        node = table_node_mapping.to_node(obj)
+        table_snapshot = snapshot["tables"].get(obj.table_name, {})
+        node_text = node.get_content(metadata_mode=MetadataMode.EMBED)
+        if table_snapshot.get("node_text") == node_text:
+            embeddings.append(table_snapshot["embedding"])
+        else:
+            embeddings.append(None)
+            missing.append(len(nodes))
+        nodes.append(node)
+
+    if missing:
+        new_embeddings = embed_nodes([nodes[i] for i in missing], embed_model)
+        for i, embedding in zip(missing, new_embeddings):
+            embeddings[i] = embedding
+
+    retriever = NumpyVectorRetriever(
+        nodes, embeddings, embed_model, similarity_top_k=similarity_top_k
+    )
+    return ObjectRetriever(retriever, table_node_mapping)
+
+
+# Keys every table of a usable snapshot has
+SNAPSHOT_TABLE_KEYS = ("columns", "table_info", "node_text", "embedding")
+
+
+def snapshot_is_usable(snapshot, embed_model_name):
+    """
+    Checks whether a snapshot has the current format and embedding model.
+
+    Args:
+        snapshot (dict): Schema snapshot.
+        embed_model_name (str): Name of the embedding model in use.
+
+    Returns:
+        bool: True if the snapshot can be used.
+    """
+    if not isinstance(snapshot, dict):
+        return False
+    if (
+        snapshot.get("version") != SNAPSHOT_VERSION
+        or snapshot.get("embed_model_name") != embed_model_name
+        or "sample_rows_in_table_info" not in snapshot
+        or not isinstance(snapshot.get("tables"), dict)
+    ):
+        return False
+    return all(
+        isinstance(details, dict) and all(k in details for k in SNAPSHOT_TABLE_KEYS)
+        for details in snapshot["tables"].values()
+    )
+
+
+def load_schema_snapshot(path, s3_client, bucket, key, embed_model_name):
+    """
+    Loads a schema snapshot from a local file, or from S3 when the file is
+    missing or unusable.
+
+    Args:
+        path (str): Path of the snapshot baked into the image.
+        s3_client (boto3.client): The S3 client.
+        bucket (str): Bucket of the snapshot object.
+        key (str): Key of the snapshot object.
+        embed_model_name (str): Name of the embedding model in use.
+
+    Returns:
+        dict: Schema snapshot, or None if no usable snapshot was found.
+    """
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot_is_usable(snapshot, embed_model_name):
+                logger.info(f"Using schema snapshot from {path}")
+                return snapshot
+            logger.info(f"Schema snapshot {path} is stale, ignoring it")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read schema snapshot {path}: {e}")
+
+    if bucket and key:
+        try:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            snapshot = json.loads(body)
+            if snapshot_is_usable(snapshot, embed_model_name):
+                logger.info(f"Using schema snapshot from s3://{bucket}/{key}")
+                return snapshot
+            logger.info(f"Schema snapshot s3://{bucket}/{key} is stale, ignoring it")
+        except ClientError as e:
+            logger.info(f"No schema snapshot at s3://{bucket}/{key}: {e}")
+        except (BotoCoreError, ValueError) as e:
+            logger.warning(
+                f"Could not read schema snapshot s3://{bucket}/{key}: {e}"
+            )
+
+    logger.info("No usable schema snapshot, using live Glue introspection")
+    return None
+
+
+def save_schema_snapshot(snapshot, s3_client, bucket, key):
+    """
+    Stores a schema snapshot in S3.
+
+    Args:
+        snapshot (dict): Schema snapshot.
+        s3_client (boto3.client): The S3 client.
+        bucket (str): Bucket of the snapshot object.
+        key (str): Key of the snapshot object.
+
+    Returns:
+        None
+    """
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=json.dumps(snapshot).encode("utf-8"),
+            ContentType="application/json",
+        )
+        logger.info(f"Stored schema snapshot in s3://{bucket}/{key}")
+    except (BotoCoreError, ClientError) as e:
+        logger.warning(f"Could not store schema snapshot in s3://{bucket}/{key}: {e}")
+
+
+def snapshot_is_current(snapshot, glue_versions):
+    """
+    Checks whether a snapshot was taken from the current Glue table versions.
+
+    Args:
+        snapshot (dict): Schema snapshot.
+        glue_versions (dict): Current Glue table versions.
+
+    Returns:
+        bool: True if every table matches its Glue version.
+    """
+    snapshot_versions = {
+        table: details.get("glue_version")
+        for table, details in snapshot["tables"].items()
+    }
+    return snapshot_versions == glue_versions
+
+
+def start_background_refresh(snapshot, glue_client, database, rebuild_fn, interval):
+    """
+    Starts a daemon thread that rebuilds the snapshot when the Glue tables change.
+
+    The thread checks the Glue table versions right away, then every interval
+    seconds. On a mismatch it calls rebuild_fn, which reflects the database
+    again and returns the new snapshot.
+
+    Args:
+        snapshot (dict): Schema snapshot in use.
+        glue_client (boto3.client): The Glue client.
+        database (str): Name of the Glue database.
+        rebuild_fn (callable): Function rebuilding the engine and returning the new snapshot.
+        interval (int): Seconds between two checks.
+
+    Returns:
+        threading.Thread: The refresh thread.
+    """
+
+    def refresh():
+        current = snapshot
+        while True:
+            try:
+                glue_versions = get_glue_table_versions(glue_client, database)
+                if not snapshot_is_current(current, glue_versions):
+                    logger.info("Glue tables changed, refreshing schema snapshot")
+                    current = rebuild_fn()
+            except Exception as e:
+                logger.warning(f"Schema snapshot refresh failed: {e}")
+            # nosemgrep: <arbitrary-sleep Message: time.sleep() call>
+            time.sleep(interval)  # nosem: arbitrary-sleep
+
+    thread = threading.Thread(
+        target=refresh, name="schema-snapshot-refresh", daemon=True
+    )
+    thread.start()
+    return thread
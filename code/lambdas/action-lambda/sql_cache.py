@@ -0,0 +1,376 @@
+"""
+sql_cache.py
+
+Semantic question -> SQL cache in front of the text-to-SQL generation.
+
+A question is looked up by the cosine similarity of its embedding with the
+embeddings of previously answered questions. Above the similarity threshold,
+the SQL generated for the cached question is reused and the text-to-SQL LLM
+call is skipped, provided both questions have the same literals: instance
+names, numbers and quoted strings. "price of m5.large" and "price of m5.xlarge"
+embed close to each other, but the SQL of one does not answer the other.
+Entries are evicted least recently used first, and expire after a time to live.
+
+Entries are kept in memory and written through to a backend: in-process only,
+an append-only JSON lines file under /tmp that survives warm restarts, or a
+DynamoDB table shared across containers.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from embedding_context import get_query_embedding
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Quoted strings, and tokens with a digit such as instance names ("m5.large"),
+# numbers ("1.5") or regions ("us-east-1")
+LITERAL_PATTERN = re.compile(r"'[^']*'|\"[^\"]*\"|[a-z0-9.\-]*\d[a-z0-9.\-]*")
+
+
+def question_key(question):
+    """
+    Key of a cached question.
+
+    Args:
+        question (str): User question.
+
+    Returns:
+        str: Hex encoded sha256 digest of the normalized question.
+    """
+    normalized = " ".join(question.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def question_literals(question):
+    """
+    Literals of a question, which the SQL of a cache hit must match exactly.
+
+    Args:
+        question (str): User question, with canonical instance names.
+
+    Returns:
+        frozenset: Instance names, numbers and quoted strings of the question.
+    """
+    return frozenset(
+        literal.strip(".-")
+        for literal in LITERAL_PATTERN.findall(question.lower())
+    )
+
+
+class InMemorySQLCacheBackend:
+    """Backend keeping the entries in the process only."""
+
+    def load(self):
+        return []
+
+    def put(self, entry):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class DiskSQLCacheBackend:
+    """
+    Backend persisting the entries to an append-only JSON lines file, e.g.
+    under /tmp.
+
+    Every put and delete appends one record. The log is replayed and compacted
+    to the live entries on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _replay(self):
+        entries = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["op"] == "put":
+                        entries[record["entry"]["key"]] = record["entry"]
+                    else:
+                        entries.pop(record["key"], None)
+                except (ValueError, KeyError, TypeError):
+                    # e.g. a last line cut short by a stopped container
+                    logger.warning(f"Skipping malformed SQL cache record: {line!r}")
+        return entries
+
+    def _compact(self, entries):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries.values():
+                f.write(json.dumps({"op": "put", "entry": entry}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with self._lock:
+            try:
+                entries = self._replay()
+                self._compact(entries)
+            except OSError as e:
+                logger.warning(f"Could not read SQL cache file {self.path}: {e}")
+                return []
+        return list(entries.values())
+
+    def _append(self, record):
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not write SQL cache file {self.path}: {e}")
+
+    def put(self, entry):
+        self._append({"op": "put", "entry": entry})
+
+    def delete(self, key):
+        self._append({"op": "delete", "key": key})
+
+
+class DynamoDBSQLCacheBackend:
+    """
+    Backend persisting the entries to a DynamoDB table shared across containers.
+
+    The table has a string partition key named "key". The "expires_at" attribute
+    can be used as the table TTL attribute.
+    """
+
+    def __init__(self, table, ttl=0):
+        self.table = table
+        self.ttl = ttl
+
+    def load(self):
+        entries = []
+        scan_kwargs = {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            for item in response.get("Items", []):
+                entries.append(
+                    {
+                        "key": item["key"],
+                        "question": item["question"],
+                        "sql": item["sql"],
+                        "embedding": np.frombuffer(
+                            bytes(item["embedding"]), dtype=np.float32
+                        ).tolist(),
+                        "created_at": float(item["created_at"]),
+                        "last_used": float(item["last_used"]),
+                    }
+                )
+            if "LastEvaluatedKey" not in response:
+                return entries
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def put(self, entry):
+        item = {
+            "key": entry["key"],
+            "question": entry["question"],
+            "sql": entry["sql"],
+            "embedding": np.asarray(entry["embedding"], dtype=np.float32).tobytes(),
+            "created_at": Decimal(str(entry["created_at"])),
+            "last_used": Decimal(str(entry["last_used"])),
+        }
+        if self.ttl:
+            item["expires_at"] = int(entry["created_at"] + self.ttl)
+        try:
+            self.table.put_item(Item=item)
+        except ClientError as e:
+            logger.warning(f"Could not store SQL cache entry: {e}")
+
+    def delete(self, key):
+        try:
+            self.table.delete_item(Key={"key": key})
+        except ClientError as e:
+            logger.warning(f"Could not delete SQL cache entry: {e}")
+
+
+class SemanticSQLCache:
+    """
+    Cache of generated SQL keyed by the question embedding.
+
+    Args:
+        embed_model (BaseEmbedding): Embedding model for the questions.
+        backend: Storage backend of the entries.
+        threshold (float): Minimum cosine similarity for a hit.
+        max_entries (int): Maximum number of entries, evicted least recently used first.
+        ttl (int): Seconds after which an entry expires. 0 disables expiry.
+    """
+
+    def __init__(self, embed_model, backend, threshold=0.95, max_entries=1000, ttl=0):
+        self.embed_model = embed_model
+        self.backend = backend
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._matrix = None
+        for entry in sorted(backend.load(), key=lambda e: e["last_used"]):
+            if not self._is_expired(entry):
+                self._entries[entry["key"]] = entry
+        logger.info(f"Loaded {len(self._entries)} SQL cache entries")
+
+    def _is_expired(self, entry, now=None):
+        if not self.ttl:
+            return False
+        return (now or time.time()) - entry["created_at"] > self.ttl
+
+    def _keys_and_matrix(self):
+        """Normalized embedding matrix of the entries, rebuilt after changes."""
+        if self._matrix is None:
+            keys = list(self._entries.keys())
+            if keys:
+                matrix = np.asarray(
+                    [self._entries[k]["embedding"] for k in keys], dtype=np.float32
+                )
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+            else:
+                matrix = np.empty((0, 0), dtype=np.float32)
+            self._matrix = (keys, matrix)
+        return self._matrix
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+        self.backend.delete(key)
+
+    def embed(self, question):
+        return get_query_embedding(self.embed_model, question)
+
+    def lookup(self, question, embedding=None):
+        """
+        Looks up the SQL of the most similar cached question with the same
+        literals.
+
+        Args:
+            question (str): User question.
+            embedding (list): Embedding of the question, computed if not given.
+
+        Returns:
+            tuple: (entry, similarity) for a hit, (None, similarity) for a miss,
+                with the similarity of the most similar question.
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        literals = question_literals(question)
+
+        with self._lock:
+            keys, matrix = self._keys_and_matrix()
+            best_similarity, entry, similarity = 0.0, None, 0.0
+            if keys:
+                scores = matrix @ query
+                best_similarity = float(scores.max())
+                candidates = np.flatnonzero(scores >= self.threshold)
+                for i in candidates[np.argsort(-scores[candidates])]:
+                    candidate = self._entries[keys[i]]
+                    if question_literals(candidate["question"]) != literals:
+                        continue
+                    if self._is_expired(candidate):
+                        # keys and scores stay valid for the other candidates
+                        self._remove(keys[i])
+                        continue
+                    entry, similarity = candidate, float(scores[i])
+                    break
+
+            if entry is None:
+                self.misses += 1
+                return None, best_similarity
+
+            self.hits += 1
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(entry["key"])
+        return entry, similarity
+
+    def store(self, question, sql, embedding=None):
+        """
+        Stores the SQL generated for a question.
+
+        Args:
+            question (str): User question.
+            sql (str): SQL query generated for the question.
+            embedding (list): Embedding of the question, computed if not given.
+
+        Returns:
+            None
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+        now = time.time()
+        entry = {
+            "key": question_key(question),
+            "question": question,
+            "sql": sql,
+            "embedding": list(map(float, embedding)),
+            "created_at": now,
+            "last_used": now,
+        }
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            self._entries.move_to_end(entry["key"])
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        self.backend.put(entry)
+
+    def stats(self):
+        """Hit and miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+def create_sql_cache(
+    embed_model, backend_name, path, table, threshold, max_entries, ttl
+):
+    """
+    Creates the semantic SQL cache for a backend name.
+
+    Args:
+        embed_model (BaseEmbedding): Embedding model for the questions.
+        backend_name (str): "none", "memory", "disk" or "dynamodb".
+        path (str): File of the disk backend.
+        table: DynamoDB Table resource of the dynamodb backend.
+        threshold (float): Minimum cosine similarity for a hit.
+        max_entries (int): Maximum number of entries.
+        ttl (int): Seconds after which an entry expires.
+
+    Returns:
+        SemanticSQLCache: The cache, or None if disabled.
+    """
+    if backend_name == "none":
+        return None
+    if backend_name == "memory":
+        backend = InMemorySQLCacheBackend()
+    elif backend_name == "disk":
+        backend = DiskSQLCacheBackend(path)
+    elif backend_name == "dynamodb":
+        backend = DynamoDBSQLCacheBackend(table, ttl)
+    else:
+        raise ValueError(f"Unknown SQL cache backend: {backend_name}")
+    return SemanticSQLCache(embed_model, backend, threshold, max_entries, ttl)
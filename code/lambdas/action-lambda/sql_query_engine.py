@@ -0,0 +1,475 @@
+"""
+sql_query_engine.py
+
+Text-to-SQL retriever and query engine used by the action Lambda.
+
+They follow llama-index's NLSQLRetriever and SQLTableRetrieverQueryEngine, and
+add a semantic question -> SQL cache in front of the text-to-SQL generation, and
+a result cache and an embedded SQLite backend in front of Athena. The question is
+embedded once per request and shared by every retrieval stage. The SQL can be
+generated by a model chosen per question by a ModelRouter. Small results are
+answered from templates, and the response synthesis of the other results can
+stream the answer tokens as Bedrock generates them.
+"""
+
+import logging
+import time
+
+from llama_index.core.base.response.schema import Response
+from llama_index.core.indices.struct_store.sql_query import BaseSQLTableQueryEngine
+from llama_index.core.indices.struct_store.sql_retriever import NLSQLRetriever
+from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from answer_formatter import SYNTHESIS_MODES, format_result
+from embedding_context import embedding_scope
+from profiler import stage
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class TextToSQLRetriever(NLSQLRetriever):
+    """
+    Text-to-SQL retriever reusing the SQL of similar questions from a cache.
+
+    Args:
+        sql_cache (SemanticSQLCache): Cache of generated SQL. None disables it.
+        result_cache (SQLResultCache): Cache of SQL results. None disables it.
+        local_sql_database (LocalSQLDatabase): In-memory copy of the tables.
+            None runs every query on the SQL database.
+        instance_name_index (InstanceNameIndex): Index rewriting instance
+            mentions to canonical names. None leaves questions unchanged.
+        column_retriever (ColumnSchemaRetriever): Retriever limiting the prompt
+            schema to the relevant columns. None keeps the full table schemas.
+        model_router (ModelRouter): Router choosing the model generating the
+            SQL of every question. None always uses the retriever LLM.
+        kwargs: Arguments of NLSQLRetriever.
+    """
+
+    def __init__(
+        self,
+        *args,
+        sql_cache=None,
+        result_cache=None,
+        local_sql_database=None,
+        instance_name_index=None,
+        column_retriever=None,
+        model_router=None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._sql_cache = sql_cache
+        self._result_cache = result_cache
+        self._local_sql_database = local_sql_database
+        self._instance_name_index = instance_name_index
+        self._column_retriever = column_retriever
+        self._model_router = model_router
+
+    def _get_table_context(self, query_bundle):
+        """Gets the schema of the retrieved tables, limited to relevant columns."""
+        with stage("table_retrieval"):
+            if self._column_retriever is None:
+                return super()._get_table_context(query_bundle)
+            return self._column_retriever.get_table_context(
+                query_bundle,
+                self._get_tables(query_bundle.query_str),
+                self._context_str_prefix,
+            )
+
+    def resolve_instance_names(self, question):
+        """
+        Rewrites the instance mentions of a question to canonical names.
+
+        Args:
+            question (str): User question.
+
+        Returns:
+            question (str): Rewritten question.
+            entities (list): Resolved mentions, None without an index.
+        """
+        if self._instance_name_index is None:
+            return question, None
+        rewritten, entities = self._instance_name_index.resolve(question)
+        if rewritten != question:
+            logger.info(f"Rewrote question to: {rewritten}")
+        return rewritten, entities
+
+    def execute_sql(self, sql_query_str):
+        """
+        Executes a SQL query, in process when it only reads locally held tables.
+
+        Args:
+            sql_query_str (str): SQL query.
+
+        Returns:
+            retrieved_nodes (list): Result nodes.
+            metadata (dict): Result metadata.
+        """
+        local_db = self._local_sql_database
+        if local_db is not None and local_db.can_run(sql_query_str):
+            try:
+                raw_response_str, metadata = local_db.run_sql(sql_query_str)
+                metadata["sql_backend"] = "local"
+                return [NodeWithScore(node=TextNode(text=raw_response_str))], metadata
+            except Exception as e:
+                logger.info(f"Local SQL execution failed, falling back: {e}")
+
+        retrieved_nodes, metadata = self._sql_retriever.retrieve_with_metadata(
+            sql_query_str
+        )
+        metadata["sql_backend"] = self._sql_database.dialect
+        return retrieved_nodes, metadata
+
+    def generate_sql(self, query_bundle, llm=None):
+        """
+        Generates the SQL query for a question with the text-to-SQL prompt.
+
+        Args:
+            query_bundle (QueryBundle): User question.
+            llm (LLM): LLM generating the SQL. Defaults to the retriever LLM.
+
+        Returns:
+            str: SQL query.
+        """
+        table_desc_str = self._get_table_context(query_bundle)
+        logger.info(f"> Table desc str: {table_desc_str}")
+
+        # the few-shot examples are retrieved while formatting the prompt, and
+        # profiled as a stage of their own
+        with stage("sql_generation"):
+            response_str = (llm or self._llm).predict(
+                self._text_to_sql_prompt,
+                query_str=query_bundle.query_str,
+                schema=table_desc_str,
+                dialect=self._sql_database.dialect,
+            )
+        return self._sql_parser.parse_response_to_sql(response_str, query_bundle)
+
+    def generate_routed_sql(self, query_bundle, routing):
+        """
+        Generates the SQL query of a question with the model chosen for it.
+
+        Args:
+            query_bundle (QueryBundle): User question.
+            routing (dict): Routing decision, its "attempts" are appended the
+                model and latency of the generation.
+
+        Returns:
+            str: SQL query.
+        """
+        model_name = routing["model"]
+        start_time = time.perf_counter()
+        sql_query_str = self.generate_sql(
+            query_bundle, llm=self._model_router.get_llm(model_name)
+        )
+        latency = time.perf_counter() - start_time
+        routing.setdefault("attempts", []).append(
+            {"model": model_name, "latency": round(latency, 4)}
+        )
+        routing["latency"] = round(sum(a["latency"] for a in routing["attempts"]), 4)
+        logger.info(f"Generated SQL with {model_name} in {latency:.3f}s")
+        return sql_query_str
+
+    def run_sql(self, sql_query_str):
+        """
+        Runs a SQL query, turning errors into an error node when handled.
+
+        Results are served from the result cache when it holds a result for the
+        same canonical query and the tables did not change since.
+
+        Args:
+            sql_query_str (str): SQL query.
+
+        Returns:
+            retrieved_nodes (list): Result nodes.
+            metadata (dict): Result metadata, with "sql_error" set on error.
+        """
+        if self._result_cache is not None:
+            cached = self._result_cache.get(sql_query_str)
+            if cached is not None:
+                retrieved_nodes, metadata = cached
+                metadata["result_cache"] = {
+                    "hit": True,
+                    **self._result_cache.stats(),
+                }
+                logger.info("SQL result cache hit")
+                return retrieved_nodes, metadata
+
+        try:
+            with stage("sql_execution"):
+                retrieved_nodes, metadata = self.execute_sql(sql_query_str)
+        except BaseException as e:
+            # if handle_sql_errors is True, then return error message
+            if self._handle_sql_errors:
+                err_node = TextNode(text=f"Error: {e!s}")
+                return [NodeWithScore(node=err_node)], {"sql_error": str(e)}
+            raise
+
+        if self._result_cache is not None:
+            self._result_cache.put(sql_query_str, retrieved_nodes, metadata)
+            metadata = {
+                **metadata,
+                "result_cache": {"hit": False, **self._result_cache.stats()},
+            }
+        return retrieved_nodes, metadata
+
+    def retrieve_with_metadata(self, str_or_query_bundle):
+        """Retrieve with metadata, embedding the question once for all stages."""
+        with embedding_scope() as embedding_stats:
+            retrieved_nodes, metadata = self._retrieve_with_metadata(
+                str_or_query_bundle
+            )
+        metadata["query_embeddings"] = dict(embedding_stats)
+        return retrieved_nodes, metadata
+
+    def _retrieve_with_metadata(self, str_or_query_bundle):
+        if isinstance(str_or_query_bundle, str):
+            query_bundle = QueryBundle(str_or_query_bundle)
+        else:
+            query_bundle = str_or_query_bundle
+        question, entities = self.resolve_instance_names(query_bundle.query_str)
+        if question != query_bundle.query_str:
+            query_bundle = QueryBundle(question)
+
+        cache_metadata = {}
+        cache_entry, question_embedding, routing = None, None, None
+        if self._sql_cache is not None:
+            question_embedding = self._sql_cache.embed(question)
+            cache_entry, similarity = self._sql_cache.lookup(
+                question, question_embedding
+            )
+            cache_metadata = {
+                "hit": cache_entry is not None,
+                "similarity": similarity,
+                **self._sql_cache.stats(),
+            }
+
+        if cache_entry is not None:
+            sql_query_str = cache_entry["sql"]
+            cache_metadata["cached_question"] = cache_entry["question"]
+            logger.info(
+                f"SQL cache hit ({cache_metadata['similarity']:.4f}) "
+                f"for question: {cache_entry['question']}"
+            )
+        elif self._model_router is not None:
+            routing = self._model_router.route(question, entities)
+            sql_query_str = self.generate_routed_sql(query_bundle, routing)
+        else:
+            sql_query_str = self.generate_sql(query_bundle)
+        logger.debug(f"> Predicted SQL query: {sql_query_str}")
+
+        if self._sql_only:
+            sql_only_node = TextNode(text=f"{sql_query_str}")
+            retrieved_nodes = [NodeWithScore(node=sql_only_node)]
+            metadata = {"result": sql_query_str}
+        else:
+            retrieved_nodes, metadata = self.run_sql(sql_query_str)
+            if routing is not None and self._model_router.should_escalate(
+                routing["model"], metadata
+            ):
+                logger.info(
+                    f"SQL of {routing['model']} failed, escalating to "
+                    f"{self._model_router.strong_model}: {metadata['sql_error']}"
+                )
+                routing["escalated_from"] = routing["model"]
+                routing["model"] = self._model_router.strong_model
+                sql_query_str = self.generate_routed_sql(query_bundle, routing)
+                retrieved_nodes, metadata = self.run_sql(sql_query_str)
+            # only SQL that ran is worth reusing
+            if (
+                self._sql_cache is not None
+                and cache_entry is None
+                and "sql_error" not in metadata
+            ):
+                self._sql_cache.store(question, sql_query_str, question_embedding)
+
+        if cache_metadata:
+            metadata["sql_cache"] = cache_metadata
+        if entities is not None:
+            metadata["instance_names"] = entities
+        if routing is not None:
+            metadata["model_routing"] = routing
+        return retrieved_nodes, {"sql_query": sql_query_str, **metadata}
+
+    async def aretrieve_with_metadata(self, str_or_query_bundle):
+        return self.retrieve_with_metadata(str_or_query_bundle)
+
+
+class TextToSQLQueryEngine(BaseSQLTableQueryEngine):
+    """
+    SQL table retriever query engine built on TextToSQLRetriever.
+
+    Args:
+        sql_database (SQLDatabase): SQL database.
+        table_retriever (ObjectRetriever): Retriever of the SQLTableSchema objects.
+        sql_cache (SemanticSQLCache): Cache of generated SQL. None disables it.
+        result_cache (SQLResultCache): Cache of SQL results. None disables it.
+        local_sql_database (LocalSQLDatabase): In-memory copy of the tables.
+        instance_name_index (InstanceNameIndex): Index of the instance names.
+        column_retriever (ColumnSchemaRetriever): Retriever of the relevant
+            columns. None keeps the full table schemas.
+        model_router (ModelRouter): Router choosing the model generating the
+            SQL. None always uses the engine LLM.
+        streaming (bool): Whether the synthesis can be streamed. Only set for
+            LLMs supporting streaming.
+        synthesis_mode (str): Default synthesis mode: "auto" answers from
+            templates when the result allows it, "llm" always calls the LLM.
+        template_max_rows (int): Largest result answered from templates.
+    """
+
+    def __init__(
+        self,
+        sql_database,
+        table_retriever,
+        llm=None,
+        text_to_sql_prompt=None,
+        context_query_kwargs=None,
+        synthesize_response=True,
+        response_synthesis_prompt=None,
+        service_context=None,
+        context_str_prefix=None,
+        sql_only=False,
+        sql_cache=None,
+        result_cache=None,
+        local_sql_database=None,
+        instance_name_index=None,
+        column_retriever=None,
+        model_router=None,
+        streaming=False,
+        synthesis_mode="auto",
+        template_max_rows=10,
+        **kwargs,
+    ):
+        if synthesis_mode not in SYNTHESIS_MODES:
+            raise ValueError(f"Unknown synthesis mode: {synthesis_mode}")
+        self._streaming = streaming
+        self._synthesis_mode = synthesis_mode
+        self._template_max_rows = template_max_rows
+        self._sql_retriever = TextToSQLRetriever(
+            sql_database,
+            llm=llm,
+            text_to_sql_prompt=text_to_sql_prompt,
+            context_query_kwargs=context_query_kwargs,
+            table_retriever=table_retriever,
+            context_str_prefix=context_str_prefix,
+            service_context=service_context,
+            sql_only=sql_only,
+            sql_cache=sql_cache,
+            result_cache=result_cache,
+            local_sql_database=local_sql_database,
+            instance_name_index=instance_name_index,
+            column_retriever=column_retriever,
+            model_router=model_router,
+        )
+        super().__init__(
+            synthesize_response=synthesize_response,
+            response_synthesis_prompt=response_synthesis_prompt,
+            llm=llm,
+            service_context=service_context,
+            **kwargs,
+        )
+
+    @property
+    def sql_retriever(self):
+        """Get SQL retriever."""
+        return self._sql_retriever
+
+    def _template_answer(self, query_bundle, metadata):
+        """Answer rendered from templates, None when left to the LLM."""
+        if "sql_error" in metadata or "result" not in metadata:
+            return None
+        return format_result(
+            query_bundle.query_str,
+            metadata["sql_query"],
+            metadata["result"],
+            metadata["col_keys"],
+            max_rows=self._template_max_rows,
+        )
+
+    def _retrieve_and_synthesize(self, query_bundle, streaming, synthesis_mode):
+        retrieved_nodes, metadata = self.sql_retriever.retrieve_with_metadata(
+            query_bundle
+        )
+
+        if not self._synthesize_response:
+            response_str = "\n".join([node.node.text for node in retrieved_nodes])
+            return Response(response=response_str, metadata=metadata)
+
+        with stage("response_synthesis"):
+            return self._synthesize(
+                query_bundle, retrieved_nodes, metadata, streaming, synthesis_mode
+            )
+
+    def _synthesize(
+        self, query_bundle, retrieved_nodes, metadata, streaming, synthesis_mode
+    ):
+        """Answers from the SQL result, with a template or the LLM."""
+        sql_query_str = metadata["sql_query"]
+        if synthesis_mode == "auto":
+            answer = self._template_answer(query_bundle, metadata)
+            if answer is not None:
+                return Response(
+                    response=answer,
+                    source_nodes=retrieved_nodes,
+                    metadata={**metadata, "synthesis": "template"},
+                )
+
+        partial_synthesis_prompt = self._response_synthesis_prompt.partial_format(
+            sql_query=sql_query_str,
+        )
+        response_synthesizer = get_response_synthesizer(
+            llm=self._llm,
+            callback_manager=self.callback_manager,
+            text_qa_template=partial_synthesis_prompt,
+            verbose=self._verbose,
+            streaming=streaming,
+        )
+        response = response_synthesizer.synthesize(
+            query=query_bundle.query_str,
+            nodes=retrieved_nodes,
+        )
+        if response.metadata is None:
+            response.metadata = {}
+        response.metadata.update(metadata)
+        response.metadata["synthesis"] = "llm"
+        return response
+
+    def _query(self, query_bundle):
+        """Answer a query."""
+        return self._retrieve_and_synthesize(
+            query_bundle, streaming=False, synthesis_mode=self._synthesis_mode
+        )
+
+    def answer_query(self, str_or_query_bundle, streaming=False, synthesis_mode=None):
+        """
+        Answers a question, with per request streaming and synthesis mode.
+
+        Args:
+            str_or_query_bundle (str or QueryBundle): User question.
+            streaming (bool): Whether to stream the synthesized answer, when the
+                LLM supports it.
+            synthesis_mode (str): "auto" or "llm". Defaults to the engine
+                setting, which also replaces an unknown mode.
+
+        Returns:
+            Response or StreamingResponse: The answer, with the synthesis path
+                taken in metadata["synthesis"]. A StreamingResponse's
+                response_gen yields the answer chunks.
+        """
+        synthesis_mode = synthesis_mode or self._synthesis_mode
+        if synthesis_mode not in SYNTHESIS_MODES:
+            logger.warning(
+                f"Unknown synthesis mode {synthesis_mode!r}, using "
+                f"{self._synthesis_mode}"
+            )
+            synthesis_mode = self._synthesis_mode
+        with self.callback_manager.as_trace("query"):
+            if isinstance(str_or_query_bundle, str):
+                str_or_query_bundle = QueryBundle(str_or_query_bundle)
+            return self._retrieve_and_synthesize(
+                str_or_query_bundle,
+                streaming=streaming and self._streaming,
+                synthesis_mode=synthesis_mode,
+            )
@@ -0,0 +1,162 @@
+"""
+vector_retriever.py
+
+Top-k retriever over an in-memory embedding matrix.
+
+The embeddings are kept in one contiguous float32 matrix, which can also be a
+read-only memory map of a .npy file, instead of llama-index's SimpleVectorStore
+that holds one Python list per node. Cosine similarities of a batch of queries
+are computed with a single matrix product, and the top k with argpartition.
+"""
+
+import logging
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from embedding_context import embed_texts, get_query_embedding
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def top_k(scores, k):
+    """
+    Indices and scores of the k highest scores of every row, best first.
+
+    Args:
+        scores (numpy.ndarray): Scores, one row per query.
+        k (int): Number of results per row.
+
+    Returns:
+        tuple: (indices, scores) arrays of shape (rows, min(k, columns)).
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(k), (scores.shape[0], 1))
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
+
+
+def embed_nodes(nodes, embed_model):
+    """
+    Embeds the nodes with the text indexed by VectorStoreIndex.
+
+    Args:
+        nodes (list): Nodes to embed.
+        embed_model (BaseEmbedding): Embedding model.
+
+    Returns:
+        numpy.ndarray: float32 matrix with one row per node.
+    """
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    return np.asarray(embed_texts(texts, embed_model), dtype=np.float32)
+
+
+class NumpyVectorRetriever(BaseRetriever):
+    """
+    Retriever returning the nodes with the most similar embeddings.
+
+    Args:
+        nodes (list): Retrievable nodes.
+        embeddings (numpy.ndarray): Embedding matrix, one row per node. A float32
+            array, e.g. a memory map, is used without a copy.
+        embed_model (BaseEmbedding): Embedding model for the queries.
+        similarity_top_k (int): Number of nodes returned per query.
+    """
+
+    def __init__(self, nodes, embeddings, embed_model, similarity_top_k=2, **kwargs):
+        super().__init__(**kwargs)
+        self._nodes = list(nodes)
+        self._matrix = np.asarray(embeddings, dtype=np.float32)
+        if self._matrix.shape[0] != len(self._nodes):
+            raise ValueError(
+                f"Got {self._matrix.shape[0]} embeddings for {len(self._nodes)} nodes"
+            )
+        self._norms = np.linalg.norm(self._matrix, axis=1) + 1e-12
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+
+    @classmethod
+    def from_nodes(cls, nodes, embed_model, similarity_top_k=2):
+        """Creates a retriever, embedding the nodes in a single batch."""
+        embeddings = embed_nodes(nodes, embed_model)
+        return cls(nodes, embeddings, embed_model, similarity_top_k)
+
+    def updated(self, nodes):
+        """
+        Creates a retriever over new nodes, reusing the embeddings of the nodes
+        with the same text and embedding only the others.
+
+        Args:
+            nodes (list): Retrievable nodes.
+
+        Returns:
+            tuple: (NumpyVectorRetriever, number of nodes embedded).
+        """
+        rows = {node.text: i for i, node in enumerate(self._nodes)}
+        missing = [i for i, node in enumerate(nodes) if node.text not in rows]
+        embeddings = np.empty((len(nodes), self._matrix.shape[1]), dtype=np.float32)
+        for i, node in enumerate(nodes):
+            if node.text in rows:
+                embeddings[i] = self._matrix[rows[node.text]]
+        if missing:
+            embeddings[missing] = embed_nodes(
+                [nodes[i] for i in missing], self._embed_model
+            )
+        retriever = NumpyVectorRetriever(
+            nodes, embeddings, self._embed_model, self._similarity_top_k
+        )
+        return retriever, len(missing)
+
+    def _query_embedding(self, query_bundle):
+        if query_bundle.embedding is None:
+            if len(query_bundle.embedding_strs) == 1:
+                query_bundle.embedding = get_query_embedding(
+                    self._embed_model, query_bundle.embedding_strs[0]
+                )
+            else:
+                query_bundle.embedding = (
+                    self._embed_model.get_agg_embedding_from_queries(
+                        query_bundle.embedding_strs
+                    )
+                )
+        return query_bundle.embedding
+
+    def batch_retrieve(self, query_embeddings, similarity_top_k=None):
+        """
+        Retrieves the most similar nodes of a batch of query embeddings.
+
+        Args:
+            query_embeddings (array-like): Query embeddings, one row per query.
+            similarity_top_k (int): Number of nodes per query. Defaults to the
+                retriever setting.
+
+        Returns:
+            list: One list of NodeWithScore per query, best first.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12)
+        scores = (queries @ self._matrix.T) / self._norms
+        indices, top_scores = top_k(scores, similarity_top_k or self._similarity_top_k)
+        return [
+            [
+                NodeWithScore(node=self._nodes[i], score=float(score))
+                for i, score in zip(row_indices, row_scores)
+            ]
+            for row_indices, row_scores in zip(indices, top_scores)
+        ]
+
+    def _retrieve(self, query_bundle):
+        return self.batch_retrieve([self._query_embedding(query_bundle)])[0]
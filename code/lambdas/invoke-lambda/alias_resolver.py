@@ -0,0 +1,206 @@
+"""
+alias_resolver.py
+
+Resolution of the Bedrock Agent alias to invoke, cached per agent.
+
+The alias of the highest agent version is looked up with ListAgentAliases,
+following its pagination, and cached for a TTL. A request arriving in the last
+refresh_margin seconds of the TTL still gets the cached alias, and starts a
+refresh in the background, so requests only wait on the control plane when the
+cache is empty or expired. Concurrent requests share a single lookup. An alias
+can also be pinned through configuration, which skips the lookup entirely.
+"""
+
+import logging
+import threading
+import time
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Largest page of ListAgentAliases
+LIST_ALIASES_PAGE_SIZE = 100
+
+
+def get_highest_agent_version_alias_id(response):
+    """
+    Find newest agent alias id.
+
+    Args:
+        response (dict): Response from list_agent_aliases().
+
+    Returns:
+        str: Agent alias ID of the newest agent version.
+    """
+    # Initialize highest version info
+    highest_version = None
+    highest_version_alias_id = None
+
+    # Iterate through the agentAliasSummaries
+    for alias_summary in response.get("agentAliasSummaries", []):
+        # Assuming each alias has one routingConfiguration
+        if alias_summary["routingConfiguration"]:
+            agent_version = alias_summary["routingConfiguration"][0]["agentVersion"]
+            # Check if the version is numeric and higher than the current highest
+            if agent_version.isdigit() and (
+                highest_version is None or int(agent_version) > highest_version
+            ):
+                highest_version = int(agent_version)
+                highest_version_alias_id = alias_summary["agentAliasId"]
+
+    # Return the highest version alias ID or None if not found
+    return highest_version_alias_id
+
+
+def list_agent_aliases(agent_client, agent_id, page_size=LIST_ALIASES_PAGE_SIZE):
+    """
+    Lists all the aliases of an agent, following the nextToken pagination.
+
+    Args:
+        agent_client (boto3.client): The bedrock-agent client.
+        agent_id (str): Agent id.
+        page_size (int): Aliases per page.
+
+    Returns:
+        dict: Response with the "agentAliasSummaries" of every page.
+    """
+    summaries = []
+    kwargs = {"agentId": agent_id, "maxResults": page_size}
+    while True:
+        response = agent_client.list_agent_aliases(**kwargs)
+        summaries.extend(response.get("agentAliasSummaries", []))
+        next_token = response.get("nextToken")
+        if not next_token:
+            return {"agentAliasSummaries": summaries}
+        kwargs["nextToken"] = next_token
+
+
+class AgentAliasResolver:
+    """
+    Resolves the alias to invoke of an agent, caching it for a TTL.
+
+    Args:
+        agent_client (boto3.client): The bedrock-agent client.
+        ttl (float): Seconds an alias is cached.
+        refresh_margin (float): Seconds before the expiry from which a request
+            refreshes the alias in the background.
+        retry_interval (float): Seconds a stale alias is served after a failed
+            refresh, before the next attempt.
+        pinned_aliases (dict): Agent id -> alias id used without any lookup.
+        clock (callable): Monotonic clock, in seconds.
+    """
+
+    def __init__(
+        self,
+        agent_client,
+        ttl=300,
+        refresh_margin=60,
+        retry_interval=30,
+        pinned_aliases=None,
+        clock=time.monotonic,
+    ):
+        self.agent_client = agent_client
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl)
+        self.retry_interval = retry_interval
+        self.pinned_aliases = dict(pinned_aliases or {})
+        self.clock = clock
+        # agent id -> (alias id, expiry)
+        self._aliases = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._agent_locks = {}
+        self._stats = {"hits": 0, "lookups": 0, "background_refreshes": 0}
+
+    def stats(self):
+        """Cache hits, lookups and background refreshes."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _agent_lock(self, agent_id):
+        with self._lock:
+            return self._agent_locks.setdefault(agent_id, threading.Lock())
+
+    def _lookup(self, agent_id):
+        """Looks the alias up and caches it, None when no alias is published."""
+        with self._lock:
+            self._stats["lookups"] += 1
+        alias_id = get_highest_agent_version_alias_id(
+            list_agent_aliases(self.agent_client, agent_id)
+        )
+        # an agent without a published alias yet is looked up again next time
+        if alias_id is not None:
+            with self._lock:
+                self._aliases[agent_id] = (alias_id, self.clock() + self.ttl)
+        logger.info(f"Resolved agent {agent_id} alias: {alias_id}")
+        return alias_id
+
+    def _refresh(self, agent_id):
+        """Refreshes an alias, keeping the cached one on failure."""
+        try:
+            self._lookup(agent_id)
+        except Exception as e:
+            logger.warning(f"Could not refresh the alias of agent {agent_id}: {e}")
+            self._extend(agent_id)
+        finally:
+            with self._lock:
+                self._refreshing.discard(agent_id)
+
+    def _extend(self, agent_id):
+        """Serves the cached alias for retry_interval more seconds."""
+        with self._lock:
+            if agent_id in self._aliases:
+                alias_id, _ = self._aliases[agent_id]
+                self._aliases[agent_id] = (alias_id, self.clock() + self.retry_interval)
+
+    def _cached(self, agent_id, now):
+        """Cached alias if not expired, starting its refresh when due."""
+        with self._lock:
+            alias_id, expiry = self._aliases.get(agent_id, (None, 0.0))
+            if alias_id is None or now >= expiry:
+                return None
+            self._stats["hits"] += 1
+            refresh = (
+                now >= expiry - self.refresh_margin
+                and agent_id not in self._refreshing
+            )
+            if refresh:
+                self._refreshing.add(agent_id)
+                self._stats["background_refreshes"] += 1
+        if refresh:
+            threading.Thread(
+                target=self._refresh, args=(agent_id,), daemon=True
+            ).start()
+        return alias_id
+
+    def resolve(self, agent_id):
+        """
+        Gets the alias to invoke of an agent.
+
+        Args:
+            agent_id (str): Agent id.
+
+        Returns:
+            str: Alias id, None when the agent has no published alias.
+        """
+        if agent_id in self.pinned_aliases:
+            return self.pinned_aliases[agent_id]
+        alias_id = self._cached(agent_id, self.clock())
+        if alias_id is not None:
+            return alias_id
+        # concurrent requests wait for a single lookup
+        with self._agent_lock(agent_id):
+            alias_id = self._cached(agent_id, self.clock())
+            if alias_id is not None:
+                return alias_id
+            with self._lock:
+                stale = self._aliases.get(agent_id, (None, 0.0))[0]
+            try:
+                return self._lookup(agent_id)
+            except Exception as e:
+                if stale is None:
+                    raise
+                logger.warning(f"Alias lookup failed, using cached {stale}: {e}")
+                self._extend(agent_id)
+                return stale
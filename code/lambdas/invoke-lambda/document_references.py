@@ -0,0 +1,185 @@
+"""
+document_references.py
+
+Title and URL of the knowledge base documents cited by an answer.
+
+They are looked up in the manifest built by code/ingest/kb_manifest.py when
+the documents are deployed, and loaded once per container. The manifest is
+deployed to the bucket of the documents, so it only covers the documents of
+its own bucket. The documents the manifest does not cover are read with a
+ranged GET of their first bytes, where their "Topic" and "Url" keys are, and
+only read whole when the range misses them. A manifest that cannot be read or
+parsed is logged and ignored, so every document is then read.
+"""
+
+import json
+import logging
+import re
+import threading
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Bytes read by the ranged GET, the "Topic" and "Url" keys come first
+RANGE_BYTES = 4096
+
+FIELD_PATTERN = re.compile(r'"(Topic|Url)"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def parse_s3_uri(uri):
+    """
+    Splits an S3 URI.
+
+    Args:
+        uri (str): URI, e.g. "s3://bucket/key".
+
+    Returns:
+        tuple: Bucket and key.
+    """
+    bucket, _, key = uri.split("//", 1)[1].partition("/")
+    return bucket, key
+
+
+def load_manifest(s3_client, bucket, key):
+    """
+    Loads the document manifest.
+
+    Args:
+        s3_client (boto3.client): The S3 client.
+        bucket (str): Bucket of the manifest.
+        key (str): Key of the manifest.
+
+    Returns:
+        dict: Document key -> (title, URL, md5), empty when it cannot be read.
+    """
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        documents = json.loads(body)["documents"]
+        entries = documents.items()
+    except (
+        BotoCoreError,
+        ClientError,
+        ValueError,
+        KeyError,
+        TypeError,
+        AttributeError,
+    ) as e:
+        # e.g. no credentials, no endpoint, or a manifest of another format
+        logger.warning(f"Could not load the document manifest s3://{bucket}/{key}: {e}")
+        return {}
+
+    manifest, skipped = {}, 0
+    for document_key, entry in entries:
+        if (
+            isinstance(entry, list)
+            and len(entry) >= 2
+            and all(isinstance(field, str) for field in entry[:2])
+        ):
+            manifest[document_key] = tuple(entry)
+        else:
+            skipped += 1
+    if skipped:
+        logger.warning(f"Skipped {skipped} malformed document manifest entries")
+    logger.info(f"Loaded the manifest of {len(manifest)} documents")
+    return manifest
+
+
+def read_fields(content):
+    """
+    Reads the "Topic" and "Url" of a document, which may be truncated.
+
+    Args:
+        content (bytes): Document content, or its first bytes.
+
+    Returns:
+        dict: The fields found.
+    """
+    text = content.decode("utf-8", errors="ignore")
+    fields = {}
+    for match in FIELD_PATTERN.finditer(text):
+        fields.setdefault(match.group(1), json.loads(match.group(2)))
+        if len(fields) == 2:
+            break
+    return fields
+
+
+class DocumentReferences:
+    """
+    Resolves the title and URL of knowledge base documents.
+
+    Args:
+        s3_client (boto3.client): The S3 client reading the documents.
+        manifest (dict): Document key -> (title, URL, md5).
+        manifest_bucket (str): Bucket of the documents of the manifest. None
+            matches the documents of any bucket.
+        range_bytes (int): Bytes of the ranged GET of the documents missing
+            from the manifest.
+    """
+
+    def __init__(
+        self, s3_client, manifest=None, manifest_bucket=None, range_bytes=RANGE_BYTES
+    ):
+        self.s3_client = s3_client
+        self.manifest = manifest or {}
+        self.manifest_bucket = manifest_bucket
+        self.range_bytes = range_bytes
+        self._stats = {"manifest": 0, "ranged": 0, "full": 0}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """References resolved from the manifest, a ranged GET or a full GET."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def lookup(self, uri):
+        """
+        Gets a reference from the manifest.
+
+        Args:
+            uri (str): S3 URI of the document.
+
+        Returns:
+            tuple: Title and URL, None when the manifest does not cover it.
+        """
+        bucket, key = parse_s3_uri(uri)
+        if self.manifest_bucket is not None and bucket != self.manifest_bucket:
+            return None
+        entry = self.manifest.get(key)
+        if entry is None:
+            return None
+        self._count("manifest")
+        return entry[0], entry[1]
+
+    def read(self, uri):
+        """
+        Reads a reference from the document, with a ranged GET first.
+
+        Args:
+            uri (str): S3 URI of the document.
+
+        Returns:
+            tuple: Title and URL.
+        """
+        bucket, key = parse_s3_uri(uri)
+        response = self.s3_client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes=0-{self.range_bytes - 1}"
+        )
+        fields = read_fields(response["Body"].read())
+        if len(fields) == 2:
+            self._count("ranged")
+        else:
+            body = self.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            fields = json.loads(body)
+            self._count("full")
+        return fields["Topic"], fields["Url"]
+
+    def get(self, uri):
+        """Gets a reference, from the manifest when it covers the document."""
+        return self.lookup(uri) or self.read(uri)
@@ -1,9 +1,17 @@
 import boto3
+import codecs
 import json
 import logging
 import os
 from collections import OrderedDict
-import re
+from concurrent.futures import ThreadPoolExecutor, wait
+import time
+
+from botocore.config import Config
+
+from alias_resolver import AgentAliasResolver
+from document_references import DocumentReferences, load_manifest
+from trace_processor import TraceProcessor
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -15,59 +23,63 @@ def log(message):
 
 AGENT_ID = os.environ["AGENT_ID"]
 REGION_NAME = os.environ["REGION_NAME"]
+# Pins the alias to invoke, instead of the alias of the highest agent version
+AGENT_ALIAS_ID = os.environ.get("AGENT_ALIAS_ID", "")
+AGENT_ALIAS_TTL = int(os.environ.get("AGENT_ALIAS_TTL", "300"))
+AGENT_ALIAS_REFRESH_MARGIN = int(os.environ.get("AGENT_ALIAS_REFRESH_MARGIN", "60"))
+# Concurrent reference fetches, and the seconds the references of an answer may take
+SOURCE_LINK_MAX_WORKERS = int(os.environ.get("SOURCE_LINK_MAX_WORKERS", "8"))
+SOURCE_LINK_TIMEOUT = float(os.environ.get("SOURCE_LINK_TIMEOUT", "2"))
+# Manifest of the knowledge base documents titles and URLs, built at deploy time
+KB_MANIFEST_BUCKET = os.environ.get("KB_MANIFEST_BUCKET", "")
+KB_MANIFEST_KEY = os.environ.get("KB_MANIFEST_KEY", "")
+# Share of the requests logging all their trace events, the others only log a summary
+TRACE_LOG_SAMPLE_RATE = float(os.environ.get("TRACE_LOG_SAMPLE_RATE", "0"))
 
 log(f"Agent id: {AGENT_ID}")
 
 agent_client = boto3.client("bedrock-agent", region_name=REGION_NAME)
 agent_runtime_client = boto3.client(
     "bedrock-agent-runtime", region_name=REGION_NAME)
-s3_resource = boto3.resource("s3", region_name=REGION_NAME)
-
-
-def get_highest_agent_version_alias_id(response):
-    """
-    Find newest agent alias id.
-
-    Args:
-        response (dict): Response from list_agent_aliases().
-
-    Returns:
-        str: Agent alias ID of the newest agent version.
-    """
-    # Initialize highest version info
-    highest_version = None
-    highest_version_alias_id = None
-
-    # Iterate through the agentAliasSummaries
-    for alias_summary in response.get("agentAliasSummaries", []):
-        # Assuming each alias has one routingConfiguration
-        if alias_summary["routingConfiguration"]:
-            agent_version = alias_summary["routingConfiguration"][0]["agentVersion"]
-            # Check if the version is numeric and higher than the current highest
-            if agent_version.isdigit() and (
-                highest_version is None or int(agent_version) > highest_version
-            ):
-                highest_version = int(agent_version)
-                highest_version_alias_id = alias_summary["agentAliasId"]
-
-    # Return the highest version alias ID or None if not found
-    return highest_version_alias_id
+# one pooled client shared by the reference fetches
+s3_client = boto3.client(
+    "s3",
+    region_name=REGION_NAME,
+    config=Config(max_pool_connections=SOURCE_LINK_MAX_WORKERS),
+)
+# not shut down between invocations, so fetches missing the time budget do not
+# hold the answer back
+source_link_executor = ThreadPoolExecutor(max_workers=SOURCE_LINK_MAX_WORKERS)
+document_references = DocumentReferences(
+    s3_client,
+    manifest=(
+        load_manifest(s3_client, KB_MANIFEST_BUCKET, KB_MANIFEST_KEY)
+        if KB_MANIFEST_BUCKET and KB_MANIFEST_KEY
+        else None
+    ),
+    manifest_bucket=KB_MANIFEST_BUCKET or None,
+)
+alias_resolver = AgentAliasResolver(
+    agent_client,
+    ttl=AGENT_ALIAS_TTL,
+    refresh_margin=AGENT_ALIAS_REFRESH_MARGIN,
+    pinned_aliases={AGENT_ID: AGENT_ALIAS_ID} if AGENT_ALIAS_ID else None,
+)
 
 
 def invoke_agent(user_input, session_id):
     """
     Get response from Agent
     """
-    response = agent_client.list_agent_aliases(agentId=AGENT_ID)
-
-    log(f"list_agent_aliases: {response}")
-    agent_alias_id = get_highest_agent_version_alias_id(response)
+    agent_alias_id = alias_resolver.resolve(AGENT_ID)
+    log(f"Agent alias id: {agent_alias_id}, resolver: {alias_resolver.stats()}")
     if not agent_alias_id:
         return "No agent published alias found - cannot invoke agent"
     streaming_response = agent_runtime_client.invoke_agent(
         agentId=AGENT_ID,
         agentAliasId=agent_alias_id,
         sessionId=session_id,
+        # the sources of the answer are read from the traces
         enableTrace=True,
         inputText=user_input,
     )
@@ -75,64 +87,80 @@ def invoke_agent(user_input, session_id):
     return streaming_response
 
 
-def get_agent_response(response):
-    log(f"Getting agent response... {response}")
-    if "completion" not in response:
-        return f"No completion found in response: {response}"
-    trace_list = []
-    for event in response["completion"]:
-        log(f"Event keys: {event.keys()}")
-        if "trace" in event:
-            log(event["trace"])
-            trace_list.append(event["trace"])
-
-        # Extract the traces
-        if "chunk" in event:
-            # Extract the bytes from the chunk
-            chunk_bytes = event["chunk"]["bytes"]
-
-            # Convert bytes to string, assuming UTF-8 encoding
-            chunk_text = chunk_bytes.decode("utf-8")
-
-            # Print the response text
-            print("Response from the agent:", chunk_text)
-    sql_query_from_llm = None
-    for t in trace_list:
-        if "orchestrationTrace" in t["trace"].keys():
-            if "observation" in t["trace"]["orchestrationTrace"].keys():
-                obs = t["trace"]["orchestrationTrace"]["observation"]
-                if obs["type"] == "ACTION_GROUP":
-                    sql_query_from_llm = extract_sql_query(
-                        obs["actionGroupInvocationOutput"]["text"]
-                    )
-    if sql_query_from_llm:
-        source_file_list = sql_query_from_llm
-    else:
-        try:
-            source_file_list = extract_source_list_from_kb(trace_list)
-        except Exception as e:
-            log(f"Error extracting source list from KB: {e}")
-            source_file_list = ""
-    return chunk_text, source_file_list
+def get_source(trace_processor):
+    """
+    Gets the source of an agent answer from its traces.
 
+    Args:
+        trace_processor (TraceProcessor): Processor of the invocation traces.
 
-def extract_source_list_from_kb(trace_list):
+    Returns:
+        str: The SQL query of an action group answer, or the markdown list of
+            the knowledge base documents.
     """
-    Extract the knowledge base lookup output from the trace list and return the S3 bucket paths.
+    if trace_processor.sql_query:
+        return trace_processor.sql_query
+    if trace_processor.kb_references is None:
+        log("No knowledge base references in the traces")
+        return ""
+    return source_link(trace_processor.kb_references)
+
+
+def stream_agent_response(user_input, session_id):
     """
-    for trace in trace_list:
-        if  'orchestrationTrace' in trace['trace'].keys() and 'observation' in trace['trace']['orchestrationTrace'].keys():
-            if 'knowledgeBaseLookupOutput' in trace['trace']['orchestrationTrace']['observation']:
-                ref_list = trace['trace']['orchestrationTrace']['observation']['knowledgeBaseLookupOutput']['retrievedReferences']
-    log(f"ref_list: {ref_list}")
-    ref_s3_list = []
-    for rl in ref_list:
-        ref_s3_list.append(rl['location']['s3Location']['uri'])
-    
-    return ref_s3_list
-
-
-def source_link(input_source_list):
+    Answers a question with the agent, chunk by chunk.
+
+    Yields {"chunk": str} for every answer chunk as the agent streams it, then
+    {"answer": str, "source": str, "latency": dict} with the whole answer, its
+    source, and the time to first token and total time in seconds.
+
+    Args:
+        user_input (str): User question.
+        session_id (str): Chat session id.
+
+    Returns:
+        generator: Answer frames.
+    """
+    start = time.perf_counter()
+    response = invoke_agent(user_input, session_id)
+    latency = {"time_to_first_token": None}
+    answer = ""
+    trace_processor = TraceProcessor(TRACE_LOG_SAMPLE_RATE)
+    if isinstance(response, dict) and "completion" in response:
+        # a multi-byte character can be split across two chunks
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for event in response["completion"]:
+            if "trace" in event:
+                trace_processor.process(event["trace"])
+            if "chunk" in event:
+                chunk_text = decoder.decode(event["chunk"]["bytes"])
+                if not chunk_text:
+                    continue
+                if latency["time_to_first_token"] is None:
+                    latency["time_to_first_token"] = round(
+                        time.perf_counter() - start, 4
+                    )
+                answer += chunk_text
+                yield {"chunk": chunk_text}
+        chunk_text = decoder.decode(b"", final=True)
+        if chunk_text:
+            answer += chunk_text
+            yield {"chunk": chunk_text}
+    else:
+        answer = (
+            response
+            if isinstance(response, str)
+            else f"No completion found in response: {response}"
+        )
+        yield {"chunk": answer}
+    log(f"Trace summary: {json.dumps(trace_processor.summary())}")
+    source = get_source(trace_processor)
+    latency["total"] = round(time.perf_counter() - start, 4)
+    log(f"Agent latency: {json.dumps(latency)}")
+    yield {"answer": answer, "source": source, "latency": latency}
+
+
+def source_link(input_source_list, timeout=SOURCE_LINK_TIMEOUT):
     """
     Retrieves and formats the source URLs and titles of relevant documents from a given list of S3 bucket paths.
 
@@ -140,24 +168,51 @@ def source_link(input_source_list):
     the content of these objects assuming they are JSON files containing 'Url' and 'Topic' keys. It then formats these
     into a markdown-style numbered list of references with clickable links.
 
+    The titles and URLs are taken from the document manifest when it covers the documents. The other documents are
+    read once per path, concurrently, and the ones not read within the time budget, or failing to be read, are left out
+    of the list rather than delaying the answer.
+
     Parameters:
     - input_source_list (list of str): A list containing S3 bucket paths to the relevant documents.
+    - timeout (float): Seconds the documents may take to be read.
 
     Returns:
     - str: A string representing a markdown-formatted numbered list of document titles linked to their source URLs.
     """
-    source_dict_list = []
-    for i, input_source in enumerate(input_source_list):
-        string = input_source.split("//")[1]
-        bucket = string.partition("/")[0]
-        obj = string.partition("/")[2]
-        file = s3_resource.Object(bucket, obj)
-        body = file.get()["Body"].read()
-        res = json.loads(body)
-        source_link_url = res["Url"]
-        source_title = res["Topic"]
-        source_dict = (source_title, source_link_url)
-        source_dict_list.append(source_dict)
+    # chunks of the same document share its path
+    unique_paths = list(dict.fromkeys(input_source_list))
+    references = {}
+    for input_source in unique_paths:
+        reference = document_references.lookup(input_source)
+        if reference is not None:
+            references[input_source] = reference
+    futures = {
+        input_source: source_link_executor.submit(
+            document_references.read, input_source
+        )
+        for input_source in unique_paths
+        if input_source not in references
+    }
+    if futures:
+        done, not_done = wait(futures.values(), timeout=timeout)
+        if not_done:
+            log(f"{len(not_done)} of {len(futures)} references missed the time budget")
+        for future in not_done:
+            future.cancel()
+        for input_source, future in futures.items():
+            if future not in done:
+                continue
+            try:
+                references[input_source] = future.result()
+            except Exception as e:
+                log(f"Error reading reference {input_source}: {e}")
+    log(f"References: {document_references.stats()}")
+
+    source_dict_list = [
+        references[input_source]
+        for input_source in unique_paths
+        if input_source in references
+    ]
 
     # get the unique sources
     unique_sources = list(OrderedDict.fromkeys(source_dict_list))
@@ -169,54 +224,22 @@ def source_link(input_source_list):
     return refs_str
 
 
-def extract_sql_query(input_string):
-    """
-    Extracts the SQL query from a given input string.
-
-    This function takes an input string, searches for a SQL query in it, and returns the extracted query. It
-    assumes the SQL query is the first string that starts with "SELECT" and ends with a non-SQL keyword.
-
-
-    example input: "\n Source: SELECT instance_type, price_per_hour \nFROM training_price\nWHERE instance_type = 'ml.m5.xlarge'\n Returned information: According to the latest information, the ml.m5.xlarge instance type costs '$0.23' per hour for training.\n\n"
-
-    Parameters:
-    - input_string (str): The input string to search for a SQL query.
-
-    Returns:
-    - str: The extracted SQL query, or None if no SQL query is found.
-    """
-
-    pattern = r"(SELECT.*?)(?=\n\s*(?:Returned information|$))"
-
-    # Search for the pattern in the input string using DOTALL flag to match across multiple lines
-    match = re.search(pattern, input_string, re.DOTALL | re.IGNORECASE)
-
-    # If a match is found, return the matched string, otherwise return None
-    if match:
-        return match.group(
-            1
-        ).strip()  # Use strip() to remove leading/trailing whitespace
-    else:
-        return None
-
-
 def lambda_handler(event, context):
     """
     Lambda handler to answer user's question
+
+    The managed Python runtime cannot stream the response, so the handler
+    returns the whole answer, with its "latency". In-process callers stream
+    the answer with stream_agent_response.
     """
     log("Event:")
     log(json.dumps(event))
 
     body = event["body"]
 
-    streaming_response = invoke_agent(body["query"], body["session_id"])
-    response, source_file_list = get_agent_response(streaming_response)
-    if isinstance(source_file_list, list):
-        reference_str = source_link(source_file_list)
-    else:
-        reference_str = source_file_list
-    print(f"reference_str: {reference_str}")
-
-    output = {"answer": response, "source": reference_str}
+    for frame in stream_agent_response(body["query"], body["session_id"]):
+        if "chunk" not in frame:
+            output = frame
+    print(f"reference_str: {output['source']}")
 
     return output
@@ -0,0 +1,116 @@
+"""
+trace_processor.py
+
+Single pass processing of the trace events of an agent invocation.
+
+The events are processed as the agent streams them: the processor keeps the SQL
+query of the last action group answer and the references of the last
+knowledge base lookup, which are the sources of the answer, and counts the
+events into a compact summary logged once per request. Nothing else of the
+events is kept. The events themselves are only logged for the requests sampled
+with the log sample rate.
+"""
+
+import json
+import logging
+import random
+import re
+from collections import Counter
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def extract_sql_query(input_string):
+    """
+    Extracts the SQL query from a given input string.
+
+    This function takes an input string, searches for a SQL query in it, and returns the extracted query. It
+    assumes the SQL query is the first string that starts with "SELECT" and ends with a non-SQL keyword.
+
+
+    example input: "\n Source: SELECT instance_type, price_per_hour \nFROM training_price\nWHERE instance_type = 'ml.m5.xlarge'\n Returned information: According to the latest information, the ml.m5.xlarge instance type costs '$0.23' per hour for training.\n\n"
+
+    Parameters:
+    - input_string (str): The input string to search for a SQL query.
+
+    Returns:
+    - str: The extracted SQL query, or None if no SQL query is found.
+    """
+
+    pattern = r"(SELECT.*?)(?=\n\s*(?:Returned information|$))"
+
+    # Search for the pattern in the input string using DOTALL flag to match across multiple lines
+    match = re.search(pattern, input_string, re.DOTALL | re.IGNORECASE)
+
+    # If a match is found, return the matched string, otherwise return None
+    if match:
+        return match.group(
+            1
+        ).strip()  # Use strip() to remove leading/trailing whitespace
+    else:
+        return None
+
+
+class TraceProcessor:
+    """
+    Extracts the sources of an agent answer from its trace events.
+
+    Args:
+        log_sample_rate (float): Share of the requests logging every trace
+            event, from 0 to 1.
+    """
+
+    def __init__(self, log_sample_rate=0.0):
+        self.log_traces = random.random() < log_sample_rate
+        self.sql_query = None
+        self.kb_references = None
+        self._events = 0
+        self._trace_types = Counter()
+        self._observations = Counter()
+        self._failure = None
+
+    def process(self, trace_event):
+        """
+        Processes a trace event of the agent completion stream.
+
+        Args:
+            trace_event (dict): The "trace" member of a completion event.
+        """
+        self._events += 1
+        if self.log_traces:
+            logger.info(json.dumps(trace_event, default=str))
+        trace = trace_event.get("trace", {})
+        self._trace_types.update(trace.keys())
+        if "failureTrace" in trace:
+            self._failure = trace["failureTrace"].get("failureReason")
+        observation = trace.get("orchestrationTrace", {}).get("observation")
+        if observation is None:
+            return
+        self._observations[observation.get("type")] += 1
+        if observation.get("type") == "ACTION_GROUP":
+            self.sql_query = extract_sql_query(
+                observation["actionGroupInvocationOutput"]["text"]
+            )
+        if "knowledgeBaseLookupOutput" in observation:
+            self.kb_references = [
+                reference["location"]["s3Location"]["uri"]
+                for reference in observation["knowledgeBaseLookupOutput"][
+                    "retrievedReferences"
+                ]
+            ]
+
+    def summary(self):
+        """Counts of the trace events, and the sources found."""
+        summary = {
+            "events": self._events,
+            "trace_types": dict(self._trace_types),
+            "observations": dict(self._observations),
+            "sql_query": self.sql_query is not None,
+            "kb_references": len(self.kb_references or []),
+            "logged": self.log_traces,
+        }
+        if self._failure is not None:
+            summary["failure"] = self._failure
+        return summary
@@ -146,6 +146,14 @@ aws secretsmanager create-secret \
 
 echo -e "${GREEN}✓ Slack credentials stored in AWS Secrets Manager${NC}"
 
+# Precompute few-shot embeddings for the action Lambda image
+print_section "Precomputing Few-shot Embeddings"
+if (cd code/lambdas/action-lambda && python3 few_shot_artifact.py --region $AWS_REGION); then
+    echo -e "${GREEN}✓ Few-shot embedding artifact built${NC}"
+else
+    echo -e "${YELLOW}! Could not build the few-shot embedding artifact.${NC} The action Lambda will embed examples on cold start."
+fi
+
 # CDK Deployment
 print_section "Deploying AWS CDK Stacks"
 echo "This will deploy the following stacks:"